@@ -1,43 +1,239 @@
+# backend/backend/middleware/jwt_auth.py
+"""
+Authenticates websocket connections from the `?token=` access token.
+
+The token is decoded once (signature, expiry and token type; access tokens are not
+checked against the blacklist, so this needs no database). The user behind it
+becomes a WebSocketUser, which only carries what the consumers use (id and
+username), taken from a per-process cache that keeps each user for
+WS_AUTH_USER_CACHE_TTL seconds. Cache misses are loaded in batches, one query for
+every connection waiting at that moment, so a reconnect storm after a deploy costs
+a few queries instead of one blocking query per socket. Users that don't exist or
+are inactive are cached too and connect as AnonymousUser; deactivating a user takes
+up to the TTL to apply to new connections.
+
+Connects, cache hits and auth latency are reported as the `ws_auth` metrics.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
 from urllib.parse import parse_qs
+
 from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
-from rest_framework_simplejwt.tokens import UntypedToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from marketdata import metrics
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
-class JWTAuthMiddleware:
-    def __init__(self, inner):
-        self.inner = inner
 
-    async def __call__(self, scope, receive, send):
-        query_string = parse_qs(scope.get("query_string", b"").decode())
-        token = query_string.get("token", [None])[0]
+class WebSocketUser:
+    """The authenticated user of a websocket connection, without a model instance."""
 
-        scope["user"] = AnonymousUser()
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
 
-        if token:
-            try:
-                UntypedToken(token)  # validate token
-                user = await self.get_user_from_token(token)
-                if user:
-                    scope["user"] = user
-            except (InvalidToken, TokenError):
-                pass
+    def __init__(self, id, username):
+        self.id = self.pk = id
+        self.username = username
+
+    def __str__(self):
+        return self.username
+
+    def __repr__(self):
+        return f"<WebSocketUser {self.id} {self.username}>"
+
+
+@database_sync_to_async
+def load_users(user_ids):
+    """{user_id (str): WebSocketUser} of the active users among `user_ids`, in one query."""
+    rows = User.objects.filter(
+        **{f"{api_settings.USER_ID_FIELD}__in": user_ids, "is_active": True}
+    ).values_list(api_settings.USER_ID_FIELD, "id", "username")
+    return {str(key): WebSocketUser(id, username) for key, id, username in rows}
+
+
+class UserCache:
+    def __init__(self, ttl=30.0, max_size=100000, load=load_users):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.load = load
+
+        self._entries = {}    # user_id -> (expires_at, WebSocketUser or None)
+        self._pending = {}    # user_id -> future of the connections waiting for it
+        self._loader = None
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+
+    async def get(self, user_id, now=None):
+        """The WebSocketUser of `user_id`, or None when it doesn't exist or is inactive."""
+        now = now if now is not None else time.monotonic()
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > now:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        future = self._pending.get(user_id)
+        if future is None:
+            future = self._pending[user_id] = asyncio.get_running_loop().create_future()
+            if self._loader is None:
+                self._loader = asyncio.ensure_future(self._load_pending())
+        # Shielded: a connection that goes away must not cancel the load for the others
+        return await asyncio.shield(future)
+
+    async def _load_pending(self):
+        # One query at a time: misses arriving while it runs wait for the next batch
+        try:
+            while self._pending:
+                await asyncio.sleep(0)  # let connections accepted in the same loop pass join
+                batch, self._pending = self._pending, {}
+                try:
+                    users = await self.load(list(batch))
+                except Exception as e:
+                    for future in batch.values():
+                        if not future.done():
+                            future.set_exception(e)
+                            # Mark it retrieved: every waiter may have gone away already
+                            future.exception()
+                    continue
+                self.queries += 1
+                self._evict(time.monotonic())
+                expires_at = time.monotonic() + self.ttl
+                for user_id, future in batch.items():
+                    user = users.get(user_id)
+                    self._entries[user_id] = (expires_at, user)
+                    if not future.done():
+                        future.set_result(user)
+        finally:
+            self._loader = None
 
-        # ✅ Pass scope, receive, and send properly
+    def _evict(self, now):
+        if len(self._entries) < self.max_size:
+            return
+        self._entries = {key: entry for key, entry in self._entries.items() if entry[0] > now}
+        if len(self._entries) >= self.max_size:
+            self._entries.clear()
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "ttl": self.ttl,
+            "cached_users": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "queries": self.queries,
+        }
+
+
+def _percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class AuthStats:
+    """Connects per second over the last RATE_WINDOW seconds and auth latency of recent connects."""
+
+    RATE_WINDOW = 10.0
+
+    def __init__(self, samples=1000):
+        self._connected_at = deque()
+        self._latencies = deque(maxlen=samples)
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.authenticated = 0
+        self.invalid_tokens = 0
+        self.unknown_users = 0
+        self.errors = 0
+
+    def record(self, outcome, seconds, now=None):
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            self.connects += 1
+            if outcome == "authenticated":
+                self.authenticated += 1
+            elif outcome == "invalid_token":
+                self.invalid_tokens += 1
+            elif outcome == "unknown_user":
+                self.unknown_users += 1
+            elif outcome == "error":
+                self.errors += 1
+            self._latencies.append(seconds)
+            self._connected_at.append(now)
+            self._expire(now)
+
+    def connect_rate(self, now=None):
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            self._expire(now)
+            return len(self._connected_at) / self.RATE_WINDOW
+
+    def _expire(self, now):
+        while self._connected_at and now - self._connected_at[0] > self.RATE_WINDOW:
+            self._connected_at.popleft()
+
+    def stats(self):
+        rate = self.connect_rate()
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                "connects": self.connects,
+                "authenticated": self.authenticated,
+                "invalid_tokens": self.invalid_tokens,
+                "unknown_users": self.unknown_users,
+                "errors": self.errors,
+                "connects_per_second": round(rate, 2),
+                "avg_auth_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+                "p99_auth_ms": round(_percentile(latencies, 99) * 1000, 3) if latencies else 0.0,
+            }
+
+
+class JWTAuthMiddleware:
+    def __init__(self, inner, user_cache=None, auth_stats=None):
+        self.inner = inner
+        self.user_cache = user_cache or UserCache(ttl=settings.WS_AUTH_USER_CACHE_TTL)
+        self.auth_stats = auth_stats or AuthStats()
+        metrics.register("ws_auth", self.stats)
+
+    async def __call__(self, scope, receive, send):
+        started = time.perf_counter()
+        scope["user"], outcome = await self.authenticate(scope)
+        self.auth_stats.record(outcome, time.perf_counter() - started)
         return await self.inner(scope, receive, send)
 
-    @database_sync_to_async
-    def get_user_from_token(self, token):
+    async def authenticate(self, scope):
+        """(user, outcome) of the connection's `?token=` access token."""
+        query_string = parse_qs(scope.get("query_string", b"").decode())
+        token = query_string.get("token", [None])[0]
+        if not token:
+            return AnonymousUser(), "anonymous"
         try:
-            from rest_framework_simplejwt.tokens import AccessToken
-            access_token = AccessToken(token)
-            user_id = access_token["user_id"]
-            return User.objects.get(id=user_id)
-        except Exception:
-            return None
+            user_id = AccessToken(token)[api_settings.USER_ID_CLAIM]
+        except (InvalidToken, TokenError, KeyError):
+            return AnonymousUser(), "invalid_token"
+        try:
+            user = await self.user_cache.get(str(user_id))
+        except Exception as e:
+            logger.warning(f"Websocket auth: could not load user {user_id}: {e}")
+            return AnonymousUser(), "error"
+        if user is None:
+            return AnonymousUser(), "unknown_user"
+        return user, "authenticated"
+
+    def stats(self):
+        return {**self.auth_stats.stats(), "user_cache": self.user_cache.stats()}
 
 
 def JWTAuthMiddlewareStack(inner):
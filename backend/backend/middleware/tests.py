@@ -0,0 +1,78 @@
+# backend/backend/middleware/tests.py
+import asyncio
+import gc
+
+from django.test import SimpleTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .jwt_auth import JWTAuthMiddleware, UserCache, WebSocketUser
+
+
+class WebsocketAuthTests(SimpleTestCase):
+    def setUp(self):
+        self.queries = []
+
+        async def load(user_ids):
+            self.queries.append(sorted(user_ids))
+            return {"7": WebSocketUser(7, "trader")} if "7" in user_ids else {}
+
+        self.cache = UserCache(ttl=30.0, load=load)
+
+    def token(self, user_id):
+        token = AccessToken()
+        token["user_id"] = user_id
+        return str(token)
+
+    def connect_all(self, query_strings):
+        scopes = []
+
+        async def inner(scope, receive, send):
+            scopes.append(scope)
+
+        middleware = JWTAuthMiddleware(inner, user_cache=self.cache)
+
+        async def scenario():
+            await asyncio.gather(*(
+                middleware({"type": "websocket", "query_string": qs.encode()}, None, None) for qs in query_strings
+            ))
+
+        asyncio.run(scenario())
+        return [scope["user"] for scope in scopes], middleware.stats()
+
+    def test_concurrent_connects_share_one_query_and_later_ones_hit_the_cache(self):
+        users, _ = self.connect_all([f"token={self.token(7)}"] * 50 + [f"token={self.token(8)}"])
+        self.assertEqual(self.queries, [["7", "8"]])
+        self.assertEqual({(u.is_anonymous, getattr(u, "id", None)) for u in users}, {(False, 7), (True, None)})
+
+        users, stats = self.connect_all([f"token={self.token(7)}", f"token={self.token(8)}"])
+        self.assertEqual(len(self.queries), 1)
+        self.assertEqual(sorted(u.username for u in users), ["", "trader"])
+        self.assertEqual(stats["user_cache"]["hits"], 2)
+
+    def test_missing_or_invalid_tokens_are_anonymous_without_a_query(self):
+        users, stats = self.connect_all(["", "token=not-a-jwt"])
+        self.assertTrue(all(u.is_anonymous for u in users))
+        self.assertEqual(self.queries, [])
+        self.assertEqual((stats["connects"], stats["invalid_tokens"]), (2, 1))
+        self.assertGreater(stats["connects_per_second"], 0)
+
+    def test_failed_load_connects_as_anonymous_and_leaves_no_unretrieved_errors(self):
+        async def load(user_ids):
+            await asyncio.sleep(0.01)
+            raise ConnectionError("database unavailable")
+
+        self.cache = UserCache(ttl=30.0, load=load)
+        users, stats = self.connect_all([f"token={self.token(7)}"] * 3)
+        self.assertTrue(all(u.is_anonymous for u in users))
+        self.assertEqual(stats["errors"], 3)
+
+        async def abandoned():
+            # The only connection waiting for the load goes away before it fails
+            waiter = asyncio.create_task(self.cache.get("9"))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.sleep(0.05)
+
+        with self.assertNoLogs("asyncio", level="ERROR"):
+            asyncio.run(abandoned())
+            gc.collect()
@@ -221,6 +221,140 @@ else:
 
 MONGO_DB_URL= config("MONGO_DB_URL", default="mongodb://localhost:27017/")
 MONGO_DB_NAME = config("MONGO_DB_NAME", default="quantnest")
+# Shared by the pymongo and Motor clients (see marketdata/mongo_client.client_options)
+MONGO_MAX_POOL_SIZE = config("MONGO_MAX_POOL_SIZE", default=100, cast=int)
+MONGO_MIN_POOL_SIZE = config("MONGO_MIN_POOL_SIZE", default=0, cast=int)
+MONGO_CONNECT_TIMEOUT_MS = config("MONGO_CONNECT_TIMEOUT_MS", default=20000, cast=int)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = config("MONGO_SERVER_SELECTION_TIMEOUT_MS", default=30000, cast=int)
+# 0 = no socket timeout
+MONGO_SOCKET_TIMEOUT_MS = config("MONGO_SOCKET_TIMEOUT_MS", default=0, cast=int)
+# Wire compression in order of preference, e.g. "zstd,snappy,zlib" (zstd needs pymongo[zstd],
+# snappy needs python-snappy); empty = uncompressed
+MONGO_COMPRESSORS = config("MONGO_COMPRESSORS", default="", cast=Csv())
+# primary, primaryPreferred, secondary, secondaryPreferred or nearest
+MONGO_READ_PREFERENCE = config("MONGO_READ_PREFERENCE", default="primary")
+
+# Buffered tick writer used by fyers_ingest (see marketdata/tick_writer.py)
+TICK_WRITER_MAX_QUEUE = config("TICK_WRITER_MAX_QUEUE", default=50000, cast=int)
+TICK_WRITER_BATCH_SIZE = config("TICK_WRITER_BATCH_SIZE", default=1000, cast=int)
+TICK_WRITER_FLUSH_INTERVAL = config("TICK_WRITER_FLUSH_INTERVAL", default=0.5, cast=float)
+# Seconds submit() may block when the queue is full before dropping the tick (0 = drop immediately)
+TICK_WRITER_PUT_TIMEOUT = config("TICK_WRITER_PUT_TIMEOUT", default=0.0, cast=float)
+TICK_WRITER_STATS_INTERVAL = config("TICK_WRITER_STATS_INTERVAL", default=60, cast=int)
+
+# "documents" (one document per tick in `ticks`) or "buckets" (per-minute array buckets
+# in `tick_buckets`, see marketdata/tick_store.py)
+TICK_STORAGE_MODE = config("TICK_STORAGE_MODE", default="documents")
+TICK_BUCKET_MAX_COUNT = config("TICK_BUCKET_MAX_COUNT", default=1000, cast=int)
+
+# Live 1m candles built from ticks (see marketdata/candle_builder.py)
+CANDLE_BUILDER_CLOSE_DELAY = config("CANDLE_BUILDER_CLOSE_DELAY", default=2.0, cast=float)
+CANDLE_BUILDER_CHECKPOINT_INTERVAL = config("CANDLE_BUILDER_CHECKPOINT_INTERVAL", default=5.0, cast=float)
+# fetch_candles now only reconciles the live bars against the REST history API
+FETCH_CANDLES_INTERVAL_MINUTES = config("FETCH_CANDLES_INTERVAL_MINUTES", default=5, cast=int)
+FETCH_CANDLES_WORKERS = config("FETCH_CANDLES_WORKERS", default=10, cast=int)
+
+# Fyers REST API rate limits (10 req/s, 200 req/min), shared by all REST callers in the process
+FYERS_API_RATE_PER_SECOND = config("FYERS_API_RATE_PER_SECOND", default=10, cast=int)
+FYERS_API_RATE_PER_MINUTE = config("FYERS_API_RATE_PER_MINUTE", default=200, cast=int)
+
+# Upper bound on the `limit` parameter of the OHLC endpoint
+OHLC_MAX_LIMIT = config("OHLC_MAX_LIMIT", default=5000, cast=int)
+
+# Serve ohlc, latest-tick and quotes from the async Motor views (marketdata/async_views.py);
+# worthwhile under an ASGI server such as Daphne
+MARKETDATA_ASYNC_VIEWS = config("MARKETDATA_ASYNC_VIEWS", default=False, cast=bool)
+
+# Upper bound on the number of symbols of one /market/quotes/ request
+QUOTES_MAX_INSTRUMENTS = config("QUOTES_MAX_INSTRUMENTS", default=500, cast=int)
+
+# Shared cache (Redis when REDIS_URL is set, otherwise per-process memory)
+REDIS_URL = config("REDIS_URL", default="")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Channel layer shared by the ASGI workers and the broadcaster: Redis pub/sub when
+# CHANNEL_LAYER_URL (default REDIS_URL) is set, so websockets can be spread over several
+# Daphne/Uvicorn processes; otherwise the in-memory layer above (one process only)
+CHANNEL_LAYER_URL = config("CHANNEL_LAYER_URL", default=REDIS_URL)
+if CHANNEL_LAYER_URL:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+            "CONFIG": {"hosts": [CHANNEL_LAYER_URL]},
+        }
+    }
+
+# Seconds between the metrics snapshots each process publishes to REDIS_URL, so the admin
+# metrics endpoint shows every process of a multi-process deployment (0 disables; see
+# marketdata/metrics.py)
+METRICS_PUBLISH_INTERVAL = config("METRICS_PUBLISH_INTERVAL", default=5.0, cast=float)
+
+# Background loops the marketdata and trading apps start in threads from ready(). Set it to
+# an empty value in ASGI workers and run each loop as its own management command instead
+# when serving from several processes (see "Deployment Notes" in the README)
+BACKGROUND_SERVICES = config(
+    "BACKGROUND_SERVICES",
+    default="fyers_ingest,fetch_candles,replay_broadcaster,order_executor",
+    cast=Csv(),
+)
+
+# Delayed broadcaster source: "feed" (ticks pushed by the ingest pipeline, in-process or via a
+# Redis stream when REDIS_URL is set; see marketdata/tick_feed.py) or "poll" (re-read Mongo every second)
+BROADCAST_SOURCE = config("BROADCAST_SOURCE", default="feed")
+# Upper bound on ticks waiting out the delay in the broadcaster (about 15 minutes of the feed)
+BROADCAST_DELAY_QUEUE_MAX = config("BROADCAST_DELAY_QUEUE_MAX", default=500000, cast=int)
+# Conflation: at most this many broadcast messages per instrument per second, newest tick
+# winning with traded quantity and range accumulated (see marketdata/conflation.py); 0 = off
+BROADCAST_MAX_UPDATES_PER_SECOND = config("BROADCAST_MAX_UPDATES_PER_SECOND", default=4, cast=float)
+# Approximate cap on the Redis feed stream, in batches (one per pipeline flush)
+TICK_FEED_STREAM_MAXLEN = config("TICK_FEED_STREAM_MAXLEN", default=10000, cast=int)
+# Skip broadcasting ticks of instruments no websocket subscribes to (see marketdata/subscriptions.py)
+BROADCAST_SKIP_UNWATCHED = config("BROADCAST_SKIP_UNWATCHED", default=True, cast=bool)
+# How often the broadcaster re-reads the shared subscriber counts, in seconds
+SUBSCRIPTIONS_REFRESH_INTERVAL = config("SUBSCRIPTIONS_REFRESH_INTERVAL", default=1.0, cast=float)
+# Websocket tick batching, opted into per connection with `"batch": true` (or a window in ms)
+# on a subscribe message: ticks within the window are sent as one JSON array frame
+WS_BATCH_WINDOW_MS = config("WS_BATCH_WINDOW_MS", default=100, cast=int)
+# A batch is sent early once it holds this many ticks
+WS_BATCH_MAX_TICKS = config("WS_BATCH_MAX_TICKS", default=500, cast=int)
+# Compact stream (`"compact": true` on subscribe, see marketdata/tick_messages.py). Off by
+# default: the broadcaster then encodes no keyframes/deltas and `compact` is ignored
+WS_COMPACT_STREAM = config("WS_COMPACT_STREAM", default=False, cast=bool)
+# Seconds between the keyframes every compact client receives, so a client that missed a
+# delta resynchronizes
+WS_KEYFRAME_INTERVAL = config("WS_KEYFRAME_INTERVAL", default=5.0, cast=float)
+# Upper bound on the instruments of one subscribe_many/unsubscribe_many message
+WS_SUBSCRIBE_MAX_INSTRUMENTS = config("WS_SUBSCRIBE_MAX_INSTRUMENTS", default=500, cast=int)
+# Seconds a websocket worker keeps the user behind a token (see backend/middleware/jwt_auth.py);
+# a deactivated user can still open sockets on a worker for up to this long
+WS_AUTH_USER_CACHE_TTL = config("WS_AUTH_USER_CACHE_TTL", default=30.0, cast=float)
+
+# Latest-tick snapshots (see marketdata/snapshots.py): readers fall back to the ticks
+# collection when the shared snapshot heartbeat is older than this many seconds
+SNAPSHOT_STALE_AFTER = config("SNAPSHOT_STALE_AFTER", default=10.0, cast=float)
+
+# OHLC closed-bar cache (see marketdata/ohlc_cache.py)
+OHLC_CACHE_LRU_SIZE = config("OHLC_CACHE_LRU_SIZE", default=256, cast=int)
+OHLC_CACHE_MAX_BARS = config("OHLC_CACHE_MAX_BARS", default=20000, cast=int)
+OHLC_CACHE_TTL = config("OHLC_CACHE_TTL", default=3600, cast=int)
+
+# Live ingest universe: nifty100, nifty500, a symbols JSON path or a comma-separated list
+MARKETDATA_UNIVERSE = config("MARKETDATA_UNIVERSE", default="nifty100")
+# Symbols per Fyers socket; more than one shard runs each socket in its own process
+FYERS_WS_SYMBOLS_PER_SHARD = config("FYERS_WS_SYMBOLS_PER_SHARD", default=100, cast=int)
+FYERS_SHARD_QUEUE_SIZE = config("FYERS_SHARD_QUEUE_SIZE", default=1000, cast=int)
 
 cloudinary.config(
     cloud_name=config("CLOUDINARY_CLOUD_NAME"),
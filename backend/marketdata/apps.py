@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.conf import settings
 from django.core.management import call_command
 import threading
 import logging
@@ -13,6 +14,7 @@ class MyAppConfig(AppConfig):
         """
         Run commands only once when the server starts.
         Using a thread so it doesn't block Daphne startup.
+        Only the commands listed in settings.BACKGROUND_SERVICES are started.
         """
         def run_startup_commands():
             try:
@@ -38,6 +40,10 @@ class MyAppConfig(AppConfig):
         # Prevent duplicate runs (e.g., autoreload in dev mode)
         if not hasattr(self, "already_ran"):
             self.already_ran = True
-            threading.Thread(target=run_startup_commands).start()
-            threading.Thread(target=run_startup_commands_1).start()
-            threading.Thread(target=run_startup_commands_2).start()
+            services = settings.BACKGROUND_SERVICES
+            if "fyers_ingest" in services:
+                threading.Thread(target=run_startup_commands).start()
+            if "fetch_candles" in services:
+                threading.Thread(target=run_startup_commands_1).start()
+            if "replay_broadcaster" in services:
+                threading.Thread(target=run_startup_commands_2).start()
@@ -0,0 +1,159 @@
+# backend/marketdata/async_views.py
+"""
+Async-native versions of the market-data read endpoints (ohlc, latest-tick, quotes),
+routed instead of the DRF views in marketdata/views.py when MARKETDATA_ASYNC_VIEWS
+is set.
+
+DRF function views are synchronous, so under Daphne every request holds a thread of
+the sync_to_async pool for its whole Mongo round trip. These views run their queries
+on the event loop's shared Motor client (mongo_client.get_async_db) instead. The
+access checks are the same DRF authentication, permission and throttle classes, run
+in one short thread hop because authentication reads the user from the database.
+The snapshot store and the OHLC cache are Redis-backed with blocking clients, so
+their reads also run in a worker thread (thread_sensitive=False, as the websocket
+consumer does): a slow or unreachable Redis then holds one thread, not the event
+loop and every websocket on it. Responses are built by the same helpers as the sync
+views and are identical.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from bson import json_util
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from trading.models import Instrument
+
+from . import ohlc, tick_store
+from .mongo_client import get_async_db
+from .ohlc_cache import series_version, stored_bars_async
+from .quotes import delayed_quotes_async, parse_symbols
+from .renderers import OHLC_RENDERERS
+from .snapshots import get_snapshot_store
+
+
+def _check_access(view, request):
+    """Run the view's DRF policies; returns an error response, or None when the request may proceed."""
+    try:
+        view.initial(request)
+        return None
+    except Exception as exc:
+        return view.finalize_response(request, view.handle_exception(exc)).render()
+
+
+async def _drf_request(http_request, permission_classes, renderer_classes=None):
+    """
+    (request, view, error response): the DRF request wrapper with authentication,
+    permissions, throttling and content negotiation done exactly as APIView would.
+    """
+    view = APIView()
+    view.permission_classes = permission_classes
+    if renderer_classes is not None:
+        view.renderer_classes = renderer_classes
+    view.args, view.kwargs = (), {}
+    view.headers = view.default_response_headers
+    request = view.initialize_request(http_request)
+    view.request = request
+    error = await sync_to_async(_check_access)(view, request)
+    return request, view, error
+
+
+def _render(view, request, response):
+    return view.finalize_response(request, response).render()
+
+
+def _snapshot_tick(instrument):
+    snapshots = get_snapshot_store()
+    return snapshots.latest(instrument) if snapshots.available() else None
+
+
+async def latest_tick_data(http_request):
+    request, view, error = await _drf_request(http_request, [IsAuthenticated])
+    if error is not None:
+        return error
+
+    symbol = request.query_params.get('instrument')
+    if not symbol:
+        return JsonResponse({"error": "Instrument symbol is required"}, status=400)
+
+    instrument_symbol = f"NSE:{symbol.upper()}-EQ"
+    latest_tick = await sync_to_async(_snapshot_tick, thread_sensitive=False)(instrument_symbol)
+    if latest_tick is None:
+        latest_tick = await tick_store.latest_tick_async(get_async_db(), instrument_symbol)
+    if latest_tick:
+        return JsonResponse(json.loads(json_util.dumps(latest_tick)))
+    return JsonResponse({"error": "No data found for this instrument"}, status=404)
+
+
+async def quotes(http_request):
+    request, view, error = await _drf_request(http_request, [IsAuthenticated])
+    if error is not None:
+        return error
+
+    if request.query_params.get('watchlist') == 'me':
+        symbols = [
+            symbol async for symbol in
+            Instrument.objects.filter(watchlists__user=request.user)
+            .order_by('symbol')
+            .values_list('symbol', flat=True)[:settings.QUOTES_MAX_INSTRUMENTS]
+        ]
+        if not symbols:
+            return JsonResponse({"quotes": {}, "missing": []})
+    else:
+        try:
+            symbols = parse_symbols(request.query_params.get('instruments'), settings.QUOTES_MAX_INSTRUMENTS)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+    found = await delayed_quotes_async(symbols, get_async_db())
+    return JsonResponse({
+        "quotes": json.loads(json_util.dumps(found)),
+        "missing": [symbol for symbol in symbols if symbol not in found],
+    })
+
+
+async def ohlc_data(http_request):
+    """Same contract as views.ohlc_data."""
+    request, view, error = await _drf_request(http_request, [AllowAny], OHLC_RENDERERS)
+    if error is not None:
+        return error
+
+    try:
+        query = ohlc.parse_ohlc_params(request.query_params)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    version = await sync_to_async(series_version, thread_sensitive=False)(
+        query, variant=request.accepted_renderer.format
+    )
+    if version:
+        etag, last_modified = version
+        not_modified = get_conditional_response(http_request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            not_modified["ETag"] = etag
+            patch_vary_headers(not_modified, ["Accept"])
+            return not_modified
+
+    db = get_async_db()
+    forming_start = ohlc.forming_bar_start(query)
+    stored = await stored_bars_async(query, db)
+    forming = ohlc.empty_columns()
+    if forming_start:
+        docs = await db.candles.aggregate(ohlc.forming_bar_pipeline(query, forming_start)).to_list(None)
+        forming = ohlc.shape_forming_bar(docs, forming_start)
+
+    columns, next_before = ohlc.page(query, stored, forming)
+    response = Response(columns)
+    patch_vary_headers(response, ["Accept"])
+    if next_before is not None:
+        response["X-Next-Before"] = str(next_before)
+    if version:
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(response, no_cache=True)
+    return _render(view, request, response)
@@ -0,0 +1,187 @@
+# backend/marketdata/candle_builder.py
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from . import metrics
+from .candles import candle_document, upsert_candles
+from .mongo_client import get_candles_collection
+
+logger = logging.getLogger(__name__)
+
+ONE_MINUTE = timedelta(minutes=1)
+
+
+def _minute_start(ts):
+    return ts.replace(second=0, microsecond=0)
+
+
+class CandleBuilder:
+    """
+    Incrementally folds ticks into per-instrument 1-minute OHLCV bars.
+
+    `add_tick()` is cheap and runs on the ingest thread. `flush()` runs on a timer: it
+    closes bars whose minute has ended (plus `close_delay` seconds of grace for late
+    ticks), upserts them into `candles`, and checkpoints the still-forming bars every
+    `checkpoint_interval` seconds so a restart can resume them via `seed()`.
+
+    Volume is the delta of the cumulative `volume_traded_today` between consecutive
+    ticks of an instrument. The first tick seen for an instrument (startup or a new
+    session, where the cumulative figure resets) contributes its `last_traded_qty`.
+    """
+
+    def __init__(self, close_delay=2.0, checkpoint_interval=5.0, name="candle_builder"):
+        self.close_delay = timedelta(seconds=close_delay)
+        self.checkpoint_interval = checkpoint_interval
+        self.name = name
+
+        self._bars = {}          # instrument -> forming bar dict
+        self._closed_minute = {} # instrument -> minute of the last bar closed
+        self._carry_volume = {}  # volume of late ticks that arrived with no bar to fold into
+        self._last_cum_volume = {}
+        self._closed = []
+        self._dirty = set()      # instruments whose forming bar changed since the last checkpoint
+        self._last_checkpoint = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.ticks = 0
+        self.late_ticks = 0
+        self.bars_closed = 0
+        self.bars_written = 0
+        self.write_errors = 0
+        self.last_flush_ms = 0.0
+
+    def seed(self, instruments, now=None):
+        """
+        Resume the bars of the current minute from what was last checkpointed, so a
+        restart mid-minute does not lose the open/high/low/volume seen before it.
+        """
+        now = now or datetime.now(timezone.utc)
+        current_minute = _minute_start(now)
+        stored = get_candles_collection().find(
+            {"instrument": {"$in": list(instruments)}, "resolution": "1m", "timestamp": current_minute},
+            {"_id": 0},
+        )
+        with self._lock:
+            for doc in stored:
+                self._bars[doc["instrument"]] = {
+                    "minute": current_minute,
+                    "open": doc["open"],
+                    "high": doc["high"],
+                    "low": doc["low"],
+                    "close": doc["close"],
+                    "volume": doc.get("volume") or 0,
+                }
+        metrics.register(self.name, self.stats)
+        return len(self._bars)
+
+    def add_tick(self, tick):
+        """Fold one tick document (as stored in `ticks`) into its instrument's bar."""
+        instrument = tick.get("instrument")
+        price = tick.get("price")
+        timestamp = tick.get("timestamp")
+        if not instrument or price is None or timestamp is None:
+            return
+
+        minute = _minute_start(timestamp)
+        cum_volume = tick.get("volume_traded_today")
+
+        with self._lock:
+            self.ticks += 1
+
+            previous = self._last_cum_volume.get(instrument)
+            if cum_volume is not None:
+                self._last_cum_volume[instrument] = cum_volume
+            if previous is None or cum_volume is None or cum_volume < previous:
+                volume = tick.get("last_traded_qty") or 0
+            else:
+                volume = cum_volume - previous
+
+            bar = self._bars.get(instrument)
+            if bar is not None and minute > bar["minute"]:
+                self._close(instrument)
+                bar = None
+
+            closed_minute = self._closed_minute.get(instrument)
+            if (bar is not None and minute < bar["minute"]) or (closed_minute is not None and minute <= closed_minute):
+                # Late tick for a minute that is already closed: its trades still count
+                # towards volume, but it must not move (or reopen) any bar's prices.
+                self.late_ticks += 1
+                if bar is not None:
+                    bar["volume"] += volume
+                    self._dirty.add(instrument)
+                else:
+                    self._carry_volume[instrument] = self._carry_volume.get(instrument, 0) + volume
+                return
+
+            if bar is None:
+                self._bars[instrument] = {
+                    "minute": minute, "open": price, "high": price, "low": price,
+                    "close": price, "volume": volume + self._carry_volume.pop(instrument, 0),
+                }
+            else:
+                bar["high"] = max(bar["high"], price)
+                bar["low"] = min(bar["low"], price)
+                bar["close"] = price
+                bar["volume"] += volume
+            self._dirty.add(instrument)
+
+    def flush(self, now=None):
+        """Close due bars and write them (plus a periodic checkpoint of forming bars)."""
+        now = now or datetime.now(timezone.utc)
+        started = time.perf_counter()
+
+        with self._lock:
+            for instrument, bar in list(self._bars.items()):
+                if bar["minute"] + ONE_MINUTE + self.close_delay <= now:
+                    self._close(instrument)
+            closed = self._closed
+            self._closed = []
+            to_write = closed
+
+            if time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+                to_write = closed + [
+                    self._to_document(instrument, self._bars[instrument])
+                    for instrument in self._dirty if instrument in self._bars
+                ]
+                self._dirty.clear()
+                self._last_checkpoint = time.monotonic()
+
+        if to_write:
+            try:
+                upsert_candles(to_write)
+                self.bars_written += len(to_write)
+            except Exception as e:
+                self.write_errors += 1
+                logger.error(f"Failed to upsert {len(to_write)} live candles: {e}")
+                # Finished bars are retried on the next flush; checkpoints are simply redone.
+                with self._lock:
+                    self._closed = closed + self._closed
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        return len(to_write)
+
+    def stats(self):
+        return {
+            "forming_bars": len(self._bars),
+            "ticks": self.ticks,
+            "late_ticks": self.late_ticks,
+            "bars_closed": self.bars_closed,
+            "bars_written": self.bars_written,
+            "write_errors": self.write_errors,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
+
+    def _close(self, instrument):
+        # Caller holds self._lock.
+        bar = self._bars.pop(instrument)
+        self._closed_minute[instrument] = bar["minute"]
+        self._dirty.discard(instrument)
+        self._closed.append(self._to_document(instrument, bar))
+        self.bars_closed += 1
+
+    @staticmethod
+    def _to_document(instrument, bar):
+        return candle_document(
+            instrument, bar["minute"], bar["open"], bar["high"], bar["low"], bar["close"], bar["volume"]
+        )
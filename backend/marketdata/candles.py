@@ -0,0 +1,57 @@
+# backend/marketdata/candles.py
+import logging
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from .mongo_client import get_candles_collection
+from .ohlc_cache import invalidate_for_candles
+from .rollups import update_rollups_for_candles
+
+logger = logging.getLogger(__name__)
+
+
+def candle_document(instrument, timestamp, open_, high, low, close, volume, resolution="1m"):
+    """Build a candle document in the shape stored in the `candles` collection."""
+    if not isinstance(timestamp, datetime):
+        timestamp = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    return {
+        "instrument": instrument,
+        "timestamp": timestamp,
+        "resolution": resolution,
+        "open": open_,
+        "high": high,
+        "low": low,
+        "close": close,
+        "volume": volume,
+    }
+
+
+def upsert_candles(candles, collection=None):
+    """
+    Upsert candle documents keyed on (instrument, timestamp, resolution) in one bulk_write,
+    then refresh the rollup bars covering the written 1m candles and invalidate the
+    cached OHLC bars of their instruments. Returns the BulkWriteResult, or None when there was nothing to write.
+    """
+    if not candles:
+        return None
+    collection = collection if collection is not None else get_candles_collection()
+    operations = [
+        UpdateOne(
+            {"instrument": c["instrument"], "timestamp": c["timestamp"], "resolution": c["resolution"]},
+            {"$set": c},
+            upsert=True,
+        )
+        for c in candles
+    ]
+    result = collection.bulk_write(operations, ordered=False)
+    try:
+        update_rollups_for_candles(candles, collection)
+    except Exception as e:
+        # The 1m bars are stored; stale rollups are repaired by the next write or rebuild_rollups.
+        logger.error(f"Failed to update rollup candles: {e}")
+    finally:
+        # Only once the rollups are merged: a read in between would cache the old
+        # rollup bars under the new generation.
+        invalidate_for_candles(candles)
+    return result
@@ -0,0 +1,100 @@
+# backend/marketdata/conflation.py
+"""
+Per-instrument conflation of the delayed tick broadcast.
+
+At most `max_per_second` messages go out per instrument. A tick arriving inside the
+interval is merged into a pending message instead of being sent: the newest tick's
+fields win, `last_traded_qty` is summed, and the first, highest and lowest traded
+prices of the merged ticks are carried as `conflated_open`, `conflated_high` and
+`conflated_low` (with `conflated` = number of ticks merged), so a chart folding the
+messages into candles ends up with the same volume and range. A pending message is
+sent once its interval has elapsed, or straight away when a tick of the next minute
+arrives, so merged ticks never straddle a 1m candle.
+"""
+import threading
+
+
+def _minute(tick):
+    return tick["timestamp"].replace(second=0, microsecond=0)
+
+
+def merge_ticks(pending, tick):
+    """`tick` folded into the pending (possibly already merged) message."""
+    price = tick.get("price")
+    first = pending.get("conflated_open", pending.get("price"))
+    high = pending.get("conflated_high", pending.get("price"))
+    low = pending.get("conflated_low", pending.get("price"))
+    merged = dict(tick)
+    merged["last_traded_qty"] = (pending.get("last_traded_qty") or 0) + (tick.get("last_traded_qty") or 0)
+    merged["conflated_open"] = first
+    merged["conflated_high"] = max(high, price)
+    merged["conflated_low"] = min(low, price)
+    merged["conflated"] = pending.get("conflated", 1) + 1
+    return merged
+
+
+class Conflator:
+    def __init__(self, max_per_second, name="conflation"):
+        self.interval = 1.0 / max_per_second if max_per_second > 0 else 0.0
+        self.name = name
+        self._last_sent = {}  # instrument -> time of the last message
+        self._pending = {}    # instrument -> merged message waiting for its interval
+        self._counts = {}     # instrument -> [ticks in, messages out]
+        self._lock = threading.Lock()
+
+    def offer(self, tick, now):
+        """Feed one tick; returns the messages to send now (zero, one or two)."""
+        instrument = tick["instrument"]
+        with self._lock:
+            counts = self._counts.setdefault(instrument, [0, 0])
+            counts[0] += 1
+            out = []
+            pending = self._pending.get(instrument)
+            if pending is not None and _minute(pending) != _minute(tick):
+                out.append(self._pending.pop(instrument))
+                pending = None
+
+            if pending is None and now - self._last_sent.get(instrument, float("-inf")) >= self.interval:
+                out.append(tick)
+            elif pending is None:
+                self._pending[instrument] = tick
+            else:
+                self._pending[instrument] = merge_ticks(pending, tick)
+
+            if out:
+                self._last_sent[instrument] = now
+                counts[1] += len(out)
+            return out
+
+    def due(self, now):
+        """Pending messages whose interval has elapsed."""
+        with self._lock:
+            ready = [
+                instrument for instrument in self._pending
+                if now - self._last_sent.get(instrument, float("-inf")) >= self.interval
+            ]
+            out = []
+            for instrument in ready:
+                out.append(self._pending.pop(instrument))
+                self._last_sent[instrument] = now
+                self._counts[instrument][1] += 1
+            return out
+
+    def seconds_until_due(self, now):
+        """Seconds until the next pending message may go out, or None when nothing is pending."""
+        with self._lock:
+            if not self._pending:
+                return None
+            return max(0.0, min(self._last_sent[i] + self.interval for i in self._pending) - now)
+
+    def stats(self):
+        with self._lock:
+            ticks_in = sum(c[0] for c in self._counts.values())
+            messages_out = sum(c[1] for c in self._counts.values())
+            return {
+                "max_per_second": round(1 / self.interval, 2) if self.interval else None,
+                "ticks_in": ticks_in,
+                "messages_out": messages_out,
+                "pending": len(self._pending),
+                "instruments": {i: {"ticks_in": c[0], "messages_out": c[1]} for i, c in sorted(self._counts.items())},
+            }
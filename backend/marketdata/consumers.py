@@ -2,7 +2,40 @@
 import json
 import re
 import asyncio
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from .snapshots import get_snapshot_store
+from .subscriptions import get_subscription_registry
+from .tick_messages import encode_keyframe, encode_tick, join_frames, snapshot_frame
+
+# Bounds of a client-requested batching window, in milliseconds
+MIN_BATCH_MS = 10
+MAX_BATCH_MS = 1000
+
+
+def batch_window(requested):
+    """
+    Seconds to buffer ticks for, from the `batch` field of a subscribe message:
+    true for WS_BATCH_WINDOW_MS, a number of milliseconds, or false/absent for none.
+    """
+    if requested is True:
+        return settings.WS_BATCH_WINDOW_MS / 1000
+    if isinstance(requested, (int, float)) and not isinstance(requested, bool) and requested > 0:
+        return min(max(requested, MIN_BATCH_MS), MAX_BATCH_MS) / 1000
+    return None
+
+
+def delayed_snapshots(instruments):
+    """{instrument: latest delayed tick} from the in-memory/Redis snapshots, for those that have one."""
+    store = get_snapshot_store()
+    return store.latest_many(instruments, delayed=True) if store.available() else {}
+
+
+def group_for(instrument):
+    # same sanitization as broadcaster
+    return re.sub(r"[^a-zA-Z0-9\-_.]", "_", instrument)
 
 
 class MarketDataConsumer(AsyncWebsocketConsumer):
@@ -22,14 +55,26 @@ class MarketDataConsumer(AsyncWebsocketConsumer):
         await self.accept()
         self.user_group_name = f"user_{user.id}"
         self.subscriptions = set()
+        # Opt-in tick batching (see marketdata_message): window in seconds, or None
+        self.batch_window = None
+        self._tick_buffer = []
+        self._flush_task = None
+        # Opt-in compact stream: groups whose keyframe has been sent (see marketdata/tick_messages.py)
+        self.compact = False
+        self._synced = set()
 
         await self.channel_layer.group_add(self.user_group_name, self.channel_name)
         await self.send(json.dumps({"status": "connected", "user": user.username}))
         print(f"✅ User {user.username} connected to MarketDataConsumer")
 
     async def disconnect(self, close_code):
-        for group in self.subscriptions:
-            await self.channel_layer.group_discard(group, self.channel_name)
+        if getattr(self, "_flush_task", None) is not None:
+            self._flush_task.cancel()
+        subscriptions = list(getattr(self, "subscriptions", ()))
+        await asyncio.gather(*(self.channel_layer.group_discard(group, self.channel_name) for group in subscriptions))
+        if subscriptions:
+            registry = get_subscription_registry()
+            await sync_to_async(registry.remove_many, thread_sensitive=False)(subscriptions)
 
         if hasattr(self, "user_group_name"):
             await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
@@ -39,23 +84,36 @@ class MarketDataConsumer(AsyncWebsocketConsumer):
         try:
             data = json.loads(text_data)
             message_type = data.get("type")
+            if message_type in ("subscribe_many", "unsubscribe_many"):
+                await self.receive_many(message_type, data)
+                return
+
             instrument = data.get("instrument")
             if not instrument:
                 return
 
-            # same sanitization as broadcaster
-            group_name = re.sub(r"[^a-zA-Z0-9\-_.]", "_", instrument)
+            group_name = group_for(instrument)
 
             if message_type == "subscribe":
-                self.subscriptions.add(group_name)
+                await self._apply_options(data)
+                if group_name not in self.subscriptions:
+                    self.subscriptions.add(group_name)
+                    # Lets the broadcaster skip instruments nobody watches (see marketdata/subscriptions.py)
+                    await sync_to_async(get_subscription_registry().add, thread_sensitive=False)(group_name)
                 await self.channel_layer.group_add(group_name, self.channel_name)
-                await self.send(json.dumps({"status": "subscribed", "instrument": instrument}))
+                await self.send(json.dumps(self._subscribed_reply(instrument=instrument)))
                 print(f"✅ User subscribed to {instrument}")
 
+                if self.compact:
+                    # Full state straight away; the first broadcast message is a keyframe too
+                    await self._send_snapshot([instrument])
+
             elif message_type == "unsubscribe":
                 if group_name in self.subscriptions:
                     self.subscriptions.remove(group_name)
+                    self._synced.discard(group_name)
                     await self.channel_layer.group_discard(group_name, self.channel_name)
+                    await sync_to_async(get_subscription_registry().remove, thread_sensitive=False)(group_name)
                     await self.send(json.dumps({"status": "unsubscribed", "instrument": instrument}))
                     print(f"⚠️ User unsubscribed from {instrument}")
 
@@ -64,14 +122,114 @@ class MarketDataConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             await self.send(json.dumps({"error": str(e)}))
 
+    async def receive_many(self, message_type, data):
+        """
+        subscribe_many / unsubscribe_many: {"type": ..., "instruments": [...]} with the
+        options of subscribe. Group changes run concurrently, and a subscribe is answered
+        with one snapshot frame of the latest delayed tick of every instrument.
+        """
+        instruments = data.get("instruments")
+        if not isinstance(instruments, list) or not all(isinstance(i, str) and i for i in instruments):
+            await self.send(json.dumps({"error": "instruments must be a list of instrument names"}))
+            return
+        instruments = list(dict.fromkeys(instruments))
+        if len(instruments) > settings.WS_SUBSCRIBE_MAX_INSTRUMENTS:
+            await self.send(json.dumps({
+                "error": f"At most {settings.WS_SUBSCRIBE_MAX_INSTRUMENTS} instruments per message"
+            }))
+            return
+        groups = list(dict.fromkeys(group_for(instrument) for instrument in instruments))
+        registry = get_subscription_registry()
+
+        if message_type == "subscribe_many":
+            await self._apply_options(data)
+            added = [group for group in groups if group not in self.subscriptions]
+            self.subscriptions.update(added)
+            await asyncio.gather(*(self.channel_layer.group_add(group, self.channel_name) for group in added))
+            if added:
+                await sync_to_async(registry.add_many, thread_sensitive=False)(added)
+            await self.send(json.dumps(self._subscribed_reply(instruments=instruments)))
+            await self._send_snapshot(instruments)
+            print(f"✅ User subscribed to {len(instruments)} instruments")
+        else:
+            removed = [group for group in groups if group in self.subscriptions]
+            self.subscriptions.difference_update(removed)
+            self._synced.difference_update(removed)
+            await asyncio.gather(*(self.channel_layer.group_discard(group, self.channel_name) for group in removed))
+            if removed:
+                await sync_to_async(registry.remove_many, thread_sensitive=False)(removed)
+            await self.send(json.dumps({"status": "unsubscribed", "instruments": instruments}))
+            print(f"⚠️ User unsubscribed from {len(removed)} instruments")
+
+    async def _apply_options(self, data):
+        """The `batch` and `compact` options of a subscribe message."""
+        if "batch" in data:
+            self.batch_window = batch_window(data["batch"])
+            if self.batch_window is None:
+                await self._flush_ticks()
+        # Without WS_COMPACT_STREAM the broadcaster sends no deltas; the reply then lacks `compact`
+        compact = bool(data.get("compact", self.compact)) and settings.WS_COMPACT_STREAM
+        if compact != self.compact:
+            self.compact = compact
+            self._synced.clear()
+
+    def _subscribed_reply(self, **fields):
+        reply = {"status": "subscribed", **fields}
+        if self.batch_window is not None:
+            reply["batch_ms"] = round(self.batch_window * 1000)
+        if self.compact:
+            reply["compact"] = True
+        return reply
+
+    async def _send_snapshot(self, instruments):
+        ticks = await sync_to_async(delayed_snapshots, thread_sensitive=False)(instruments)
+        if ticks:
+            encode = encode_keyframe if self.compact else encode_tick
+            await self.send(snapshot_frame([encode(tick) for tick in ticks.values()]))
+
     async def marketdata_message(self, event):
         try:
-            # event["message"] already has type="tick"
-            # which your frontend expects
-            await self.send(json.dumps(event["message"]))
+            text = self._tick_text(event)
+            if self.batch_window is None:
+                await self.send(text)
+                return
+
+            # Batching: ticks arriving within the window go out as one JSON array frame
+            self._tick_buffer.append(text)
+            if len(self._tick_buffer) >= settings.WS_BATCH_MAX_TICKS:
+                await self._flush_ticks()
+            elif self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush_later(self.batch_window))
         except Exception as e:
             print(f"Error sending market data: {e}")
 
+    def _tick_text(self, event):
+        if self.compact and "delta" in event:
+            # Deltas only make sense once the client holds this instrument's keyframe
+            if event["group"] in self._synced:
+                return event["delta"]
+            self._synced.add(event["group"])
+            return event["keyframe"]
+        # event["text"] is the tick already encoded by the broadcaster, with
+        # type="tick" which your frontend expects
+        text = event.get("text")
+        if text is None:
+            text = json.dumps(event["message"])
+        return text
+
+    async def _flush_later(self, delay):
+        await asyncio.sleep(delay)
+        self._flush_task = None
+        try:
+            await self._flush_ticks()
+        except Exception as e:
+            print(f"Error sending market data: {e}")
+
+    async def _flush_ticks(self):
+        if self._tick_buffer:
+            texts, self._tick_buffer = self._tick_buffer, []
+            await self.send(join_frames(texts))
+
     async def order_update(self, event):
         """Handles 'order.update' events from the signal receiver."""
         message = event["message"]
@@ -0,0 +1,157 @@
+# backend/marketdata/fyers_stream.py
+#
+# Kept free of Django imports at module level: shard processes are started with the
+# "spawn" method and import this module before Django has been set up.
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from fyers_apiv3.FyersWebsocket import data_ws
+
+logger = logging.getLogger(__name__)
+
+# Hard per-connection subscription limit enforced by the Fyers data socket
+FYERS_MAX_SYMBOLS_PER_SOCKET = 5000
+
+
+def build_tick_document(tick):
+    """Map a full-mode Fyers tick to the document stored in the ticks collection."""
+    return {
+        "instrument": tick.get('symbol'),
+        "timestamp": datetime.fromtimestamp(tick.get('last_traded_time'), tz=timezone.utc),
+        "price": tick.get('ltp'),
+        "volume_traded_today": tick.get('vol_traded_today'),
+        "last_traded_qty": tick.get('last_traded_qty'),
+        "avg_trade_price": tick.get('avg_trade_price'),
+        "open": tick.get('open_price'),
+        "high": tick.get('high_price'),
+        "low": tick.get('low_price'),
+        "close": tick.get('prev_close_price'),
+        "change": tick.get('ch'),
+        "change_percent": tick.get('chp')
+    }
+
+
+class FyersStream:
+    """
+    One Fyers data socket subscribed to a slice of the universe (full data mode).
+
+    Every tick is mapped with `build_tick_document` and handed to `on_tick(shard, doc)`.
+    The SDK reconnects dropped connections itself; an expired token is refreshed
+    through `refresh_token()` and the socket is rebuilt with it.
+
+    The SDK's FyersDataSocket is a per-process singleton, so a process can only run
+    one FyersStream; additional shards need their own processes.
+    """
+
+    def __init__(self, shard, symbols, client_id, access_token, on_tick, refresh_token, log_path):
+        if len(symbols) > FYERS_MAX_SYMBOLS_PER_SOCKET:
+            raise ValueError(f"Shard {shard} has {len(symbols)} symbols; a socket allows {FYERS_MAX_SYMBOLS_PER_SOCKET}.")
+        self.shard = shard
+        self.symbols = symbols
+        self.client_id = client_id
+        self.access_token = access_token
+        self.on_tick = on_tick
+        self.refresh_token = refresh_token
+        self.log_path = log_path
+        self.socket = None
+
+    def connect(self):
+        # Format required by the SDK is: <CLIENT_ID>:<ACCESS_TOKEN>
+        self.socket = data_ws.FyersDataSocket(
+            access_token=f"{self.client_id}:{self.access_token}",
+            log_path=self.log_path,
+            litemode=False,
+            write_to_file=False,
+            reconnect=True,
+            on_connect=self._on_connect,
+            on_close=self._on_close,
+            on_error=self._on_error,
+            on_message=self._on_message,
+        )
+        self.socket.connect()
+
+    def close(self):
+        if self.socket:
+            self.socket.close_connection()
+
+    def _on_message(self, tick):
+        if not isinstance(tick, dict) or 'last_traded_time' not in tick:
+            logger.info(f"[shard {self.shard}] Received non-tick (control/status) message from WebSocket: {tick}")
+            return
+        try:
+            document = build_tick_document(tick)
+        except Exception as e:
+            logger.error(f"[shard {self.shard}] Error processing a single full-mode tick: {tick}. Error: {e}")
+            return
+        self.on_tick(self.shard, document)
+
+    def _on_connect(self):
+        logger.info(f"[shard {self.shard}] Fyers WebSocket connected, subscribing to {len(self.symbols)} symbols.")
+        self.socket.subscribe(symbols=self.symbols)
+
+    def _on_close(self, message):
+        logger.warning(f"[shard {self.shard}] WebSocket connection closed: {message}")
+
+    def _on_error(self, message):
+        logger.error(f"[shard {self.shard}] WebSocket error received: {message}")
+
+        if isinstance(message, dict) and message.get('code') == -99 and message.get('message') == "Token is expired":
+            logger.warning(f"[shard {self.shard}] Fyers access token expired. Refreshing token...")
+            new_access_token = self.refresh_token()
+            if not new_access_token:
+                logger.error(f"[shard {self.shard}] Failed to refresh Fyers access token. Closing socket.")
+                self.close()
+                return
+            self.access_token = new_access_token
+            self.close()
+            self.connect()
+
+
+def run_shard_process(shard, symbols, client_id, access_token, out_queue, batch_size=200, batch_interval=0.05):
+    """
+    Entry point of a shard process. Ticks are forwarded to the parent's shared
+    pipeline over `out_queue` in small batches of (shard, documents, dropped_count)
+    to keep IPC overhead per tick low.
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+    django.setup()
+    from django.conf import settings
+    from marketdata.utils import get_active_fyers_access_token
+
+    lock = threading.Lock()
+    state = {"batch": [], "dropped": 0}
+
+    def send(force=False):
+        with lock:
+            if not state["batch"] and not state["dropped"]:
+                return
+            if not force and len(state["batch"]) < batch_size:
+                return
+            batch, dropped = state["batch"], state["dropped"]
+            state["batch"], state["dropped"] = [], 0
+        try:
+            out_queue.put((shard, batch, dropped), timeout=1)
+        except queue.Full:
+            with lock:
+                state["dropped"] += len(batch) + dropped
+
+    def on_tick(_shard, document):
+        with lock:
+            state["batch"].append(document)
+        send()
+
+    stream = FyersStream(
+        shard, symbols, client_id, access_token, on_tick,
+        refresh_token=lambda: get_active_fyers_access_token(force_refresh=True),
+        log_path=os.path.join(settings.BASE_DIR, 'logs/'),
+    )
+    stream.connect()
+
+    while True:
+        time.sleep(batch_interval)
+        send(force=True)
@@ -2,20 +2,30 @@ import time
 import json
 import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from datetime import datetime, timedelta,timezone 
+from datetime import date, datetime, timedelta,timezone
 
 from django.core.management.base import BaseCommand
 from django.conf import settings
 
-from fyers_apiv3 import fyersModel
 from marketdata.models import MarketDataToken
+from marketdata.candles import candle_document, upsert_candles
 from marketdata.mongo_client import get_candles_collection
-from pymongo import UpdateOne
+from marketdata.rate_limit import get_fyers_rate_limiter
+from marketdata.utils import get_thread_fyers_model
 
 # Setup a dedicated logger for this backfill script
 logger = logging.getLogger(__name__)
 
+# Keeps each request inside Fyers' per-request history window for 1m data
+CHUNK_DAYS = 90
+# 1m candles of a full NSE session (09:15-15:30 IST); a stored day with fewer than 90%
+# of them is re-fetched (quiet minutes of a liquid stock without a trade are rare)
+SESSION_MINUTES = 375
+MIN_SESSION_CANDLES = int(SESSION_MINUTES * 0.9)
+
 # --- Load Nifty 100 Symbols ---
 try:
     nifty100_path = Path(settings.BASE_DIR) / 'data' / 'nifty100_symbols.json'
@@ -24,14 +34,110 @@ except FileNotFoundError:
     nifty100_data = []
     logger.error("FATAL: nifty100_symbols.json not found. Cannot start backfill.")
 
+
+def chunk_key(symbol, start, end):
+    return f"{symbol}|{start.isoformat()}|{end.isoformat()}"
+
+
+def split_range(start, end, chunk_days=CHUNK_DAYS):
+    """Split the inclusive date range [start, end] into chunks of at most chunk_days."""
+    chunks = []
+    while start <= end:
+        chunk_end = min(start + timedelta(days=chunk_days - 1), end)
+        chunks.append((start, chunk_end))
+        start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+def missing_ranges(start, end, coverage, day_counts=None, trading_days=()):
+    """
+    Date ranges inside [start, end] not covered by stored candles.
+    `coverage` is (first_timestamp, last_timestamp) or None. The boundary days are
+    re-fetched because they may only be partially stored. Inside the covered span,
+    `day_counts` ({date: stored 1m candles}) is compared against the session length:
+    a trading day (one with candles for any instrument, see `trading_days`) holding
+    fewer than MIN_SESSION_CANDLES is a gap, and consecutive gap days form one range.
+    A day without candles for any instrument is taken as a holiday, not a gap.
+    """
+    if not coverage:
+        return [(start, end)]
+    first, last = coverage[0].date(), coverage[1].date()
+    ranges = []
+    if start <= first:
+        ranges.append((start, min(first, end)))
+
+    gap = None
+    for day in sorted(d for d in trading_days if first < d < last and start <= d <= end):
+        if (day_counts or {}).get(day, 0) >= MIN_SESSION_CANDLES:
+            if gap:
+                ranges.append(gap)
+            gap = None
+        else:
+            gap = (gap[0] if gap else day, day)
+    if gap:
+        ranges.append(gap)
+
+    if last <= end:
+        ranges.append((max(last, start), end))
+    return ranges
+
+
+class Checkpoint:
+    """Plan and progress of a backfill run, persisted as JSON after every finished chunk."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.chunks = []
+        self.completed = set()
+        self._lock = threading.Lock()
+
+    def load(self):
+        data = json.loads(self.path.read_text())
+        self.chunks = data["chunks"]
+        self.completed = set(data["completed"])
+
+    def pending(self):
+        return [c for c in self.chunks if c not in self.completed]
+
+    def mark_done(self, key):
+        with self._lock:
+            self.completed.add(key)
+            self.save()
+
+    def save(self):
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"chunks": self.chunks, "completed": sorted(self.completed)}))
+        os.replace(tmp, self.path)
+
+
 class Command(BaseCommand):
-    help = 'Fetches historical 1-minute candle data for Nifty 100 stocks in chunks.'
+    help = (
+        'Fetches historical 1-minute candle data for Nifty 100 stocks in chunks. Only ranges '
+        'missing from the candles collection are fetched, chunks run on a worker pool under the '
+        'shared Fyers rate limiter, and progress is checkpointed so --resume can continue a run.'
+    )
 
     def add_arguments(self, parser):
-        parser.add_argument(    
+        parser.add_argument(
             '--days', type=int, default=365,
             help='Number of days of historical data to backfill.'
         )
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Number of chunks fetched concurrently.'
+        )
+        parser.add_argument(
+            '--retries', type=int, default=3,
+            help='Attempts per chunk before it is left for a later --resume.'
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Continue the plan saved in the checkpoint file instead of planning a new run.'
+        )
+        parser.add_argument(
+            '--checkpoint', default=str(Path(settings.BASE_DIR) / 'logs' / 'backfill_checkpoint.json'),
+            help='Path of the checkpoint file.'
+        )
 
     def handle(self, *args, **options):
         if not nifty100_data:
@@ -39,9 +145,7 @@ class Command(BaseCommand):
             return
 
         days_to_backfill = options['days']
-        self.stdout.write(self.style.SUCCESS(f"🚀 Starting historical data backfill for the last {days_to_backfill} days."))
 
-        client_id = settings.FYERS_CLIENT_ID
         try:
             token_row = MarketDataToken.objects.get(pk=1)
             access_token = token_row.access_token
@@ -52,65 +156,113 @@ class Command(BaseCommand):
         if not access_token or not token_row.is_valid():
             self.stderr.write(self.style.ERROR('Fyers access token is invalid or expired.'))
             return
-        
-        fyers = fyersModel.FyersModel(client_id=client_id, is_async=False, token=access_token, log_path=os.path.join(settings.BASE_DIR, 'logs/'))
-        candles_collection = get_candles_collection()
 
+        checkpoint = Checkpoint(options['checkpoint'])
+        if options['resume']:
+            if not checkpoint.path.exists():
+                self.stderr.write(self.style.ERROR(f"No checkpoint found at {checkpoint.path}."))
+                return
+            checkpoint.load()
+            self.stdout.write(self.style.SUCCESS(
+                f"🚀 Resuming backfill: {len(checkpoint.completed)}/{len(checkpoint.chunks)} chunks already done."
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"🚀 Starting historical data backfill for the last {days_to_backfill} days."))
+            nifty_100_symbols = [f"NSE:{s['symbol']}-EQ" for s in nifty100_data]
+            checkpoint.chunks = self.plan_chunks(nifty_100_symbols, days_to_backfill)
+            checkpoint.save()
+
+        pending = checkpoint.pending()
+        self.stdout.write(f"{len(pending)} chunks to fetch with {options['workers']} workers.")
+
+        limiter = get_fyers_rate_limiter()
+        started = time.perf_counter()
+        total_candles = total_requests = failed_chunks = 0
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {
+                pool.submit(self.fetch_chunk, key, access_token, limiter, options['retries']): key
+                for key in pending
+            }
+            for i, future in enumerate(as_completed(futures), start=1):
+                key = futures[future]
+                candles, requests_made, ok = future.result()
+                total_candles += candles
+                total_requests += requests_made
+                if ok:
+                    checkpoint.mark_done(key)
+                    self.stdout.write(f"[{i}/{len(pending)}] {key.replace('|', ' ')} -> synced {candles} candles.")
+                else:
+                    failed_chunks += 1
+                    self.stderr.write(self.style.WARNING(f"[{i}/{len(pending)}] {key.replace('|', ' ')} failed; left for --resume."))
+
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        self.stdout.write(self.style.SUCCESS(
+            f"\n✅ Historical data backfill complete in {elapsed:.1f}s: "
+            f"{total_candles} candles ({total_candles / elapsed:.1f} candles/s), "
+            f"{total_requests} requests ({total_requests / elapsed:.2f} requests/s), "
+            f"{failed_chunks} failed chunks."
+        ))
+
+    def plan_chunks(self, symbols, days_to_backfill):
+        """Chunk keys for every date range not already present in the candles collection."""
         total_start_date = (datetime.now(timezone.utc) - timedelta(days=days_to_backfill)).date()
-        today = datetime.now(timezone.utc).date()
-        
-        nifty_100_symbols = [f"NSE:{s['symbol']}-EQ" for s in nifty100_data]
-
-        for i, symbol in enumerate(nifty_100_symbols):
-            self.stdout.write(f"\n[{i+1}/{len(nifty_100_symbols)}] Processing {symbol}...")
-            
-            # Loop through the date range in 90-day chunks
-            chunk_start_date = total_start_date
-            while chunk_start_date < today:
-                chunk_end_date = chunk_start_date + timedelta(days=90)
-                if chunk_end_date >= today:
-                    chunk_end_date = today - timedelta(days=1)
-
-                self.stdout.write(f"  Fetching from {chunk_start_date} to {chunk_end_date}...")
-
-                try:
-                    data = {
-                        "symbol": symbol,
-                        "resolution": "1",
-                        "date_format": "1",
-                        "range_from": chunk_start_date.strftime("%Y-%m-%d"),
-                        "range_to": chunk_end_date.strftime("%Y-%m-%d"),
-                        "cont_flag": "1"
-                    }
-
-                    response = fyers.history(data=data)
-
-                    if response.get("s") != "ok" or not response.get("candles"):
-                        self.stderr.write(self.style.WARNING(f"    - Could not fetch data for {symbol} in this range: {response.get('message', 'No candles returned')}"))
-                    else:
-                        candles_to_insert = [
-                            {
-                                "instrument": symbol, "timestamp": datetime.fromtimestamp(c[0], tz=timezone.utc),
-                                "resolution": "1m", "open": c[1], "high": c[2], "low": c[3], "close": c[4], "volume": c[5]
-                            } for c in response["candles"]
-                        ]
-                        
-                        if candles_to_insert:
-                            operations = [
-                                UpdateOne({"instrument": c["instrument"], "timestamp": c["timestamp"], "resolution": c["resolution"]}, {"$set": c}, upsert=True)
-                                for c in candles_to_insert
-                            ]
-                            result = candles_collection.bulk_write(operations)
-                            self.stdout.write(self.style.SUCCESS(f"    -> Synced {result.upserted_count + result.modified_count} candles."))
-                    
-                    # API rate limit delay is crucial
-                    time.sleep(0.5)
-
-                except Exception as e:
-                    self.stderr.write(self.style.ERROR(f"    -> An unexpected error occurred: {e}"))
-                    time.sleep(2) # Wait longer on error
-                
-                # Move to the next chunk
-                chunk_start_date = chunk_end_date + timedelta(days=1)
-
-        self.stdout.write(self.style.SUCCESS("\n✅ Historical data backfill complete!"))
\ No newline at end of file
+        last_full_day = datetime.now(timezone.utc).date() - timedelta(days=1)
+
+        # Stored 1m candles per instrument and (UTC) day; the NSE session falls within one UTC day
+        day_counts, coverage = {}, {}
+        for doc in get_candles_collection().aggregate([
+            {"$match": {"instrument": {"$in": symbols}, "resolution": "1m"}},
+            {"$group": {
+                "_id": {"instrument": "$instrument", "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}}},
+                "candles": {"$sum": 1}, "first": {"$min": "$timestamp"}, "last": {"$max": "$timestamp"},
+            }},
+        ]):
+            symbol, day = doc["_id"]["instrument"], date.fromisoformat(doc["_id"]["day"])
+            day_counts.setdefault(symbol, {})[day] = doc["candles"]
+            first, last = coverage.get(symbol, (doc["first"], doc["last"]))
+            coverage[symbol] = (min(first, doc["first"]), max(last, doc["last"]))
+        trading_days = {day for counts in day_counts.values() for day in counts}
+
+        chunks = []
+        for symbol in symbols:
+            for start, end in missing_ranges(
+                total_start_date, last_full_day, coverage.get(symbol), day_counts.get(symbol), trading_days
+            ):
+                chunks.extend(chunk_key(symbol, a, b) for a, b in split_range(start, end))
+        self.stdout.write(f"Planned {len(chunks)} chunks; {len(coverage)} symbols already have stored history.")
+        return chunks
+
+    def fetch_chunk(self, key, access_token, limiter, retries):
+        """Fetch and store one chunk. Returns (candles_synced, requests_made, succeeded)."""
+        symbol, range_from, range_to = key.split("|")
+        data = {
+            "symbol": symbol,
+            "resolution": "1",
+            "date_format": "1",
+            "range_from": range_from,
+            "range_to": range_to,
+            "cont_flag": "1"
+        }
+
+        for attempt in range(1, retries + 1):
+            limiter.acquire()
+            try:
+                response = get_thread_fyers_model(access_token).history(data=data)
+                if response.get("s") == "no_data":
+                    return 0, attempt, True  # holidays, or before the symbol was listed
+                if response.get("s") != "ok":
+                    raise RuntimeError(response.get("message", response))
+
+                candles_to_insert = [
+                    candle_document(symbol, c[0], c[1], c[2], c[3], c[4], c[5])
+                    for c in response.get("candles", [])
+                ]
+                result = upsert_candles(candles_to_insert)
+                synced = (result.upserted_count + result.modified_count) if result else 0
+                return synced, attempt, True
+            except Exception as e:
+                logger.warning(f"Backfill chunk {key} attempt {attempt}/{retries} failed: {e}")
+                if attempt < retries:
+                    time.sleep(2 ** attempt)  # Back off harder on each failure
+        return 0, retries, False
@@ -0,0 +1,110 @@
+# backend/marketdata/management/commands/benchmark_async_views.py
+import asyncio
+import logging
+import random
+import statistics
+import time
+
+import httpx
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import path
+
+from marketdata import async_views, views
+from marketdata.universe import load_universe
+
+# In-process mode mounts both implementations side by side (ROOT_URLCONF is pointed here)
+urlpatterns = [
+    path("sync/ohlc/", views.ohlc_data),
+    path("async/ohlc/", async_views.ohlc_data),
+]
+
+# A dummy shared cache keeps DRF's anon throttle from rejecting the benchmark and
+# makes every chart load read Mongo, which is the part the async views change.
+BENCHMARK_CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def chart_loads(client, url, symbols, resolution, concurrency, requests):
+    """Issue `requests` chart loads with `concurrency` in flight; returns (latencies ms, errors, seconds)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def load():
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(url, params={"instrument": random.choice(symbols), "resolution": resolution})
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(load() for _ in range(requests)))
+    return latencies, errors, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares p50/p99 latency of concurrent chart loads (GET /ohlc/) between the sync "
+        "DRF view and the async Motor view. By default both are served in-process through "
+        "Django's ASGI handler; pass --url to load running servers instead (e.g. one started "
+        "with MARKETDATA_ASYNC_VIEWS=True and one without)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=200, help='Chart loads in flight at once.')
+        parser.add_argument('--requests', type=int, default=1000, help='Chart loads per implementation.')
+        parser.add_argument('--resolution', default='1m')
+        parser.add_argument(
+            '--universe', default=settings.MARKETDATA_UNIVERSE,
+            help='Symbols to pick chart instruments from (see marketdata/universe.py).'
+        )
+        parser.add_argument(
+            '--url', action='append', dest='urls',
+            help='Full OHLC endpoint URL of a running server (repeatable).'
+        )
+
+    def handle(self, *args, **options):
+        # httpx logs every request at INFO
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        symbols = [s.split(':')[1].rsplit('-', 1)[0] for s in load_universe(options['universe'])]
+        self.stdout.write(self.style.SUCCESS(
+            f"🚀 {options['requests']} chart loads per run, {options['concurrency']} concurrent, "
+            f"{len(symbols)} symbols at {options['resolution']}."
+        ))
+
+        if options['urls']:
+            targets = [(url, url, None) for url in options['urls']]
+        else:
+            app = get_asgi_application()
+            targets = [
+                ("sync view", "http://localhost/sync/ohlc/", app),
+                ("async view", "http://localhost/async/ohlc/", app),
+            ]
+
+        self.stdout.write(f"\n{'target':<40}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}{'errors':>8}")
+        with override_settings(ROOT_URLCONF=__name__, CACHES=BENCHMARK_CACHES, ALLOWED_HOSTS=["*"]):
+            for label, url, app in targets:
+                latencies, errors, seconds = asyncio.run(self.run_target(url, app, symbols, options))
+                self.stdout.write(
+                    f"{label:<40}{statistics.median(latencies):>10.1f}{percentile(latencies, 99):>10.1f}"
+                    f"{len(latencies) / seconds:>10.0f}{errors:>8}"
+                )
+        self.stdout.write(self.style.SUCCESS("\n✅ Async view benchmark complete."))
+
+    async def run_target(self, url, app, symbols, options):
+        transport = httpx.ASGITransport(app=app) if app else None
+        limits = httpx.Limits(max_connections=options['concurrency'])
+        async with httpx.AsyncClient(transport=transport, limits=limits, timeout=120) as client:
+            # One warm-up load so connection setup is not measured
+            await client.get(url, params={"instrument": symbols[0], "resolution": options['resolution']})
+            return await chart_loads(
+                client, url, symbols, options['resolution'], options['concurrency'], options['requests']
+            )
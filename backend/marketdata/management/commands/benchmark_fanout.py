@@ -0,0 +1,166 @@
+# backend/marketdata/management/commands/benchmark_fanout.py
+import asyncio
+import multiprocessing
+import random
+import time
+from datetime import datetime, timezone
+
+from channels_redis.pubsub import RedisPubSubChannelLayer
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from marketdata.tick_messages import encode_tick
+
+
+def group_of(index, groups):
+    """Ticks are published round-robin over the instrument groups."""
+    return f"NSE_SYM{index % groups}-EQ"
+
+
+def sample_tick(index, groups):
+    # Fields of a broadcast tick (see marketdata/tick_messages.py)
+    return {
+        "_id": f"{index:024x}",
+        "instrument": f"NSE:SYM{index % groups}-EQ",
+        "timestamp": datetime.now(timezone.utc),
+        "price": 1000 + index % 97 * 0.05,
+        "volume": 100000 + index,
+        "last_traded_qty": 1 + index % 50,
+    }
+
+
+def _serve_fakeredis(ports):
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(("127.0.0.1", 0))
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+def _run_worker(url, clients, groups, per_client, ticks, seed, timeout, ready, results):
+    asyncio.run(_worker(url, clients, groups, per_client, ticks, seed, timeout, ready, results))
+
+
+async def _worker(url, clients, groups, per_client, ticks, seed, timeout, ready, results):
+    """One ASGI worker: `clients` consumers on its own channel layer, each receiving
+    every tick of its instruments the way MarketDataConsumer does."""
+    layer = RedisPubSubChannelLayer(hosts=[url])
+    rng = random.Random(seed)
+    per_group = [ticks // groups + (1 if g < ticks % groups else 0) for g in range(groups)]
+
+    subscribed = []
+    for _ in range(clients):
+        channel = await layer.new_channel()
+        chosen = rng.sample(range(groups), per_client)
+        for g in chosen:
+            await layer.group_add(group_of(g, groups), channel)
+        subscribed.append((channel, sum(per_group[g] for g in chosen)))
+
+    received = 0
+    last = 0.0
+
+    async def client(channel, expected):
+        nonlocal received, last
+        for _ in range(expected):
+            await layer.receive(channel)
+            received += 1
+            last = time.time()
+
+    ready.put(len(subscribed))
+    tasks = [asyncio.create_task(client(channel, expected)) for channel, expected in subscribed]
+    await asyncio.wait(tasks, timeout=timeout)
+    for task in tasks:
+        task.cancel()
+    results.put((received, sum(expected for _, expected in subscribed), last))
+    await layer.flush()
+
+
+async def publish(url, ticks, groups, concurrency):
+    """The broadcaster: one group_send per tick."""
+    layer = RedisPubSubChannelLayer(hosts=[url])
+    started = time.time()
+    for offset in range(0, ticks, concurrency):
+        await asyncio.gather(*(
+            layer.group_send(group_of(i, groups), {"type": "marketdata.message", "text": encode_tick(sample_tick(i, groups))})
+            for i in range(offset, min(ticks, offset + concurrency))
+        ))
+    published = time.time()
+    await layer.flush()
+    return started, published
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures websocket fan-out throughput over the Redis pub/sub channel layer with 1..N "
+        "ASGI worker processes sharing a fixed number of simulated consumers, the broadcaster "
+        "publishing from this process. Uses CHANNEL_LAYER_URL (or --redis-url) when set, "
+        "otherwise an in-process fakeredis server, which is far slower than Redis and "
+        "mostly useful to check the setup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', default='1,2,4', help='Comma-separated worker process counts to compare.')
+        parser.add_argument('--clients', type=int, default=2000, help='Simulated websocket consumers, split across workers.')
+        parser.add_argument('--instruments', type=int, default=50, help='Instrument groups ticks are published to.')
+        parser.add_argument('--subscriptions', type=int, default=10, help='Instruments each consumer subscribes to.')
+        parser.add_argument('--ticks', type=int, default=5000, help='Ticks published per run.')
+        parser.add_argument('--concurrency', type=int, default=100, help='group_send calls in flight at once.')
+        parser.add_argument('--timeout', type=float, default=120.0, help='Seconds a worker waits for its ticks.')
+        parser.add_argument('--redis-url', default=settings.CHANNEL_LAYER_URL)
+
+    def handle(self, *args, **options):
+        if options['subscriptions'] > options['instruments']:
+            raise CommandError("--subscriptions cannot exceed --instruments.")
+        context = multiprocessing.get_context("spawn")
+
+        server = None
+        url = options['redis_url']
+        if not url:
+            try:
+                import fakeredis  # noqa: F401
+            except ImportError:
+                raise CommandError("Set CHANNEL_LAYER_URL/--redis-url or install fakeredis (requirements-dev.txt).")
+            ports = context.Queue()
+            server = context.Process(target=_serve_fakeredis, args=(ports,), daemon=True)
+            server.start()
+            url = f"redis://127.0.0.1:{ports.get(timeout=30)}/0"
+
+        self.stdout.write(self.style.SUCCESS(
+            f"🚀 {options['ticks']} ticks over {options['instruments']} instruments to {options['clients']} "
+            f"consumers ({options['subscriptions']} subscriptions each) via {url}."
+        ))
+        self.stdout.write(f"\n{'workers':>8}{'publish/s':>12}{'delivered':>12}{'expected':>12}{'delivered/s':>14}")
+        try:
+            for workers in [int(w) for w in options['workers'].split(',')]:
+                delivered, expected, publish_rate, rate = self.run(context, url, workers, options)
+                self.stdout.write(f"{workers:>8}{publish_rate:>12.0f}{delivered:>12}{expected:>12}{rate:>14.0f}")
+        finally:
+            if server is not None:
+                server.terminate()
+        self.stdout.write(self.style.SUCCESS("\n✅ Fan-out benchmark complete."))
+
+    def run(self, context, url, workers, options):
+        ready, results = context.Queue(), context.Queue()
+        clients = options['clients'] // workers
+        processes = [
+            context.Process(target=_run_worker, args=(
+                url, clients, options['instruments'], options['subscriptions'], options['ticks'],
+                seed, options['timeout'], ready, results,
+            ))
+            for seed in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.get(timeout=options['timeout'])
+        time.sleep(0.5)  # let the last SUBSCRIBEs reach the server
+
+        started, published = asyncio.run(publish(url, options['ticks'], options['instruments'], options['concurrency']))
+        reports = [results.get(timeout=options['timeout'] + 30) for _ in processes]
+        for process in processes:
+            process.join()
+
+        delivered = sum(r[0] for r in reports)
+        expected = sum(r[1] for r in reports)
+        finished = max([r[2] for r in reports] + [published])
+        return delivered, expected, options['ticks'] / (published - started), delivered / (finished - started)
@@ -0,0 +1,87 @@
+# backend/marketdata/management/commands/benchmark_ohlc_encodings.py
+import json
+import random
+import statistics
+import time
+
+import msgpack
+import pyarrow as pa
+from django.core.management.base import BaseCommand
+
+from marketdata import ohlc
+from marketdata.mongo_client import get_candles_collection
+from marketdata.ohlc_cache import read_stored_bars
+from marketdata.renderers import OHLC_RENDERERS
+
+
+def synthetic_columns(bars):
+    """`bars` consecutive 1m bars with a random-walk price."""
+    columns = ohlc.empty_columns()
+    price = 1000.0
+    start = 1_700_000_000_000
+    for i in range(bars):
+        open_ = price
+        price = round(price * random.uniform(0.998, 1.002), 2)
+        columns["time"].append(start + i * 60_000)
+        columns["open"].append(open_)
+        columns["high"].append(round(max(open_, price) * 1.001, 2))
+        columns["low"].append(round(min(open_, price) * 0.999, 2))
+        columns["close"].append(price)
+        columns["volume"].append(random.randint(100, 50_000))
+    return columns
+
+
+# How a client would decode each format, to compare the receiving side as well
+DECODERS = {
+    "json": json.loads,
+    "columns": json.loads,
+    "msgpack": msgpack.unpackb,
+    "arrow": lambda payload: pa.ipc.open_stream(payload).read_all(),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the OHLC response encodings (row JSON, columnar JSON, MessagePack, "
+        "Arrow IPC): payload bytes, server-side render time and client-side decode time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--bars', type=int, default=93000,
+            help='Synthetic 1m bars to encode (default: about a year of NSE sessions).'
+        )
+        parser.add_argument(
+            '--instrument',
+            help='Encode the stored 1m history of this symbol (e.g. RELIANCE) instead of synthetic bars.'
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per format; the median is reported.')
+
+    def handle(self, *args, **options):
+        if options['instrument']:
+            query = ohlc.parse_ohlc_params({"instrument": options['instrument'], "resolution": "1m"})
+            columns = read_stored_bars(query, get_candles_collection())
+        else:
+            columns = synthetic_columns(options['bars'])
+        self.stdout.write(f"Encoding {ohlc.bar_count(columns)} bars, {options['repeat']} runs per format.")
+
+        self.stdout.write(f"\n{'format':<10}{'bytes':>12}{'vs json':>9}{'render ms':>12}{'decode ms':>12}")
+        baseline = None
+        for renderer_class in OHLC_RENDERERS:
+            renderer = renderer_class()
+            render_times, decode_times = [], []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                payload = renderer.render(columns)
+                render_times.append((time.perf_counter() - started) * 1000)
+
+                started = time.perf_counter()
+                DECODERS[renderer.format](payload)
+                decode_times.append((time.perf_counter() - started) * 1000)
+
+            baseline = baseline or len(payload)
+            self.stdout.write(
+                f"{renderer.format:<10}{len(payload):>12}{len(payload) / baseline:>9.2f}"
+                f"{statistics.median(render_times):>12.1f}{statistics.median(decode_times):>12.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS("\n✅ OHLC encoding benchmark complete."))
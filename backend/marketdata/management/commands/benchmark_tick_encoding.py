@@ -0,0 +1,90 @@
+# backend/marketdata/management/commands/benchmark_tick_encoding.py
+import json
+import time
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from channels_redis.pubsub import RedisPubSubChannelLayer
+from django.core.management.base import BaseCommand
+
+from marketdata.tick_messages import encode_tick
+
+
+def sample_tick(index):
+    # A full-mode tick as stored by the ingest pipeline
+    return {
+        "_id": ObjectId(),
+        "instrument": "NSE:RELIANCE-EQ",
+        "timestamp": datetime.now(timezone.utc),
+        "price": 2900 + index % 97 * 0.05,
+        "volume": 1500000 + index,
+        "last_traded_qty": 1 + index % 50,
+        "open": 2890.0,
+        "high": 2915.5,
+        "low": 2881.25,
+        "close": 2894.1,
+        "avg_trade_price": 2899.4,
+        "change": 5.9,
+        "change_percent": 0.2,
+    }
+
+
+def per_message(tick):
+    """The previous path: a dict per tick, json.dumps'ed by every subscribed consumer."""
+    val = dict(tick)
+    val["_id"] = str(val.get("_id", ""))
+    ts = val.get("timestamp")
+    if isinstance(ts, datetime):
+        val["timestamp"] = ts.isoformat()
+    val["type"] = "tick"
+    return {"type": "marketdata.message", "message": val}
+
+
+def encoded_once(tick):
+    return {"type": "marketdata.message", "text": encode_tick(tick)}
+
+
+def fan_out(build, subscribers, ticks):
+    """
+    CPU seconds to broadcast `ticks` ticks to `subscribers` consumers over the Redis
+    pub/sub channel layer, without the network: the broadcaster builds and serializes
+    the message once (group_send), the worker deserializes it once per subscribed
+    channel (as the layer's receive does) and each consumer does what
+    MarketDataConsumer.marketdata_message does before send.
+    """
+    layer = RedisPubSubChannelLayer(hosts=["redis://localhost:6379"])
+    samples = [sample_tick(i) for i in range(ticks)]
+
+    started = time.process_time()
+    for tick in samples:
+        data = layer.serialize(build(tick))
+        for _ in range(subscribers):
+            event = layer.deserialize(data)
+            text = event.get("text")
+            if text is None:
+                text = json.dumps(event["message"])
+    return time.process_time() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the CPU cost per broadcast tick of encoding each tick once in the "
+        "broadcaster (orjson, forwarded as-is) against json.dumps in every consumer, as "
+        "the number of subscribers of the instrument grows. Models the Redis pub/sub "
+        "channel layer's serialize/deserialize; no Redis server is needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', default='1,10,100,1000,5000', help='Comma-separated subscriber counts.')
+        parser.add_argument('--deliveries', type=int, default=50000, help='Approximate messages delivered per measurement.')
+
+    def handle(self, *args, **options):
+        counts = [int(n) for n in options['subscribers'].split(',')]
+        self.stdout.write(self.style.SUCCESS(f"🚀 Per-tick fan-out cost for {counts} subscribers."))
+        self.stdout.write(f"\n{'subscribers':>12}{'ticks':>8}{'per-consumer us/tick':>24}{'encode-once us/tick':>22}{'speedup':>10}")
+        for subscribers in counts:
+            ticks = max(10, options['deliveries'] // subscribers)
+            before = fan_out(per_message, subscribers, ticks) / ticks * 1e6
+            after = fan_out(encoded_once, subscribers, ticks) / ticks * 1e6
+            self.stdout.write(f"{subscribers:>12}{ticks:>8}{before:>24.1f}{after:>22.1f}{before / after:>9.2f}x")
+        self.stdout.write(self.style.SUCCESS("\n✅ Tick encoding benchmark complete."))
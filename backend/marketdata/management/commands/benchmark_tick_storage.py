@@ -0,0 +1,143 @@
+# backend/marketdata/management/commands/benchmark_tick_storage.py
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from pymongo.errors import OperationFailure
+
+from marketdata import tick_store
+from marketdata.mongo_client import (
+    TICK_BUCKETS_INDEXES,
+    TICKS_INDEXES,
+    TICKS_TIMESERIES_OPTIONS,
+    get_db,
+)
+
+# layout name -> (storage mode, create_collection options, indexes)
+LAYOUTS = {
+    "documents": ("documents", {}, TICKS_INDEXES),
+    "timeseries": ("documents", {"timeseries": TICKS_TIMESERIES_OPTIONS}, TICKS_INDEXES),
+    "buckets": ("buckets", {}, TICK_BUCKETS_INDEXES),
+}
+
+
+def synthetic_ticks(instruments, ticks_per_instrument, start):
+    """Ticks shaped like fyers_ingest documents, one per second per instrument, in time order."""
+    prices = {instrument: random.uniform(100, 3000) for instrument in instruments}
+    volumes = dict.fromkeys(instruments, 0)
+    for second in range(ticks_per_instrument):
+        timestamp = start + timedelta(seconds=second)
+        for instrument in instruments:
+            prices[instrument] = round(prices[instrument] * random.uniform(0.999, 1.001), 2)
+            qty = random.randint(1, 500)
+            volumes[instrument] += qty
+            yield {
+                "instrument": instrument,
+                "timestamp": timestamp,
+                "price": prices[instrument],
+                "volume_traded_today": volumes[instrument],
+                "last_traded_qty": qty,
+                "avg_trade_price": prices[instrument],
+                "open": prices[instrument],
+                "high": prices[instrument],
+                "low": prices[instrument],
+                "close": prices[instrument],
+                "change": 0.0,
+                "change_percent": 0.0,
+            }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the per-document tick layout (plain and time-series) with the bucketed "
+        "layout: write time, bytes on disk, index size and read throughput of the replay and "
+        "latest-tick readers. Runs against scratch collections in the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--instruments', type=int, default=100)
+        parser.add_argument(
+            '--ticks-per-instrument', type=int, default=1800,
+            help='Ticks generated per instrument, one per second.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--layouts', default=",".join(LAYOUTS),
+            help=f'Comma-separated subset of {", ".join(LAYOUTS)}.'
+        )
+        parser.add_argument('--keep', action='store_true', help='Keep the scratch collections.')
+
+    def handle(self, *args, **options):
+        db = get_db()
+        instruments = [f"NSE:BENCH{i}-EQ" for i in range(options['instruments'])]
+        start = (datetime.now(timezone.utc) - timedelta(days=1)).replace(second=0, microsecond=0)
+        ticks = list(synthetic_ticks(instruments, options['ticks_per_instrument'], start))
+        end = ticks[-1]["timestamp"]
+        self.stdout.write(f"Generated {len(ticks)} ticks for {len(instruments)} instruments.")
+
+        results = []
+        for layout in options['layouts'].split(","):
+            mode, create_options, indexes = LAYOUTS[layout]
+            collection_name = f"bench_ticks_{layout}"
+            db.drop_collection(collection_name)
+            try:
+                db.create_collection(collection_name, **create_options)
+            except OperationFailure as e:
+                self.stderr.write(self.style.WARNING(f"Skipping {layout}: {e}"))
+                continue
+            collection = db[collection_name]
+            for keys, index_options in indexes:
+                collection.create_index(keys, **index_options)
+
+            try:
+                results.append(self.run_layout(db, collection, mode, ticks, instruments, start, end, options['batch_size']))
+            finally:
+                if not options['keep']:
+                    db.drop_collection(collection_name)
+
+        self.stdout.write(
+            f"\n{'layout':<22}{'docs':>10}{'data MB':>10}{'disk MB':>10}{'index MB':>10}"
+            f"{'write t/s':>12}{'replay t/s':>12}{'latest/s':>10}"
+        )
+        for row in results:
+            self.stdout.write(
+                f"{row['layout']:<22}{row['count']:>10}{row['size_mb']:>10.2f}{row['storage_mb']:>10.2f}"
+                f"{row['index_mb']:>10.2f}{row['write_tps']:>12.0f}{row['replay_tps']:>12.0f}{row['latest_ps']:>10.0f}"
+            )
+        self.stdout.write(self.style.SUCCESS("\n✅ Tick storage benchmark complete."))
+
+    def run_layout(self, db, collection, mode, ticks, instruments, start, end, batch_size):
+        sink = tick_store.tick_sink(mode)
+        started = time.perf_counter()
+        for i in range(0, len(ticks), batch_size):
+            # insert_many adds _id to the documents it is given, so hand it copies
+            batch = [dict(t) for t in ticks[i:i + batch_size]]
+            if mode == "buckets":
+                sink(batch, collection=collection)
+            else:
+                collection.insert_many(batch, ordered=False)
+        write_seconds = time.perf_counter() - started
+
+        stats = db.command("collStats", collection.name)
+
+        started = time.perf_counter()
+        replayed = sum(1 for _ in tick_store.replay_ticks(start - timedelta(seconds=1), end, mode=mode, collection=collection))
+        replay_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for instrument in instruments:
+            tick_store.latest_tick(instrument, mode=mode, collection=collection)
+        latest_seconds = time.perf_counter() - started
+
+        label = f"{collection.name.replace('bench_ticks_', '')} ({mode})"
+        return {
+            "layout": label,
+            "count": stats.get("count", 0),
+            "size_mb": stats.get("size", 0) / 1e6,
+            "storage_mb": stats.get("storageSize", 0) / 1e6,
+            "index_mb": stats.get("totalIndexSize", 0) / 1e6,
+            "write_tps": len(ticks) / max(write_seconds, 1e-9),
+            "replay_tps": replayed / max(replay_seconds, 1e-9),
+            "latest_ps": len(instruments) / max(latest_seconds, 1e-9),
+        }
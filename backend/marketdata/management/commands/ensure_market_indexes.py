@@ -0,0 +1,31 @@
+# backend/marketdata/management/commands/ensure_market_indexes.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from marketdata.mongo_client import ensure_market_indexes, get_db
+from marketdata.tick_store import TICK_STORAGE_MODES
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the MongoDB indexes the market-data readers and writers rely on (candles and "
+        "the tick layout in use). Idempotent; run once per deploy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tick-storage-mode', choices=TICK_STORAGE_MODES, default=settings.TICK_STORAGE_MODE,
+            help='Tick layout whose indexes to create (default: TICK_STORAGE_MODE).'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            get_db().command('ping')
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f"❌ Failed to connect to MongoDB: {e}"))
+            return
+
+        indexes = ensure_market_indexes(options['tick_storage_mode'])
+        for collection, names in indexes.items():
+            self.stdout.write(f"{collection}: {', '.join(names)}")
+        self.stdout.write(self.style.SUCCESS("✅ Market data indexes present."))
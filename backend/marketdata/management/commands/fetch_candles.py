@@ -1,16 +1,18 @@
 # backend/marketdata/management/commands/fetch_candles.py
 import json
 import logging
-import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
 from apscheduler.schedulers.blocking import BlockingScheduler
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from fyers_apiv3 import fyersModel
 
-from marketdata.mongo_client import get_candles_collection
-from marketdata.utils import get_active_fyers_access_token
+from marketdata.candles import candle_document, upsert_candles
+from marketdata.rate_limit import get_fyers_rate_limiter
+from marketdata.utils import get_active_fyers_access_token, get_thread_fyers_model
 
 logger = logging.getLogger(__name__)
 
@@ -27,71 +29,87 @@ except FileNotFoundError:
 symbol_list = [f"NSE:{s['symbol']}-EQ" for s in nifty100_data]
 
 
-def fetch_and_store_candles():
-    print("Fetching 1-minute candles for Nifty 100 from Fyers API...")
+# Guards against a slow cycle overlapping the next scheduled one.
+_cycle_lock = threading.Lock()
+
+
+def fetch_symbol_candles(symbol, access_token, range_from, range_to):
+    """Fetch 1m candles for one symbol, waiting on the shared Fyers rate limiter first."""
+    data = {
+        "symbol": symbol,
+        "resolution": "1",   # 1-minute candles
+        "date_format": "0",  # epoch timestamps
+        "range_from": int(range_from.timestamp()),
+        "range_to": int(range_to.timestamp()),
+        "cont_flag": "1"
+    }
+
+    get_fyers_rate_limiter().acquire()
+    try:
+        resp = get_thread_fyers_model(access_token).history(data)
+    except Exception as e:
+        print(f"Error fetching {symbol}: {e}")
+        return []
+    if resp.get("s") != "ok":
+        print(f"Fyers API error for {symbol}: {resp}")
+        return []
+
+    return [
+        candle_document(symbol, ts, o, h, l, close, vol)
+        for ts, o, h, l, close, vol in resp.get("candles", [])
+    ]
+
 
-    access_token = get_active_fyers_access_token()
-    if not access_token:
-        print("No valid Fyers access token")
+def fetch_and_store_candles():
+    """
+    Reconciles the live 1m bars built by fyers_ingest against the REST history API.
+    Each run re-fetches the minutes since the previous run (plus one of overlap) for
+    every symbol concurrently, then writes all upserts in a single bulk_write.
+    """
+    if not _cycle_lock.acquire(blocking=False):
+        print("Previous candle fetch cycle is still running; skipping this one.")
         return
 
-    fyers = fyersModel.FyersModel(
-        client_id=settings.FYERS_CLIENT_ID,
-        token=access_token,
-        log_path=os.path.join(settings.BASE_DIR, 'logs/')
-    )
-
-    candles_collection = get_candles_collection()
-    now = datetime.now(timezone.utc)
-    one_minute_ago = now - timedelta(minutes=1)
-
-    for symbol in symbol_list:
-        data = {
-            "symbol": symbol,
-            "resolution": "1",   # 1-minute candles
-            "date_format": "0",  # epoch timestamps
-            "range_from": int(one_minute_ago.timestamp()),
-            "range_to": int(now.timestamp()),
-            "cont_flag": "1"
-        }
-
-        try:
-            resp = fyers.history(data)
-        except Exception as e:
-            print(f"Error fetching {symbol}: {e}")
-            continue
-        if resp.get("s") != "ok":
-            print(f"Fyers API error for {symbol}: {resp}")
-            continue
-
-        candles = resp.get("candles", [])
-        for c in candles:
-            ts, o, h, l, close, vol = c
-            candle_doc = {
-                "instrument": symbol,
-                "timestamp": datetime.fromtimestamp(ts, tz=timezone.utc),
-                "resolution": "1m",
-                "open": o,
-                "high": h,
-                "low": l,
-                "close": close,
-                "volume": vol
-            }
-            candles_collection.update_one(
-                {"instrument": symbol, "timestamp": candle_doc["timestamp"], "resolution": "1m"},
-                {"$set": candle_doc},
-                upsert=True
-            )
-        if candles:
-            print(f"Upserted {len(candles)} candles for {symbol}")
+    try:
+        print(f"Fetching 1-minute candles for {len(symbol_list)} symbols from Fyers API...")
+        started = time.perf_counter()
+
+        access_token = get_active_fyers_access_token()
+        if not access_token:
+            print("No valid Fyers access token")
+            return
+
+        now = datetime.now(timezone.utc)
+        window_start = now - timedelta(minutes=settings.FETCH_CANDLES_INTERVAL_MINUTES + 1)
+
+        candles = []
+        with ThreadPoolExecutor(max_workers=settings.FETCH_CANDLES_WORKERS) as pool:
+            futures = [
+                pool.submit(fetch_symbol_candles, symbol, access_token, window_start, now)
+                for symbol in symbol_list
+            ]
+            for future in as_completed(futures):
+                candles.extend(future.result())
+
+        result = upsert_candles(candles)
+        synced = (result.upserted_count + result.modified_count) if result else 0
+        print(f"Upserted {synced} of {len(candles)} candles for {len(symbol_list)} symbols "
+              f"in {time.perf_counter() - started:.1f}s")
+    finally:
+        _cycle_lock.release()
 
 
 class Command(BaseCommand):
-    help = 'Fetches 1-minute candles for Nifty 100 stocks from Fyers API'
+    help = 'Fetches 1-minute candles for Nifty 100 stocks from Fyers API (concurrently, rate limited)'
 
     def handle(self, *args, **options):
         scheduler = BlockingScheduler()
-        # Run every minute at 5 seconds (after the candle closes)
-        scheduler.add_job(fetch_and_store_candles, 'cron', second='5')
+        # Run every FETCH_CANDLES_INTERVAL_MINUTES at 5 seconds past the minute (after the candle closes).
+        # Live bars come from fyers_ingest, so this only needs to catch missed or corrected minutes.
+        interval = settings.FETCH_CANDLES_INTERVAL_MINUTES
+        scheduler.add_job(
+            fetch_and_store_candles, 'cron', minute=f'*/{interval}', second='5',
+            max_instances=1, coalesce=True,
+        )
         self.stdout.write("Starting Nifty100 candle fetch scheduler...")
         scheduler.start()
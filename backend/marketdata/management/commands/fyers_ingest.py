@@ -1,145 +1,180 @@
 import os
-import json
 import time
+import queue
 import logging
-from pathlib import Path
-from datetime import datetime, timezone
+import threading
+import multiprocessing
 
 from django.core.management.base import BaseCommand
 from django.conf import settings
 
-# Use the data_ws module for market data as per the latest fyers_apiv3 docs
-from fyers_apiv3.FyersWebsocket import data_ws 
+from marketdata import metrics
+from marketdata.fyers_stream import FYERS_MAX_SYMBOLS_PER_SOCKET, FyersStream, run_shard_process
+from marketdata.tick_pipeline import TickPipeline
+from marketdata.universe import load_universe, split_into_shards
 from marketdata.utils import get_active_fyers_access_token
-from marketdata.mongo_client import get_ticks_collection
 
 # Setup a dedicated logger for this ingestion script
 logger = logging.getLogger(__name__)
 
-# --- Load Nifty 100 Symbols ---
-try:
-    # Build the path to the data file relative to the project's base directory
-    nifty100_path = Path(settings.BASE_DIR) / 'data' / 'nifty100_symbols.json'
-    nifty100_data = json.loads(nifty100_path.read_text())
-except FileNotFoundError:
-    nifty100_data = []
-    logger.error("FATAL: nifty100_symbols.json not found in the 'data' directory. The service cannot start.")
+
+class ShardSupervisor:
+    """
+    Runs each socket shard in its own process (the Fyers data socket is a per-process
+    singleton) and drains their tick batches into the shared pipeline. Dead shard
+    processes are restarted with a fresh access token.
+    """
+
+    RESTART_BACKOFF_SECONDS = 5
+
+    def __init__(self, shards, client_id, pipeline):
+        self.shards = shards
+        self.client_id = client_id
+        self.pipeline = pipeline
+        self.context = multiprocessing.get_context("spawn")
+        self.queue = self.context.Queue(maxsize=settings.FYERS_SHARD_QUEUE_SIZE)
+        self.processes = {}
+        self.restarts = {shard: 0 for shard in range(len(shards))}
+        self.last_start = {}
+        self._drain_thread = None
+
+    def start(self, access_token):
+        for shard in range(len(self.shards)):
+            self._spawn(shard, access_token)
+        self._drain_thread = threading.Thread(target=self._drain, name="shard-drain", daemon=True)
+        self._drain_thread.start()
+        metrics.register("ingest_shards", self.stats)
+
+    def check(self):
+        """Restart shard processes that exited."""
+        for shard, process in self.processes.items():
+            if process.is_alive():
+                continue
+            if time.monotonic() - self.last_start[shard] < self.RESTART_BACKOFF_SECONDS:
+                continue
+            logger.error(f"Shard {shard} exited with code {process.exitcode}; restarting.")
+            access_token = get_active_fyers_access_token()
+            if not access_token:
+                logger.error("No valid Fyers access token available to restart shard.")
+                continue
+            self.restarts[shard] += 1
+            self._spawn(shard, access_token)
+
+    def stop(self):
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            process.join(5)
+
+    def stats(self):
+        return {
+            str(shard): {
+                "symbols": len(self.shards[shard]),
+                "alive": process.is_alive(),
+                "restarts": self.restarts[shard],
+            }
+            for shard, process in self.processes.items()
+        }
+
+    def _spawn(self, shard, access_token):
+        process = self.context.Process(
+            target=run_shard_process,
+            args=(shard, self.shards[shard], self.client_id, access_token, self.queue),
+            name=f"fyers-shard-{shard}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[shard] = process
+        self.last_start[shard] = time.monotonic()
+
+    def _drain(self):
+        while True:
+            try:
+                shard, documents, dropped = self.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            for document in documents:
+                self.pipeline.process(document, shard)
+            if dropped:
+                self.pipeline.record_dropped(shard, dropped)
+
 
 class Command(BaseCommand):
     help = 'Starts the Fyers WebSocket for live data ingestion into MongoDB (Full Data Mode).'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--universe', default=settings.MARKETDATA_UNIVERSE,
+            help='nifty100, nifty500, a path to a symbols JSON file, or a comma-separated symbol list.'
+        )
+        parser.add_argument(
+            '--symbols-per-shard', type=int, default=settings.FYERS_WS_SYMBOLS_PER_SHARD,
+            help=f'Symbols per socket connection (at most {FYERS_MAX_SYMBOLS_PER_SOCKET}).'
+        )
+
     def handle(self, *args, **options):
-        if not nifty100_data:
-            self.stderr.write(self.style.ERROR("Cannot start ingestion: nifty100_symbols.json is missing or empty."))
+        try:
+            symbols = load_universe(options['universe'])
+        except FileNotFoundError as e:
+            symbols = []
+            logger.error(f"FATAL: universe file not found: {e}")
+        if not symbols:
+            self.stderr.write(self.style.ERROR(f"Cannot start ingestion: universe '{options['universe']}' is missing or empty."))
             return
 
+        per_shard = min(options['symbols_per_shard'], FYERS_MAX_SYMBOLS_PER_SOCKET)
+        shards = split_into_shards(symbols, per_shard)
+
         client_id = settings.FYERS_CLIENT_ID
-        
+
         access_token = get_active_fyers_access_token()
         if not access_token:
             raise RuntimeError("No valid Fyers access token available")
 
-
-        # Prepare the correctly formatted access token for the websocket
-        # Format required by the SDK is: <CLIENT_ID>:<ACCESS_TOKEN>
-        websocket_token = f"{client_id}:{access_token}"
-
-        # Prepare the list of symbols for subscription
-        nifty_100_symbols = [f"NSE:{s['symbol']}-EQ" for s in nifty100_data]
-        self.stdout.write(f"Preparing to subscribe to {len(nifty_100_symbols)} symbols in full data mode.")
-
-        # --- WebSocket Callback Functions ---
-
-        def on_message(tick):
-            """
-            Callback to process incoming messages from the WebSocket.
-            This now correctly handles a single dictionary per message.
-            """
-            if not isinstance(tick, dict):
-                logger.info(f"Received non-tick (control/status) message from WebSocket: {tick}")
-                return # Ignore this message and continue
-
-            ticks_collection = get_ticks_collection()
-            
-            try:
-                # Map all the fields from the sample response to a new document
-                document_to_insert = {
-                    "instrument": tick.get('symbol'),
-                    "timestamp": datetime.fromtimestamp(tick.get('last_traded_time'), tz=timezone.utc),
-                    "price": tick.get('ltp'),
-                    "volume_traded_today": tick.get('vol_traded_today'),
-                    "last_traded_qty": tick.get('last_traded_qty'),
-                    "avg_trade_price": tick.get('avg_trade_price'),
-                    "open": tick.get('open_price'),
-                    "high": tick.get('high_price'),
-                    "low": tick.get('low_price'),
-                    "close": tick.get('prev_close_price'),
-                    "change": tick.get('ch'),
-                    "change_percent": tick.get('chp')
-                }
-                
-                # Insert the single document into MongoDB
-                # ticks_collection.update_one({"instrument": tick.get('symbol'),"timestamp": datetime.fromtimestamp(tick.get('last_traded_time'), tz=timezone.utc)},{"$set":document_to_insert} ,upsert=True)
-                ticks_collection.insert_one(document_to_insert)
-                logger.info(f"Insert tick for {tick.get('symbol')} @ {tick.get('ltp')}")
-
-            except Exception as e:
-                logger.error(f"Error processing a single full-mode tick: {tick}. Error: {e}")
-
-        def on_connect():
-            """
-            Callback for when the WebSocket connection is established.
-            Subscribes to the symbols list.
-            """
-            self.stdout.write(self.style.SUCCESS("✅ Fyers WebSocket connected successfully."))
-            self.stdout.write("Subscribing to Nifty 100 symbols...")
-            fyers_socket.subscribe(symbols=nifty_100_symbols)
-
-        def on_close(message):
-            logger.warning(f"WebSocket connection closed: {message}")
-
-        def on_error(message):
-            """
-            Callback when WebSocket receives an error.
-            If the token is expired, refresh it and reconnect.
-            """
-            logger.error(f"WebSocket error received: {message}")
-            
-            # Check if the error is a token expiration
-            if isinstance(message, dict) and message.get('code') == -99 and message.get('message') == "Token is expired":
-                self.stderr.write(self.style.WARNING("Fyers access token expired. Refreshing token..."))
-                
-                # Refresh access token
-                new_access_token = get_active_fyers_access_token(force_refresh=True)
-                if not new_access_token:
-                    self.stderr.write(self.style.ERROR("Failed to refresh Fyers access token. Exiting."))
-                    fyers_socket.close()
-                    return
-                
-                # Update the websocket token
-                fyers_socket.access_token = f"{client_id}:{new_access_token}"
-                self.stdout.write(self.style.SUCCESS("Reconnecting WebSocket with refreshed token..."))
-                
-                # Reconnect
-                fyers_socket.connect()
-
-
-        # --- Initialize and Connect WebSocket ---
-        fyers_socket = data_ws.FyersDataSocket(
-            access_token=websocket_token,
-            log_path=os.path.join(settings.BASE_DIR, 'logs/'),
-            litemode=False, 
-            write_to_file=False,
-            reconnect=True, 
-            on_connect=on_connect,
-            on_close=on_close,
-            on_error=on_error,
-            on_message=on_message 
+        self.stdout.write(
+            f"Preparing to subscribe to {len(symbols)} symbols in full data mode "
+            f"across {len(shards)} socket connection(s)."
         )
 
+        # --- Start the shared write pipeline before any tick can arrive ---
+        pipeline = TickPipeline()
+        try:
+            resumed = pipeline.start(symbols)
+            self.stdout.write(f"Candle builder resumed {resumed} forming bars.")
+        except Exception as e:
+            logger.error(f"Could not seed candle builder from stored candles: {e}")
+
+        # --- Initialize and Connect WebSocket(s) ---
         self.stdout.write("Attempting to connect to Fyers WebSocket...")
-        fyers_socket.connect()
+        if len(shards) == 1:
+            # A single connection runs in this process, feeding the pipeline directly.
+            stream = FyersStream(
+                0, shards[0], client_id, access_token,
+                on_tick=lambda shard, document: pipeline.process(document, shard),
+                refresh_token=lambda: get_active_fyers_access_token(force_refresh=True),
+                log_path=os.path.join(settings.BASE_DIR, 'logs/'),
+            )
+            stream.connect()
+            supervisor = None
+        else:
+            supervisor = ShardSupervisor(shards, client_id, pipeline)
+            supervisor.start(access_token)
 
         self.stdout.write(self.style.SUCCESS("🚀 Ingestion engine is now running. Press Ctrl+C to stop."))
-        while True:
-            time.sleep(1)
\ No newline at end of file
+        last_stats_log = time.monotonic()
+        try:
+            while True:
+                time.sleep(1)
+                pipeline.flush()
+                if supervisor:
+                    supervisor.check()
+                if time.monotonic() - last_stats_log >= settings.TICK_WRITER_STATS_INTERVAL:
+                    logger.info(f"Ingest stats: {metrics.snapshot()}")
+                    last_stats_log = time.monotonic()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping ingestion, flushing buffered ticks...")
+            if supervisor:
+                supervisor.stop()
+            else:
+                stream.close()
+            pipeline.stop()
@@ -0,0 +1,174 @@
+# backend/marketdata/management/commands/migrate_ticks_timeseries.py
+import logging
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from pymongo.errors import BulkWriteError
+
+from marketdata.mongo_client import (
+    TICKS_TIMESERIES_OPTIONS,
+    ensure_ticks_indexes,
+    get_db,
+)
+
+logger = logging.getLogger(__name__)
+
+TICKS_COLLECTION = "ticks"
+
+
+def _collscan_stages(plan):
+    """Return every COLLSCAN stage found in an explain document, ignoring rejected plans."""
+    found = []
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            found.append(plan)
+        for key, value in plan.items():
+            if key != "rejectedPlans":
+                found.extend(_collscan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            found.extend(_collscan_stages(item))
+    return found
+
+
+def explain_hot_queries(db, instrument):
+    """
+    Explain the three hot tick queries with the same shapes their callers use.
+    Returns a list of (name, explain_document).
+    """
+    ticks = db[TICKS_COLLECTION]
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(minutes=15)
+
+    # marketdata.views.latest_tick_data
+    latest_tick = ticks.find({"instrument": instrument}).sort("timestamp", -1).limit(1).explain()
+
+    # replay_broadcaster.replay_loop
+    replay_window = (
+        ticks.find({"timestamp": {"$gt": cutoff - timedelta(seconds=1), "$lte": cutoff}})
+        .sort("timestamp", 1)
+        .explain()
+    )
+
+    # order_executor.get_latest_market_prices
+    executor_prices = db.command(
+        "aggregate", TICKS_COLLECTION,
+        pipeline=[
+            {"$match": {"timestamp": {"$lte": cutoff}}},
+            {"$sort": {"timestamp": -1}},
+            {"$group": {"_id": "$instrument", "price": {"$first": "$price"}}},
+        ],
+        explain=True,
+    )
+
+    return [
+        ("latest_tick_data", latest_tick),
+        ("replay_loop", replay_window),
+        ("order_executor prices", executor_prices),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Converts the ticks collection into a native MongoDB time-series collection "
+        "(timeField=timestamp, metaField=instrument), creates the indexes the hot tick "
+        "queries need and verifies with explain() that none of them does a COLLSCAN."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Number of documents copied per insert_many.'
+        )
+        parser.add_argument(
+            '--drop-legacy', action='store_true',
+            help='Drop the renamed legacy collection once every document has been copied.'
+        )
+        parser.add_argument(
+            '--check-only', action='store_true',
+            help='Only ensure indexes and run the explain() check; do not migrate.'
+        )
+
+    def handle(self, *args, **options):
+        db = get_db()
+
+        if not options['check_only']:
+            self.migrate(db, options['batch_size'], options['drop_legacy'])
+
+        index_names = ensure_ticks_indexes(db[TICKS_COLLECTION])
+        self.stdout.write(self.style.SUCCESS(f"✅ Tick indexes present: {', '.join(index_names)}"))
+
+        self.check_query_plans(db)
+
+    def migrate(self, db, batch_size, drop_legacy):
+        existing = next(db.list_collections(filter={"name": TICKS_COLLECTION}), None)
+        if existing and existing.get("type") == "timeseries":
+            self.stdout.write("ticks is already a time-series collection. Nothing to migrate.")
+            return
+
+        legacy_name = None
+        if existing:
+            legacy_name = f"{TICKS_COLLECTION}_legacy_{datetime.now(timezone.utc):%Y%m%d%H%M%S}"
+            db[TICKS_COLLECTION].rename(legacy_name)
+            self.stdout.write(f"Renamed existing ticks collection to {legacy_name}.")
+
+        # Create immediately after the rename so a running ingester cannot implicitly
+        # recreate `ticks` as a regular collection in between.
+        db.create_collection(TICKS_COLLECTION, timeseries=TICKS_TIMESERIES_OPTIONS)
+        self.stdout.write(self.style.SUCCESS(f"Created time-series collection ticks {TICKS_TIMESERIES_OPTIONS}."))
+
+        if not legacy_name:
+            return
+
+        legacy = db[legacy_name]
+        target = db[TICKS_COLLECTION]
+        total = legacy.estimated_document_count()
+        copied = failed = 0
+
+        batch = []
+        for doc in legacy.find({}, batch_size=batch_size):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                ok, bad = self._copy_batch(target, batch)
+                copied += ok
+                failed += bad
+                batch = []
+                self.stdout.write(f"  Copied {copied}/{total} ticks...")
+        if batch:
+            ok, bad = self._copy_batch(target, batch)
+            copied += ok
+            failed += bad
+
+        self.stdout.write(self.style.SUCCESS(f"Copied {copied} ticks ({failed} rejected) from {legacy_name}."))
+
+        if drop_legacy:
+            if failed:
+                self.stderr.write(self.style.WARNING(f"Keeping {legacy_name}: {failed} documents could not be copied."))
+            else:
+                legacy.drop()
+                self.stdout.write(f"Dropped {legacy_name}.")
+
+    def _copy_batch(self, target, batch):
+        try:
+            target.insert_many(batch, ordered=False)
+            return len(batch), 0
+        except BulkWriteError as e:
+            # Typically documents without a valid `timestamp`, which a time-series collection rejects.
+            failed = len(e.details.get("writeErrors", []))
+            logger.warning(f"{failed} ticks rejected during migration: {e.details.get('writeErrors', [])[:1]}")
+            return len(batch) - failed, failed
+
+    def check_query_plans(self, db):
+        sample = db[TICKS_COLLECTION].find_one({}, {"instrument": 1})
+        instrument = sample["instrument"] if sample else "NSE:RELIANCE-EQ"
+
+        offenders = []
+        for name, explain in explain_hot_queries(db, instrument):
+            if _collscan_stages(explain):
+                offenders.append(name)
+                self.stderr.write(self.style.ERROR(f"  ✗ {name}: COLLSCAN"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"  ✓ {name}: index-backed"))
+
+        if offenders:
+            raise CommandError(f"Hot tick queries still doing a collection scan: {', '.join(offenders)}")
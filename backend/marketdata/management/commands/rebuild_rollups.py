@@ -0,0 +1,58 @@
+# backend/marketdata/management/commands/rebuild_rollups.py
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+
+from marketdata.mongo_client import get_candles_collection
+from marketdata.ohlc_cache import get_ohlc_cache
+from marketdata.rollups import ROLLUP_LEVELS, update_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the materialized 5m/15m/1h/1D/1W candles from the stored 1m history. "
+        "New 1m candles update their rollups as they are written; this is for history "
+        "written before rollups existed, or to repair them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--instrument', action='append', dest='instruments',
+            help='Fyers symbol to rebuild (repeatable). Defaults to every instrument with 1m candles.'
+        )
+        parser.add_argument(
+            '--days', type=int,
+            help='Only rebuild buckets covering the last N days (default: the full history).'
+        )
+
+    def handle(self, *args, **options):
+        candles = get_candles_collection()
+        match = {"resolution": "1m"}
+        if options['instruments']:
+            match["instrument"] = {"$in": options['instruments']}
+        if options['days']:
+            match["timestamp"] = {"$gte": datetime.now(timezone.utc) - timedelta(days=options['days'])}
+
+        coverage = list(candles.aggregate([
+            {"$match": match},
+            {"$group": {"_id": "$instrument", "first": {"$min": "$timestamp"}, "last": {"$max": "$timestamp"}}},
+            {"$sort": {"_id": 1}},
+        ]))
+        if not coverage:
+            self.stdout.write("No 1m candles found; nothing to rebuild.")
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"🚀 Rebuilding {', '.join(r for r, _, _ in ROLLUP_LEVELS)} candles for {len(coverage)} instruments."
+        ))
+        started = time.perf_counter()
+        for i, doc in enumerate(coverage, start=1):
+            update_rollups([doc["_id"]], doc["first"], doc["last"], candles)
+            # Only reaches other processes when the shared cache is Redis
+            get_ohlc_cache().invalidate([doc["_id"]])
+            self.stdout.write(f"[{i}/{len(coverage)}] {doc['_id']}: {doc['first']:%Y-%m-%d} -> {doc['last']:%Y-%m-%d}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\n✅ Rollups rebuilt in {time.perf_counter() - started:.1f}s."
+        ))
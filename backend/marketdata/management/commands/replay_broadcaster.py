@@ -1,17 +1,31 @@
 # marketdata/replay_broadcaster.py
 import asyncio
+import functools
+import time
 from datetime import datetime, timedelta, timezone
 import re
+from collections import Counter
 from channels.layers import get_channel_layer
-import motor.motor_asyncio  
-from decouple import config
+from django.conf import settings
 
-# MongoDB settings
-MONGO_URI = config("MONGO_DB_URL", default="mongodb://localhost:27017")
-DB_NAME = config("MONGO_DB_NAME", default="marketdata")
-COLLECTION_NAME = "ticks"
+from marketdata import metrics
+from marketdata.conflation import Conflator
+from marketdata.mongo_client import close_async_db, get_async_db
+from marketdata.ohlc import DELAY
+from marketdata.subscriptions import get_subscription_registry
+from marketdata.tick_feed import DelayQueue, get_tick_feed, tick_epoch
+from marketdata.tick_messages import DeltaEncoder, encode_tick
+from marketdata.tick_store import replay_ticks_async
+
+# Longest sleep of the push loop while nothing is due, so newly fed ticks are noticed
+PUSH_IDLE_SLEEP = 0.5
+# Seconds after subscribing during which fed ticks are checked against the startup
+# backfill: a tick written to Mongo before the backfill read reaches the feed within
+# a pipeline flush (about a second), so later ticks can't be duplicates
+PUSH_BACKFILL_OVERLAP = 30.0
 
 # --- normalize instruments so they match frontend subscriptions ---
+@functools.lru_cache(maxsize=4096)
 def _to_group_name(instrument: str) -> str:
     """
     Frontend subscribes with `NSE:{SYMBOL}-EQ`.
@@ -25,49 +39,194 @@ def _to_group_name(instrument: str) -> str:
     # sanitize same as consumer
     return re.sub(r"[^a-zA-Z0-9\-_.]", "_", inst)
 
+async def _send_tick(channel_layer, tick, deltas=None):
+    group = _to_group_name(tick.get("instrument", ""))
+    if not group:
+        return
+    # Encoded once here; consumers forward the text as-is (see marketdata/tick_messages.py)
+    message = {"type": "marketdata.message", "group": group, "text": encode_tick(tick)}
+    if deltas is not None:
+        message["keyframe"], message["delta"] = deltas.encode(tick, time.monotonic())
+    await channel_layer.group_send(group, message)
+
+
+def _group_of(tick):
+    return _to_group_name(tick.get("instrument", ""))
+
+
+async def _send_conflated(conflator, send, ticks, now, registry=None):
+    """
+    Send `ticks` through the conflator, plus any pending messages that are now due.
+    With a subscription registry, ticks of instruments nobody subscribes to are
+    dropped first, before any conflation or payload work.
+    """
+    if registry is not None:
+        ticks = registry.watched(ticks, _group_of)
+    for tick in ticks:
+        for message in conflator.offer(tick, now):
+            await send(message)
+    for message in conflator.due(now):
+        await send(message)
+
+
+def _tick_key(tick):
+    """Identity of a tick in both Mongo and the feed (`_id` may be missing on either side)."""
+    return (
+        tick.get("instrument"),
+        round(tick_epoch(tick) * 1e6) // 1000,  # Mongo keeps milliseconds, truncated
+        tick.get("price"),
+        tick.get("volume_traded_today", tick.get("volume")),
+    )
+
+
+def _earliest(*waits):
+    waits = [w for w in waits if w is not None]
+    return min(waits) if waits else None
+
+
+class PushBroadcaster:
+    """
+    Holds pushed ticks in a DelayQueue and sends each one as soon as it is 15 minutes
+    old, through the per-instrument conflator, skipping instruments without
+    subscribers. Tracks how late releases go out relative to their due time.
+    """
+
+    def __init__(self, queue, send, conflator=None, registry=None):
+        self.queue = queue
+        self.send = send
+        self.conflator = conflator or Conflator(0)
+        self.registry = registry
+        self._backfilled = None   # Counter of _tick_key of the startup backfill, while fed duplicates may arrive
+        self.received = 0
+        self.released = 0
+        self.skipped = 0
+        self.max_lag_ms = 0.0
+        self._lag_total_ms = 0.0
+
+    def backfill(self, ticks):
+        """Queue the ticks read from Mongo at startup; the same ticks arriving from the feed are then skipped."""
+        self._backfilled = Counter()
+        for tick in ticks:
+            self._backfilled[_tick_key(tick)] += 1
+            self.received += 1
+            self.queue.push(tick)
+
+    def end_backfill(self):
+        self._backfilled = None
+
+    def add(self, ticks):
+        """Queue fed ticks, skipping those already queued by the backfill."""
+        for tick in ticks:
+            if self._backfilled:
+                key = _tick_key(tick)
+                if self._backfilled.get(key):
+                    self._backfilled[key] -= 1
+                    self.skipped += 1
+                    continue
+            self.received += 1
+            self.queue.push(tick)
+
+    async def release_due(self, now=None):
+        """Send every due tick; returns the seconds until something is next due (None when idle)."""
+        now = now if now is not None else time.time()
+        due = []
+        for release_at, tick in self.queue.pop_due(now):
+            lag_ms = (now - release_at) * 1000
+            self.released += 1
+            self._lag_total_ms += lag_ms
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            due.append(tick)
+        await _send_conflated(self.conflator, self.send, due, now, self.registry)
+        return _earliest(self.queue.seconds_until_next(now), self.conflator.seconds_until_due(now))
+
+    def stats(self):
+        return {
+            "queued": len(self.queue),
+            "received": self.received,
+            "released": self.released,
+            "skipped": self.skipped,
+            "dropped": self.queue.dropped,
+            "avg_release_lag_ms": round(self._lag_total_ms / self.released, 1) if self.released else 0.0,
+            "max_release_lag_ms": round(self.max_lag_ms, 1),
+        }
+
+
+async def _consume(batches, broadcaster, overlap_until):
+    async for batch in batches:
+        broadcaster.add(batch)
+        if overlap_until is not None and time.time() >= overlap_until:
+            broadcaster.end_backfill()
+            overlap_until = None
+
+
+async def push_loop(db, channel_layer, feed, conflator, registry, deltas):
+    broadcaster = PushBroadcaster(
+        DelayQueue(DELAY, settings.BROADCAST_DELAY_QUEUE_MAX),
+        lambda tick: _send_tick(channel_layer, tick, deltas),
+        conflator,
+        registry,
+    )
+    metrics.register("broadcaster", broadcaster.stats)
+
+    # Subscribe first, then take the ticks still due within the next 15 minutes from
+    # Mongo once. The read waits a writer flush (plus a second for the insert), so
+    # ticks the pipeline handed to the feed before the subscribe are in Mongo by then.
+    # Ticks that are in both are told apart by content, not time: a tick's timestamp
+    # is its exchange time, which says nothing about when it was written or fed.
+    started = time.time()
+    batches = feed.batches(since=started)
+    await asyncio.sleep(settings.TICK_WRITER_FLUSH_INTERVAL + 1.0)
+    read_at = datetime.now(timezone.utc)
+    broadcaster.backfill([tick async for tick in replay_ticks_async(db, read_at - DELAY, read_at)])
+    print(f"Push broadcaster started with {len(broadcaster.queue)} backfilled ticks.")
+
+    consumer = asyncio.create_task(_consume(batches, broadcaster, overlap_until=time.time() + PUSH_BACKFILL_OVERLAP))
+    try:
+        while True:
+            wait = await broadcaster.release_due()
+            await asyncio.sleep(PUSH_IDLE_SLEEP if wait is None else min(wait, PUSH_IDLE_SLEEP))
+    finally:
+        consumer.cancel()
+
+
+async def poll_loop(db, channel_layer, conflator, registry, deltas):
+    """The original broadcaster: re-reads the last second of delayed ticks from Mongo every second."""
+    last_broadcast_time = datetime.now(timezone.utc) - timedelta(minutes=15)
+    send = lambda tick: _send_tick(channel_layer, tick, deltas)
+
+    while True:
+        start_time = last_broadcast_time
+        end_time = datetime.now(timezone.utc) - timedelta(minutes=15)
+
+        if start_time < end_time:
+            # Reads either tick layout (see marketdata/tick_store.py)
+            ticks = [tick async for tick in replay_ticks_async(db, start_time, end_time)]
+            await _send_conflated(conflator, send, ticks, time.time(), registry)
+
+            last_broadcast_time = end_time
+
+        await asyncio.sleep(1)
+
+
 async def replay_loop():
-    # 👈 Move client creation inside try so it's managed correctly
-    client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI) 
-    print("Starting 15-minute delay broadcaster (in-process)...")
+    print(f"Starting 15-minute delay broadcaster (in-process, source: {settings.BROADCAST_SOURCE})...")
     
     try:
-        db = client[DB_NAME]
-        ticks_collection = db[COLLECTION_NAME]
+        db = get_async_db()
         channel_layer = get_channel_layer()
 
-        last_broadcast_time = datetime.now(timezone.utc) - timedelta(minutes=15)
+        conflator = Conflator(settings.BROADCAST_MAX_UPDATES_PER_SECOND)
+        metrics.register(conflator.name, conflator.stats)
+        registry = get_subscription_registry() if settings.BROADCAST_SKIP_UNWATCHED else None
+        deltas = None
+        if settings.WS_COMPACT_STREAM:
+            deltas = DeltaEncoder(settings.WS_KEYFRAME_INTERVAL)
+            metrics.register(deltas.name, deltas.stats)
 
-        while True:
-            start_time = last_broadcast_time
-            end_time = datetime.now(timezone.utc) - timedelta(minutes=15)
-
-            if start_time < end_time:
-                cursor = (
-                    ticks_collection
-                    .find({"timestamp": {"$gt": start_time, "$lte": end_time}})
-                    .sort("timestamp", 1)
-                )
-
-                async for tick in cursor:
-                    group = _to_group_name(tick.get("instrument", ""))
-                    if not group:
-                        continue
-                    
-                    val = dict(tick)
-                    val["_id"] = str(val.get("_id", ""))
-                    ts = val.get("timestamp")
-                    if isinstance(ts, datetime):
-                        val["timestamp"] = ts.isoformat()
-                    val["type"] = "tick"
-
-                    await channel_layer.group_send(
-                        group,
-                        {"type": "marketdata.message", "message": val},
-                    )
-                
-                last_broadcast_time = end_time
-
-            await asyncio.sleep(1)
+        if settings.BROADCAST_SOURCE == "poll":
+            await poll_loop(db, channel_layer, conflator, registry, deltas)
+        else:
+            await push_loop(db, channel_layer, get_tick_feed(), conflator, registry, deltas)
 
     except asyncio.CancelledError:
         print("Broadcaster task is being cancelled.")
@@ -77,7 +236,7 @@ async def replay_loop():
         
     finally:
         print("Closing MongoDB connection and shutting down broadcaster.")
-        client.close() # 👈 Close the client connection
+        close_async_db()
 
 # _broadcaster_task = None
 # _task_lock = asyncio.Lock()
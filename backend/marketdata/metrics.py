@@ -0,0 +1,122 @@
+# backend/marketdata/metrics.py
+"""
+Runtime counters of the market-data components, collected per process.
+
+When REDIS_URL is set, every process that registers a provider also publishes its
+snapshot to Redis every METRICS_PUBLISH_INTERVAL seconds (`metrics:process:<host>:<pid>`,
+expiring after three intervals). With the background loops running as their own
+processes, the admin metrics endpoint of any ASGI worker can then show the ingest,
+broadcaster and executor counters too.
+"""
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PROCESS_KEY_PREFIX = "metrics:process:"
+
+# name -> zero-argument callable returning a JSON-serialisable dict of counters
+_providers = {}
+_lock = threading.Lock()
+_publisher = None
+
+
+def register(name, provider):
+    """
+    Register a stats provider under `name`.
+    Re-registering a name replaces the previous provider (e.g. after a restart of the component).
+    """
+    with _lock:
+        _providers[name] = provider
+    _start_publisher()
+
+
+def unregister(name):
+    with _lock:
+        _providers.pop(name, None)
+
+
+def snapshot():
+    """Collect the current counters of every registered component."""
+    with _lock:
+        providers = dict(_providers)
+
+    data = {}
+    for name, provider in providers.items():
+        try:
+            data[name] = provider()
+        except Exception as e:
+            logger.error(f"Metrics provider '{name}' failed: {e}")
+            data[name] = {"error": str(e)}
+    return data
+
+
+# --- Sharing between processes ---
+
+def process_label():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def publish(client, ttl):
+    """Write this process's snapshot to Redis, expiring after `ttl` seconds."""
+    payload = {
+        "command": " ".join([os.path.basename(sys.argv[0])] + sys.argv[1:2]),
+        "published_at": time.time(),
+        "metrics": snapshot(),
+    }
+    client.set(PROCESS_KEY_PREFIX + process_label(), json.dumps(payload, default=str), ex=max(1, round(ttl)))
+
+
+def shared_snapshots(client):
+    """{process label: published payload} of every process that published recently."""
+    keys = sorted(client.scan_iter(match=PROCESS_KEY_PREFIX + "*", count=100))
+    if not keys:
+        return {}
+    return {
+        key.decode()[len(PROCESS_KEY_PREFIX):]: json.loads(value)
+        for key, value in zip(keys, client.mget(keys))
+        if value
+    }
+
+
+def process_snapshots():
+    """shared_snapshots from REDIS_URL, or None when there is no Redis or it is unreachable."""
+    if not settings.REDIS_URL:
+        return None
+    try:
+        return shared_snapshots(redis.Redis.from_url(settings.REDIS_URL))
+    except Exception as e:
+        logger.warning(f"Could not read the metrics of other processes: {e}")
+        return None
+
+
+def _start_publisher():
+    global _publisher
+    interval = settings.METRICS_PUBLISH_INTERVAL
+    if not settings.REDIS_URL or interval <= 0:
+        return
+    with _lock:
+        if _publisher is not None:
+            return
+        _publisher = threading.Thread(
+            target=_publish_forever, args=(settings.REDIS_URL, interval), daemon=True, name="metrics-publisher"
+        )
+    _publisher.start()
+
+
+def _publish_forever(url, interval):
+    client = redis.Redis.from_url(url)
+    while True:
+        try:
+            publish(client, ttl=interval * 3)
+        except Exception as e:
+            logger.warning(f"Could not publish metrics to Redis: {e}")
+        time.sleep(interval)
@@ -1,25 +1,129 @@
 # backend/marketdata/mongo_client.py
+import asyncio
+import weakref
+
+import motor.motor_asyncio
 from pymongo import MongoClient
 from django.conf import settings
 
 _client = None
+_db = None
+# Motor clients are bound to the event loop they first run on, so async callers
+# share one client per loop (a single one under Daphne).
+_async_clients = weakref.WeakKeyDictionary()
+
+# `ticks` is a native time-series collection (see the migrate_ticks_timeseries command).
+TICKS_TIMESERIES_OPTIONS = {"timeField": "timestamp", "metaField": "instrument", "granularity": "seconds"}
+
+# Secondary indexes the hot tick queries rely on:
+#   latest_tick_data                       -> {instrument}, sorted by timestamp desc
+#   replay_broadcaster.replay_loop         -> timestamp range, sorted by timestamp asc
+#   order_executor.get_latest_market_prices -> timestamp <= cutoff, sorted by timestamp desc
+TICKS_INDEXES = [
+    ([("instrument", 1), ("timestamp", -1)], {"name": "instrument_1_timestamp_-1"}),
+    ([("timestamp", 1)], {"name": "timestamp_1"}),
+]
+
+# Bucketed tick layout (TICK_STORAGE_MODE = "buckets", see marketdata/tick_store.py):
+#   upsert target / latest tick -> {instrument, minute}, latest minute first
+#   replay / latest prices      -> minute range
+TICK_BUCKETS_INDEXES = [
+    ([("instrument", 1), ("minute", -1)], {"name": "instrument_1_minute_-1"}),
+    ([("minute", 1)], {"name": "minute_1"}),
+]
+
+# Indexes of the candles collection:
+#   upserts (candles.upsert_candles)        -> unique {instrument, timestamp, resolution}
+#   ohlc_data range and cursor queries      -> equality on instrument + resolution, range/sort on timestamp
+CANDLES_INDEXES = [
+    ([("instrument", 1), ("timestamp", -1), ("resolution", 1)],
+     {"name": "instrument_1_timestamp_-1_resolution_1", "unique": True}),
+    ([("instrument", 1), ("resolution", 1), ("timestamp", 1)],
+     {"name": "instrument_1_resolution_1_timestamp_1"}),
+]
+
+def client_options():
+    """
+    Connection options shared by the pymongo and Motor clients, from the MONGO_* settings.
+    Compressors whose Python package is missing are skipped by the driver with a warning.
+    """
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": settings.MONGO_SOCKET_TIMEOUT_MS or None,
+        "readPreference": settings.MONGO_READ_PREFERENCE,
+    }
+    if settings.MONGO_COMPRESSORS:
+        options["compressors"] = ",".join(settings.MONGO_COMPRESSORS)
+    return options
 
 def get_mongo_client():
     global _client
     if _client is None:
-        _client = MongoClient(settings.MONGO_DB_URL)
+        _client = MongoClient(settings.MONGO_DB_URL, **client_options())
     return _client
 
 def get_db():
-    client = get_mongo_client()
+    global _db
+    if _db is None:
+        _db = get_mongo_client()[settings.MONGO_DB_NAME]
+    return _db
+
+def get_async_db():
+    """The Motor database of the running event loop, for the async market-data readers."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = motor.motor_asyncio.AsyncIOMotorClient(
+            settings.MONGO_DB_URL, **client_options()
+        )
     return client[settings.MONGO_DB_NAME]
 
+def close_async_db():
+    """Close the Motor client of the running event loop, e.g. before the loop shuts down."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        client.close()
+
+# Collection getters are plain attribute lookups on the cached database; indexes are
+# created once by ensure_market_indexes (the ensure_market_indexes command, and the
+# ingest at startup), never per call.
+
 def get_ticks_collection():
-    db = get_db()
-    return db.ticks
+    return get_db().ticks
+
+def get_tick_buckets_collection():
+    return get_db().tick_buckets
 
 def get_candles_collection():
-    db = get_db()
-    # Create indexes for efficient querying
-    db.candles.create_index([("instrument", 1), ("timestamp", -1), ("resolution", 1)], unique=True)
-    return db.candles
\ No newline at end of file
+    return get_db().candles
+
+def _ensure(collection, indexes):
+    return [collection.create_index(keys, **options) for keys, options in indexes]
+
+def ensure_ticks_indexes(collection=None):
+    """Create the tick indexes if missing. Returns the index names."""
+    return _ensure(collection if collection is not None else get_ticks_collection(), TICKS_INDEXES)
+
+def ensure_tick_buckets_indexes(collection=None):
+    """Create the tick bucket indexes if missing. Returns the index names."""
+    return _ensure(collection if collection is not None else get_tick_buckets_collection(), TICK_BUCKETS_INDEXES)
+
+def ensure_candles_indexes(collection=None):
+    """Create the candle indexes if missing. Returns the index names."""
+    return _ensure(collection if collection is not None else get_candles_collection(), CANDLES_INDEXES)
+
+def ensure_market_indexes(tick_storage_mode=None):
+    """
+    Create every index the market-data readers and writers rely on: candles, plus the
+    tick layout in use (TICK_STORAGE_MODE). Idempotent. Returns {collection: index names}.
+    """
+    mode = tick_storage_mode or settings.TICK_STORAGE_MODE
+    indexes = {"candles": ensure_candles_indexes()}
+    if mode == "buckets":
+        indexes["tick_buckets"] = ensure_tick_buckets_indexes()
+    else:
+        indexes["ticks"] = ensure_ticks_indexes()
+    return indexes
@@ -0,0 +1,202 @@
+# backend/marketdata/ohlc.py
+"""
+Query building for the OHLC endpoint, kept apart from the view so every way of
+serving it runs the same queries.
+
+Request parameters (all times are epoch milliseconds, like the `time` of a bar):
+  from    first bar start to include
+  to      last bar start to include
+  before  cursor: only bars starting strictly earlier (the X-Next-Before of the previous page)
+  limit   return at most this many bars, the newest ones in the range
+  since   polling: only bars starting at or after this time, including the forming bar
+
+Bars never extend past the 15-minute delay cutoff. Queries are served by the
+(instrument, resolution, timestamp) index.
+"""
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+
+from .rollups import ROLLUP_SECONDS, bucket_start, ohlcv_group
+
+RESOLUTIONS = ("1m", *ROLLUP_SECONDS)
+
+DELAY = timedelta(minutes=15)
+
+# Bars travel as columns (one list per field), so the cache and the binary encodings
+# never need a dict per bar.
+BAR_FIELDS = ("open", "high", "low", "close", "volume")
+COLUMNS = ("time", *BAR_FIELDS)
+
+CANDLE_PROJECTION = {"_id": 0, "timestamp": 1, **{field: 1 for field in BAR_FIELDS}}
+
+
+def _from_ms(value, name):
+    try:
+        return datetime.fromtimestamp(int(value) / 1000, tz=timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValueError(f"'{name}' must be an epoch timestamp in milliseconds")
+
+
+def to_ms(timestamp):
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return int(timestamp.timestamp() * 1000)
+
+
+def parse_ohlc_params(params, now=None):
+    """Validate the query parameters into a query dict. Raises ValueError with a client-facing message."""
+    symbol = params.get('instrument')
+    resolution = params.get('resolution', '1D')
+    if not symbol:
+        raise ValueError("Instrument symbol is required")
+    if resolution not in RESOLUTIONS:
+        raise ValueError("Invalid resolution")
+
+    query = {
+        "instrument": f"NSE:{symbol.upper()}-EQ",
+        "resolution": resolution,
+        "cutoff": (now or datetime.now(timezone.utc)) - DELAY,
+        "start": None,
+        "end": None,
+        "before": None,
+        "limit": None,
+        "since": None,
+    }
+    for param, key in (("from", "start"), ("to", "end"), ("before", "before"), ("since", "since")):
+        if params.get(param) not in (None, ""):
+            query[key] = _from_ms(params[param], param)
+    if params.get("limit") not in (None, ""):
+        try:
+            limit = int(params["limit"])
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise ValueError("'limit' must be a positive integer")
+        query["limit"] = min(limit, settings.OHLC_MAX_LIMIT)
+    return query
+
+
+def forming_bar_start(query):
+    """Start of the rollup bar still forming at the cutoff, or None if it is not requested."""
+    if query["resolution"] == "1m":
+        return None
+    start = bucket_start(query["cutoff"], ROLLUP_SECONDS[query["resolution"]])
+    if query["start"] and start < query["start"]:
+        return None
+    if query["since"] and start < query["since"]:
+        return None
+    if query["end"] and start > query["end"]:
+        return None
+    if query["before"] and start >= query["before"]:
+        return None
+    return start
+
+
+def stored_upper_bound(query):
+    """
+    Exclusive upper bound of the stored bars a query reads: 1m candles up to the
+    cutoff minute, or rollup bars closed before the forming one, clamped by to/before.
+    """
+    if query["resolution"] == "1m":
+        upper = query["cutoff"].replace(second=0, microsecond=0) + timedelta(minutes=1)
+    else:
+        upper = bucket_start(query["cutoff"], ROLLUP_SECONDS[query["resolution"]])
+    if query["end"]:
+        upper = min(upper, query["end"] + timedelta(milliseconds=1))
+    if query["before"]:
+        upper = min(upper, query["before"])
+    return upper
+
+
+def stored_bars_query(query, after=None):
+    """
+    (filter, sort, limit) for the stored bars of a query: 1m candles or closed rollup
+    bars. With a limit the newest bars are read, descending. `after` only reads the
+    bars from that time on, ascending and unlimited, to extend an earlier read.
+    """
+    timestamp = {"$lt": stored_upper_bound(query)}
+    lower = max([t for t in (query["start"], query["since"], after) if t], default=None)
+    if lower:
+        timestamp["$gte"] = lower
+
+    filter_ = {"instrument": query["instrument"], "resolution": query["resolution"], "timestamp": timestamp}
+    if query["limit"] is None or after is not None:
+        return filter_, [("timestamp", 1)], None
+    return filter_, [("timestamp", -1)], query["limit"]
+
+
+def forming_bar_pipeline(query, forming_start):
+    """Fold the 1m candles of the forming bar, up to the cutoff, into a single bar."""
+    return [
+        {"$match": {
+            "instrument": query["instrument"],
+            "resolution": "1m",
+            "timestamp": {"$gte": forming_start, "$lte": query["cutoff"]}
+        }},
+        {"$sort": {"timestamp": 1}},
+        ohlcv_group(None),
+    ]
+
+
+def empty_columns():
+    return {column: [] for column in COLUMNS}
+
+
+def bar_count(columns):
+    return len(columns["time"])
+
+
+def concat_columns(first, second):
+    return {column: first[column] + second[column] for column in COLUMNS}
+
+
+def tail_columns(columns, count):
+    """The last `count` bars (a copy; the input is never modified)."""
+    start = max(bar_count(columns) - count, 0)
+    return {column: values[start:] for column, values in columns.items()}
+
+
+def shape_bars(documents, descending=False):
+    """Stored bar documents -> response columns (epoch ms `time`), oldest first."""
+    columns = empty_columns()
+    time_column = columns["time"]
+    field_columns = [(field, columns[field]) for field in BAR_FIELDS]
+    for candle in documents:
+        time_column.append(to_ms(candle["timestamp"]))
+        for field, values in field_columns:
+            values.append(candle.get(field))
+    if descending:
+        for values in columns.values():
+            values.reverse()
+    return columns
+
+
+def shape_forming_bar(documents, forming_start):
+    columns = empty_columns()
+    for candle in documents:
+        columns["time"].append(to_ms(forming_start))
+        for field in BAR_FIELDS:
+            columns[field].append(candle.get(field))
+    return columns
+
+
+def page(query, stored, forming):
+    """
+    Combine stored bars and the forming bar into the response columns, honouring the
+    limit. Returns (columns, next_before): the cursor for the next older page, or None
+    when the range is exhausted. Neither input is modified.
+    """
+    if query["limit"] is not None:
+        stored = tail_columns(stored, query["limit"] - bar_count(forming))
+    columns = concat_columns(stored, forming)
+
+    next_before = None
+    if query["limit"] is not None and bar_count(columns) and bar_count(columns) >= query["limit"]:
+        next_before = columns["time"][0]
+    return columns, next_before
+
+
+def columns_to_rows(columns):
+    """The original response shape: one {"open", ..., "time"} dict per bar."""
+    return [dict(zip(COLUMNS, values)) for values in zip(*(columns[c] for c in COLUMNS))]
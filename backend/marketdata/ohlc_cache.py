@@ -0,0 +1,334 @@
+# backend/marketdata/ohlc_cache.py
+"""
+Two-tier cache of the stored (closed) OHLC bars behind ohlc_data.
+
+An in-process LRU sits in front of the shared Django cache (Redis when REDIS_URL is
+set). Entries are keyed by instrument, resolution and request window and remember
+the upper bound they were read up to. When the delay cutoff has moved on, only the
+bars between that bound and the new one are read and appended. The forming bar is
+never cached.
+
+Each instrument has a generation counter in the shared cache. It is bumped whenever
+a 1m candle old enough to be visible is (re)written, which invalidates every cached
+entry of that instrument, and the time of the bump is kept next to it for
+Last-Modified. Live candles newer than the cutoff need no invalidation: they are
+picked up when an entry is extended past them.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics, ohlc
+
+logger = logging.getLogger(__name__)
+
+
+class OhlcCache:
+    def __init__(self, lru_size=256, max_bars=20000, ttl=3600, alias="default", name="ohlc_cache"):
+        self.lru_size = lru_size
+        self.max_bars = max_bars
+        self.ttl = ttl
+        self.alias = alias
+        self.name = name
+
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.lru_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.extensions = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.uncacheable = 0
+        self.shared_errors = 0
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def key(query):
+        window = "/".join(
+            str(ohlc.to_ms(query[k])) if query[k] else "" for k in ("start", "end", "before")
+        )
+        return f"ohlc:{query['instrument']}:{query['resolution']}:{window}:{query['limit'] or ''}"
+
+    @staticmethod
+    def generation_key(instrument):
+        return f"ohlc:gen:{instrument}"
+
+    @staticmethod
+    def changed_at_key(instrument):
+        return f"ohlc:changed:{instrument}"
+
+    def generation(self, instrument):
+        """
+        Current generation of an instrument, or None if the shared cache is unreachable.
+        A missing counter (first use, or evicted) restarts from the clock, so entries
+        from before the loss can never match again.
+        """
+        return self.version(instrument)[0]
+
+    def version(self, instrument):
+        """(generation, changed_at): changed_at is the epoch time of the last invalidation, or None."""
+        key, changed_key = self.generation_key(instrument), self.changed_at_key(instrument)
+        try:
+            found = self.shared.get_many([key, changed_key])
+            generation = found.get(key)
+            if generation is None:
+                self.shared.add(key, time.time_ns(), None)
+                generation = self.shared.get(key)
+            return generation, found.get(changed_key)
+        except Exception as e:
+            self._shared_failed(e)
+            return None, None
+
+    def get(self, query):
+        """(entry, generation): the cached entry, or None if missing or invalidated."""
+        key = self.key(query)
+        generation = self.generation(query["instrument"])
+        if generation is None:
+            return None, None
+
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                self._lru.move_to_end(key)
+        tier = "lru"
+        if entry is None:
+            tier = "shared"
+            try:
+                entry = self.shared.get(key)
+            except Exception as e:
+                self._shared_failed(e)
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None, generation
+            if entry["generation"] != generation:
+                self.stale += 1
+                self._lru.pop(key, None)
+                return None, generation
+            if tier == "lru":
+                self.lru_hits += 1
+            else:
+                self.shared_hits += 1
+                self._remember(key, entry)
+        return entry, generation
+
+    def set(self, query, entry):
+        if ohlc.bar_count(entry["bars"]) > self.max_bars:
+            with self._lock:
+                self.uncacheable += 1
+            return
+        key = self.key(query)
+        with self._lock:
+            self._remember(key, entry)
+        try:
+            self.shared.set(key, entry, self.ttl)
+        except Exception as e:
+            self._shared_failed(e)
+
+    def invalidate(self, instruments):
+        """Bump the generation of each instrument, dropping its cached entries everywhere."""
+        for instrument in instruments:
+            key = self.generation_key(instrument)
+            try:
+                self.shared.add(key, time.time_ns(), None)
+                self.shared.incr(key)
+                self.shared.set(self.changed_at_key(instrument), time.time(), None)
+            except Exception as e:
+                self._shared_failed(e)
+            prefix = f"ohlc:{instrument}:"
+            with self._lock:
+                self.invalidations += 1
+                for cached in [k for k in self._lru if k.startswith(prefix)]:
+                    del self._lru[cached]
+
+    def record_extension(self):
+        with self._lock:
+            self.extensions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.lru_hits + self.shared_hits + self.misses + self.stale
+            return {
+                "lru_size": len(self._lru),
+                "lru_capacity": self.lru_size,
+                "lru_hits": self.lru_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_ratio": round((self.lru_hits + self.shared_hits) / lookups, 3) if lookups else 0,
+                "extensions": self.extensions,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "uncacheable": self.uncacheable,
+                "shared_errors": self.shared_errors,
+            }
+
+    def _remember(self, key, entry):
+        # Caller holds self._lock
+        self._lru[key] = entry
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+            self.evictions += 1
+
+    def _shared_failed(self, error):
+        with self._lock:
+            self.shared_errors += 1
+        logger.warning(f"{self.name}: shared cache unavailable: {error}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_ohlc_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = OhlcCache(
+                lru_size=settings.OHLC_CACHE_LRU_SIZE,
+                max_bars=settings.OHLC_CACHE_MAX_BARS,
+                ttl=settings.OHLC_CACHE_TTL,
+            )
+            metrics.register(_cache.name, _cache.stats)
+        return _cache
+
+
+def read_stored_bars(query, collection):
+    """The stored bars of a query straight from Mongo, as response columns, oldest first."""
+    filter_, sort, limit = ohlc.stored_bars_query(query)
+    cursor = collection.find(filter_, ohlc.CANDLE_PROJECTION).sort(sort)
+    return ohlc.shape_bars(cursor.limit(limit) if limit else cursor, descending=limit is not None)
+
+
+async def read_stored_bars_async(query, db):
+    """Motor version of `read_stored_bars`; `db` is a motor database."""
+    filter_, sort, limit = ohlc.stored_bars_query(query)
+    cursor = db.candles.find(filter_, ohlc.CANDLE_PROJECTION).sort(sort)
+    docs = await (cursor.limit(limit) if limit else cursor).to_list(None)
+    return ohlc.shape_bars(docs, descending=limit is not None)
+
+
+def _lookup(query, cache):
+    """(cached bars or None, entry, generation, upper) for `query`."""
+    upper = ohlc.stored_upper_bound(query)
+    entry, generation = cache.get(query)
+    if entry is not None and entry["upper"] == upper:
+        return entry["bars"], entry, generation, upper
+    if entry is not None and entry["upper"] > upper:
+        entry = None
+    return None, entry, generation, upper
+
+
+def _extend(query, entry, new_bars, cache):
+    bars = ohlc.concat_columns(entry["bars"], new_bars)
+    if query["limit"] is not None:
+        bars = ohlc.tail_columns(bars, query["limit"])
+    cache.record_extension()
+    return bars
+
+
+def _remember(query, bars, generation, upper, cache):
+    if generation is not None:
+        cache.set(query, {"generation": generation, "upper": upper, "bars": bars})
+    return bars
+
+
+def stored_bars(query, collection, cache=None):
+    """
+    The stored bars of a query as response columns (oldest first), served from the cache
+    where possible. The returned columns are shared with the cache and must not be modified.
+    """
+    if query["since"] is not None:
+        # Polls move `since` forward on every call and read only a few bars from the
+        # index; caching them would just churn the LRU.
+        return read_stored_bars(query, collection)
+
+    cache = cache or get_ohlc_cache()
+    bars, entry, generation, upper = _lookup(query, cache)
+    if bars is not None:
+        return bars
+
+    if entry is not None:
+        # Only the bars that became visible since the entry was read
+        filter_, sort, _ = ohlc.stored_bars_query(query, after=entry["upper"])
+        bars = _extend(query, entry, ohlc.shape_bars(collection.find(filter_, ohlc.CANDLE_PROJECTION).sort(sort)), cache)
+    else:
+        bars = read_stored_bars(query, collection)
+    return _remember(query, bars, generation, upper, cache)
+
+
+async def stored_bars_async(query, db, cache=None):
+    """
+    Motor version of `stored_bars`. The shared tier is Redis behind a blocking client,
+    so the lookup and the store each run in one worker-thread hop, off the event loop.
+    """
+    if query["since"] is not None:
+        return await read_stored_bars_async(query, db)
+
+    cache = cache or get_ohlc_cache()
+    bars, entry, generation, upper = await sync_to_async(_lookup, thread_sensitive=False)(query, cache)
+    if bars is not None:
+        return bars
+
+    if entry is not None:
+        filter_, sort, _ = ohlc.stored_bars_query(query, after=entry["upper"])
+        docs = await db.candles.find(filter_, ohlc.CANDLE_PROJECTION).sort(sort).to_list(None)
+        bars = _extend(query, entry, ohlc.shape_bars(docs), cache)
+    else:
+        bars = await read_stored_bars_async(query, db)
+    return await sync_to_async(_remember, thread_sensitive=False)(query, bars, generation, upper, cache)
+
+
+def series_version(query, variant="", cache=None):
+    """
+    (etag, last_modified) of a query's response in one encoding (`variant`), or None
+    when the shared cache is unreachable. Visible candles are minute-aligned and any
+    rewrite of them bumps the generation, so the response only changes with the
+    generation or the cutoff minute; no Mongo read is needed to answer a conditional GET.
+    """
+    cache = cache or get_ohlc_cache()
+    generation, changed_at = cache.version(query["instrument"])
+    if generation is None:
+        return None
+    cutoff_minute = query["cutoff"].replace(second=0, microsecond=0)
+    since = ohlc.to_ms(query["since"]) if query["since"] else ""
+    digest = hashlib.sha1(
+        f"{cache.key(query)}:{since}:{variant}:{generation}:{ohlc.to_ms(cutoff_minute)}".encode()
+    ).hexdigest()
+    # The series last changed when the delay cutoff crossed into the current minute, or
+    # when a visible candle was rewritten after that. HTTP dates have whole seconds, so
+    # a rewrite is rounded up: it must move Last-Modified past a response served in the
+    # same second.
+    last_modified = (cutoff_minute + ohlc.DELAY).timestamp()
+    if changed_at is not None:
+        last_modified = max(last_modified, math.ceil(changed_at))
+    return f'"{digest[:20]}"', last_modified
+
+
+def invalidate_for_candles(candles):
+    """Invalidate the instruments whose written 1m candles are already visible through the delay."""
+    cutoff = datetime.now(timezone.utc) - ohlc.DELAY
+    instruments = {
+        c["instrument"]
+        for c in candles
+        if c["resolution"] == "1m"
+        and (c["timestamp"] if c["timestamp"].tzinfo else c["timestamp"].replace(tzinfo=timezone.utc)) <= cutoff
+    }
+    if instruments:
+        get_ohlc_cache().invalidate(instruments)
@@ -0,0 +1,62 @@
+# backend/marketdata/quotes.py
+"""
+Batch quotes: the latest 15-minute delayed tick of many instruments in one call.
+
+Quotes come from the delayed snapshots (marketdata/snapshots.py) when a feed keeps
+them current; instruments missing there are read with a single $in query on the
+stored ticks, never one query per symbol.
+"""
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+
+from . import tick_store
+from .ohlc import DELAY
+from .snapshots import get_snapshot_store
+
+
+def to_instrument(symbol):
+    """Watchlist symbol (RELIANCE) -> stored instrument name (NSE:RELIANCE-EQ)."""
+    return f"NSE:{symbol.upper()}-EQ"
+
+
+def parse_symbols(value, max_count):
+    """
+    The de-duplicated symbols of a comma-separated `instruments` parameter, in request order.
+    Raises ValueError when there are none or more than `max_count`.
+    """
+    symbols = list(dict.fromkeys(s.strip().upper() for s in (value or "").split(",") if s.strip()))
+    if not symbols:
+        raise ValueError("At least one instrument symbol is required")
+    if len(symbols) > max_count:
+        raise ValueError(f"At most {max_count} instruments can be quoted at once")
+    return symbols
+
+
+def _snapshot_quotes(instruments, snapshots):
+    """The delayed snapshot ticks of `instruments`, and the instruments not found there."""
+    found = snapshots.latest_many(instruments, delayed=True) if snapshots.available() else {}
+    return found, [instrument for instrument in instruments if instrument not in found]
+
+
+def delayed_quotes(symbols, snapshots=None, collection=None):
+    """{symbol: tick document} of the latest delayed tick of each symbol that has one."""
+    instruments = {to_instrument(symbol): symbol for symbol in symbols}
+    found, missing = _snapshot_quotes(instruments, snapshots or get_snapshot_store())
+    if missing:
+        cutoff = datetime.now(timezone.utc) - DELAY
+        found.update(tick_store.latest_ticks(cutoff, collection=collection, instruments=missing))
+    return {instruments[instrument]: tick for instrument, tick in found.items()}
+
+
+async def delayed_quotes_async(symbols, db, snapshots=None):
+    """Motor version of `delayed_quotes`; `db` is a motor database."""
+    instruments = {to_instrument(symbol): symbol for symbol in symbols}
+    # The shared snapshots are read with a blocking Redis client, off the event loop
+    found, missing = await sync_to_async(_snapshot_quotes, thread_sensitive=False)(
+        list(instruments), snapshots or get_snapshot_store()
+    )
+    if missing:
+        cutoff = datetime.now(timezone.utc) - DELAY
+        found.update(await tick_store.latest_ticks_async(db, cutoff, instruments=missing))
+    return {instruments[instrument]: tick for instrument, tick in found.items()}
@@ -0,0 +1,74 @@
+# backend/marketdata/rate_limit.py
+import threading
+import time
+
+from django.conf import settings
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per `per` seconds, bursting up to `capacity`."""
+
+    def __init__(self, rate, per=1.0, capacity=None):
+        self.rate = rate / per
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now, tokens=1):
+        """Seconds until `tokens` are available (0 if they already are)."""
+        self._refill(now)
+        missing = tokens - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def consume(self, tokens=1):
+        self.tokens -= tokens
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter enforcing several token buckets at once, e.g. a per-second and
+    a per-minute limit. `acquire()` blocks until every bucket has a token and then takes
+    one from each.
+    """
+
+    def __init__(self, limits):
+        self.buckets = [TokenBucket(count, per) for count, per in limits]
+        self._lock = threading.Lock()
+        self.acquired = 0
+        self.waited_seconds = 0.0
+
+    def acquire(self, tokens=1):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = max(bucket.wait_time(now, tokens) for bucket in self.buckets)
+                if wait <= 0:
+                    for bucket in self.buckets:
+                        bucket.consume(tokens)
+                    self.acquired += tokens
+                    return
+                self.waited_seconds += wait
+            time.sleep(wait)
+
+
+_fyers_limiter = None
+_fyers_limiter_lock = threading.Lock()
+
+
+def get_fyers_rate_limiter():
+    """
+    Process-wide limiter for Fyers REST calls, shared by every command and worker
+    thread so their combined request rate stays inside Fyers' published API limits.
+    """
+    global _fyers_limiter
+    with _fyers_limiter_lock:
+        if _fyers_limiter is None:
+            _fyers_limiter = RateLimiter([
+                (settings.FYERS_API_RATE_PER_SECOND, 1),
+                (settings.FYERS_API_RATE_PER_MINUTE, 60),
+            ])
+        return _fyers_limiter
@@ -0,0 +1,88 @@
+# backend/marketdata/renderers.py
+"""
+Encodings of the OHLC endpoint, chosen by DRF content negotiation (Accept header or
+?format=). Every renderer receives the bars as columns (see marketdata/ohlc.py).
+
+  json     application/json                      [{"time", "open", ...}, ...] (default)
+  columns  application/vnd.quantnest.columns+json {"time": [...], "open": [...], ...}
+  msgpack  application/x-msgpack                  the columns dict, MessagePack-encoded
+  arrow    application/vnd.apache.arrow.stream    one record batch, Arrow IPC stream
+
+Anything that isn't bars (a DRF error body such as a 403 or a 429) is sent as plain
+JSON, whatever the requested encoding.
+"""
+import msgpack
+import pyarrow as pa
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .ohlc import COLUMNS, columns_to_rows
+
+ARROW_SCHEMA = pa.schema([
+    ("time", pa.int64()),
+    ("open", pa.float64()),
+    ("high", pa.float64()),
+    ("low", pa.float64()),
+    ("close", pa.float64()),
+    ("volume", pa.float64()),
+])
+
+
+def is_columns(data):
+    return isinstance(data, dict) and "time" in data
+
+
+class OhlcRowsRenderer(JSONRenderer):
+    """The original list-of-bars JSON, kept as the default for existing clients."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if is_columns(data):
+            data = columns_to_rows(data)
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class OhlcColumnsRenderer(JSONRenderer):
+    media_type = "application/vnd.quantnest.columns+json"
+    format = "columns"
+
+
+class BinaryOhlcRenderer(BaseRenderer):
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if is_columns(data):
+            return self.encode(data)
+        # An error body: JSON, under a matching Content-Type (DRF sets it before rendering)
+        response = (renderer_context or {}).get("response")
+        if response is not None:
+            response["Content-Type"] = "application/json"
+        return JSONRenderer().render(data)
+
+    def encode(self, columns):
+        raise NotImplementedError
+
+
+class OhlcMsgPackRenderer(BinaryOhlcRenderer):
+    media_type = "application/x-msgpack"
+    format = "msgpack"
+
+    def encode(self, data):
+        return msgpack.packb({column: data[column] for column in COLUMNS}, use_bin_type=True)
+
+
+class OhlcArrowRenderer(BinaryOhlcRenderer):
+    media_type = "application/vnd.apache.arrow.stream"
+    format = "arrow"
+
+    def encode(self, data):
+        batch = pa.record_batch(
+            [pa.array(data[field.name], type=field.type) for field in ARROW_SCHEMA],
+            schema=ARROW_SCHEMA,
+        )
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, ARROW_SCHEMA) as writer:
+            writer.write_batch(batch)
+        return sink.getvalue().to_pybytes()
+
+
+OHLC_RENDERERS = [OhlcRowsRenderer, OhlcColumnsRenderer, OhlcMsgPackRenderer, OhlcArrowRenderer]
@@ -0,0 +1,100 @@
+# backend/marketdata/rollups.py
+"""
+Materialized higher-resolution candles, stored in `candles` next to the 1m bars and
+tagged by `resolution`.
+
+Each level is built from the one below it (1m -> 5m -> 15m -> 1h -> 1D -> 1W) with an
+aggregation that $merges the recomputed bars back on the unique
+(instrument, timestamp, resolution) index. Buckets are aligned to the Unix epoch,
+the same alignment ohlc_data's on-the-fly $group used before.
+"""
+from datetime import datetime, timedelta, timezone
+
+from .mongo_client import get_candles_collection
+
+# (resolution, built from, bucket seconds), lowest level first
+ROLLUP_LEVELS = [
+    ("5m", "1m", 300),
+    ("15m", "5m", 900),
+    ("1h", "15m", 3600),
+    ("1D", "1h", 86400),
+    ("1W", "1D", 604800),
+]
+ROLLUP_SECONDS = {resolution: seconds for resolution, _, seconds in ROLLUP_LEVELS}
+
+
+def _utc(timestamp):
+    # Documents read back without tz_aware come out as naive UTC datetimes
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+
+def bucket_start(timestamp, seconds):
+    """Start of the epoch-aligned bucket of `seconds` containing `timestamp` (UTC)."""
+    epoch = int(_utc(timestamp).timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=timezone.utc)
+
+
+def ohlcv_group(group_id):
+    """$group stage folding time-sorted candles into one bar per `group_id`."""
+    return {"$group": {
+        "_id": group_id,
+        "open": {"$first": "$open"},
+        "high": {"$max": "$high"},
+        "low": {"$min": "$low"},
+        "close": {"$last": "$close"},
+        "volume": {"$sum": "$volume"},
+    }}
+
+
+def rollup_pipeline(resolution, source, seconds, instruments, start, end, into):
+    """Recompute every `resolution` bar of `instruments` in [start, end) from `source` bars."""
+    return [
+        {"$match": {
+            "instrument": {"$in": list(instruments)},
+            "resolution": source,
+            "timestamp": {"$gte": start, "$lt": end},
+        }},
+        {"$sort": {"timestamp": 1}},
+        ohlcv_group({
+            "instrument": "$instrument",
+            "timestamp": {"$subtract": ["$timestamp", {"$mod": [{"$toLong": "$timestamp"}, seconds * 1000]}]},
+        }),
+        {"$project": {
+            "_id": 0,
+            "instrument": "$_id.instrument",
+            "timestamp": "$_id.timestamp",
+            "resolution": {"$literal": resolution},
+            "open": 1, "high": 1, "low": 1, "close": 1, "volume": 1,
+        }},
+        {"$merge": {
+            "into": into,
+            "on": ["instrument", "timestamp", "resolution"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]
+
+
+def update_rollups(instruments, first, last, collection=None):
+    """
+    Refresh every rollup bar of `instruments` whose bucket overlaps the 1m range
+    [first, last]. Levels run in order, so each one reads the bars just refreshed
+    below it.
+    """
+    collection = collection if collection is not None else get_candles_collection()
+    for resolution, source, seconds in ROLLUP_LEVELS:
+        start = bucket_start(first, seconds)
+        end = bucket_start(last, seconds) + timedelta(seconds=seconds)
+        collection.aggregate(
+            rollup_pipeline(resolution, source, seconds, instruments, start, end, collection.name),
+            allowDiskUse=True,
+        )
+
+
+def update_rollups_for_candles(candles, collection=None):
+    """Refresh the rollups covering a batch of freshly written 1m candle documents."""
+    minute_bars = [c for c in candles if c["resolution"] == "1m"]
+    if not minute_bars:
+        return
+    timestamps = [_utc(c["timestamp"]) for c in minute_bars]
+    update_rollups({c["instrument"] for c in minute_bars}, min(timestamps), max(timestamps), collection)
@@ -0,0 +1,236 @@
+# backend/marketdata/snapshots.py
+"""
+Latest-tick snapshots per instrument, kept by the ingest pipeline so readers never
+have to query the ticks collection for "the current price".
+
+Two views are maintained side by side:
+
+- live:    the last tick received for each instrument.
+- delayed: the last tick at least 15 minutes old (ohlc.DELAY), which is what the
+           paper-trading executor fills against and what quotes return.
+
+Every tick updates the live view in memory and joins a per-instrument delay queue.
+Ticks of one instrument within the same second collapse into the last one, which
+bounds the queue to one entry per instrument per second. `publish()`, called about
+once a second by the pipeline, moves ticks that have aged past the delay into the
+delayed view and, when REDIS_URL is set, writes the changed entries to two Redis
+hashes (`snapshots:live`, `snapshots:delayed`) so other processes read the same
+snapshots. Without Redis the snapshots only exist in the ingest process, which is
+where the executor and the API run in the default single-process setup.
+
+`available()` tells readers whether a feed is keeping the store current; when it is
+not they fall back to the tick_store readers.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import redis
+from bson import json_util
+from django.conf import settings
+
+from . import metrics
+from .ohlc import DELAY
+
+logger = logging.getLogger(__name__)
+
+
+def _epoch(timestamp):
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+class SnapshotStore:
+    LIVE_KEY = "snapshots:live"
+    DELAYED_KEY = "snapshots:delayed"
+    HEARTBEAT_KEY = "snapshots:heartbeat"
+
+    def __init__(self, client=None, delay=DELAY, stale_after=10.0, name="snapshots"):
+        self.client = client
+        self.delay = delay
+        self.stale_after = stale_after
+        self.name = name
+
+        self._live = {}      # instrument -> tick document
+        self._delayed = {}   # instrument -> tick document
+        self._pending = {}   # instrument -> deque of ticks not yet old enough for the delayed view
+        self._dirty_live = set()
+        self._dirty_delayed = set()
+        self._lock = threading.Lock()
+        self.fed = False     # True while a pipeline in this process feeds the store
+
+        self.updates = 0
+        self.coalesced = 0
+        self.released = 0
+        self.published = 0
+        self.shared_errors = 0
+
+    # --- Writer side (ingest pipeline) ---
+
+    def attach(self):
+        self.fed = True
+
+    def detach(self):
+        self.fed = False
+
+    def seed(self, live, delayed):
+        """Start from stored ticks ({instrument: tick}) so readers are served before the feed catches up."""
+        with self._lock:
+            for instrument, tick in live.items():
+                self._live.setdefault(instrument, tick)
+                self._dirty_live.add(instrument)
+            for instrument, tick in delayed.items():
+                self._delayed.setdefault(instrument, tick)
+                self._dirty_delayed.add(instrument)
+
+    def update(self, tick):
+        instrument = tick["instrument"]
+        with self._lock:
+            self.updates += 1
+            self._live[instrument] = tick
+            self._dirty_live.add(instrument)
+
+            queue = self._pending.get(instrument)
+            if queue is None:
+                queue = self._pending[instrument] = deque()
+            if queue and int(_epoch(queue[-1]["timestamp"])) == int(_epoch(tick["timestamp"])):
+                queue[-1] = tick
+                self.coalesced += 1
+            else:
+                queue.append(tick)
+
+    def release(self, now=None):
+        """Move every queued tick older than the delay into the delayed view."""
+        cutoff = (now or datetime.now(timezone.utc)).timestamp() - self.delay.total_seconds()
+        with self._lock:
+            for instrument, queue in self._pending.items():
+                due = None
+                while queue and _epoch(queue[0]["timestamp"]) <= cutoff:
+                    due = queue.popleft()
+                    self.released += 1
+                if due is not None:
+                    self._delayed[instrument] = due
+                    self._dirty_delayed.add(instrument)
+
+    def publish(self, now=None):
+        """Release due ticks and push changed snapshots to the shared hashes."""
+        self.release(now)
+        if self.client is None:
+            with self._lock:
+                self._dirty_live.clear()
+                self._dirty_delayed.clear()
+            return
+
+        with self._lock:
+            live = {i: json_util.dumps(self._live[i]) for i in self._dirty_live}
+            delayed = {i: json_util.dumps(self._delayed[i]) for i in self._dirty_delayed}
+            self._dirty_live.clear()
+            self._dirty_delayed.clear()
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            if live:
+                pipe.hset(self.LIVE_KEY, mapping=live)
+            if delayed:
+                pipe.hset(self.DELAYED_KEY, mapping=delayed)
+            pipe.set(self.HEARTBEAT_KEY, time.time())
+            pipe.execute()
+            with self._lock:
+                self.published += len(live) + len(delayed)
+        except Exception as e:
+            # Keep the entries dirty so the next publish retries them
+            with self._lock:
+                self._dirty_live.update(live)
+                self._dirty_delayed.update(delayed)
+            self._shared_failed(e)
+
+    # --- Reader side ---
+
+    def available(self):
+        """Whether the snapshots are being kept current by a running feed."""
+        if self.fed:
+            return True
+        if self.client is None:
+            return False
+        try:
+            heartbeat = self.client.get(self.HEARTBEAT_KEY)
+        except Exception as e:
+            self._shared_failed(e)
+            return False
+        return heartbeat is not None and time.time() - float(heartbeat) <= self.stale_after
+
+    def latest(self, instrument, delayed=False):
+        """The snapshot tick of an instrument, or None."""
+        if self.fed or self.client is None:
+            with self._lock:
+                return (self._delayed if delayed else self._live).get(instrument)
+        try:
+            raw = self.client.hget(self.DELAYED_KEY if delayed else self.LIVE_KEY, instrument)
+        except Exception as e:
+            self._shared_failed(e)
+            return None
+        return json_util.loads(raw) if raw else None
+
+    def latest_many(self, instruments, delayed=False):
+        """{instrument: snapshot tick} of those of `instruments` that have one."""
+        instruments = list(instruments)
+        if self.fed or self.client is None:
+            with self._lock:
+                view = self._delayed if delayed else self._live
+                return {i: view[i] for i in instruments if i in view}
+        if not instruments:
+            return {}
+        try:
+            raw = self.client.hmget(self.DELAYED_KEY if delayed else self.LIVE_KEY, instruments)
+        except Exception as e:
+            self._shared_failed(e)
+            return {}
+        return {i: json_util.loads(value) for i, value in zip(instruments, raw) if value}
+
+    def all_latest(self, delayed=False):
+        """{instrument: snapshot tick} for every instrument."""
+        if self.fed or self.client is None:
+            with self._lock:
+                return dict(self._delayed if delayed else self._live)
+        try:
+            raw = self.client.hgetall(self.DELAYED_KEY if delayed else self.LIVE_KEY)
+        except Exception as e:
+            self._shared_failed(e)
+            return {}
+        return {instrument.decode(): json_util.loads(value) for instrument, value in raw.items()}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "fed": self.fed,
+                "shared": self.client is not None,
+                "instruments": len(self._live),
+                "delayed_instruments": len(self._delayed),
+                "queued": sum(len(queue) for queue in self._pending.values()),
+                "updates": self.updates,
+                "coalesced": self.coalesced,
+                "released": self.released,
+                "published": self.published,
+                "shared_errors": self.shared_errors,
+            }
+
+    def _shared_failed(self, error):
+        with self._lock:
+            self.shared_errors += 1
+        logger.warning(f"{self.name}: shared snapshot store unavailable: {error}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_snapshot_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            client = redis.Redis.from_url(settings.REDIS_URL) if settings.REDIS_URL else None
+            _store = SnapshotStore(client=client, stale_after=settings.SNAPSHOT_STALE_AFTER)
+            metrics.register(_store.name, _store.stats)
+        return _store
@@ -0,0 +1,154 @@
+# backend/marketdata/subscriptions.py
+"""
+Reference counts of the websocket subscribers of each instrument group, so the
+delayed broadcaster can drop ticks nobody is watching before building a payload.
+
+MarketDataConsumer adds one reference per socket on subscribe and removes it on
+unsubscribe and disconnect (the *_many variants for bulk subscribes). The counts
+live next to the channel layer: in process
+memory with the in-memory layer, in the `subscriptions:groups` Redis hash of the
+layer's server with RedisChannelLayer, so the broadcaster sees subscribers of every
+Daphne process. The broadcaster reads the shared hash at most once per
+SUBSCRIPTIONS_REFRESH_INTERVAL. A process that dies without disconnecting its
+sockets leaves counts behind; that only means some ticks are still sent.
+"""
+import logging
+import threading
+import time
+
+import redis
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionRegistry:
+    KEY = "subscriptions:groups"
+
+    def __init__(self, client=None, refresh_interval=1.0, name="subscriptions"):
+        self.client = client
+        self.refresh_interval = refresh_interval
+        self.name = name
+
+        self._counts = {}        # group -> subscribers (authoritative without Redis, cached with it)
+        self._refreshed_at = float("-inf")
+        self._lock = threading.Lock()
+        self.skipped = 0
+        self.shared_errors = 0
+
+    def add(self, group):
+        self.add_many([group])
+
+    def remove(self, group):
+        self.remove_many([group])
+
+    def add_many(self, groups):
+        self._change(groups, 1)
+
+    def remove_many(self, groups):
+        self._change(groups, -1)
+
+    def _change(self, groups, step):
+        if self.client is None:
+            with self._lock:
+                for group in groups:
+                    count = self._counts.get(group, 0) + step
+                    if count > 0:
+                        self._counts[group] = count
+                    else:
+                        self._counts.pop(group, None)
+            return
+        # Fields that drop to zero stay in the hash (reads ignore them): deleting them
+        # here could race with another process's increment.
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for group in groups:
+                pipe.hincrby(self.KEY, group, step)
+            pipe.execute()
+        except Exception as e:
+            self._shared_failed(e)
+
+    def counts(self, now=None):
+        """{group: subscribers}; from the shared hash at most once per refresh interval."""
+        if self.client is not None:
+            now = now if now is not None else time.monotonic()
+            if now - self._refreshed_at >= self.refresh_interval:
+                self._refresh(now)
+        with self._lock:
+            return dict(self._counts)
+
+    def is_watched(self, group, now=None):
+        return self.counts(now).get(group, 0) > 0
+
+    def watched(self, ticks, group_of, now=None):
+        """The ticks whose group (`group_of(tick)`) has at least one subscriber."""
+        counts = self.counts(now)
+        kept = [tick for tick in ticks if counts.get(group_of(tick), 0) > 0]
+        with self._lock:
+            self.skipped += len(ticks) - len(kept)
+        return kept
+
+    def stats(self):
+        counts = self.counts()
+        with self._lock:
+            return {
+                "shared": self.client is not None,
+                "active_groups": len(counts),
+                "subscribers": sum(counts.values()),
+                "groups": dict(sorted(counts.items())),
+                "skipped_ticks": self.skipped,
+                "shared_errors": self.shared_errors,
+            }
+
+    def _refresh(self, now):
+        try:
+            raw = self.client.hgetall(self.KEY)
+        except Exception as e:
+            # Keep the last known counts; retry on the next interval
+            self._shared_failed(e)
+            self._refreshed_at = now
+            return
+        counts = {group.decode(): int(count) for group, count in raw.items() if int(count) > 0}
+        with self._lock:
+            self._counts = counts
+            self._refreshed_at = now
+
+    def _shared_failed(self, error):
+        with self._lock:
+            self.shared_errors += 1
+        logger.warning(f"{self.name}: shared subscription registry unavailable: {error}")
+
+
+def channel_layer_redis_url():
+    """The Redis server behind the default channel layer, or None for the in-memory layer."""
+    layer = settings.CHANNEL_LAYERS.get("default", {})
+    if "redis" not in layer.get("BACKEND", "").lower():
+        return None
+    hosts = layer.get("CONFIG", {}).get("hosts") or []
+    if not hosts:
+        return None
+    host = hosts[0]
+    if isinstance(host, str):
+        return host
+    if isinstance(host, dict):
+        return host.get("address")
+    return f"redis://{host[0]}:{host[1]}"
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_subscription_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            url = channel_layer_redis_url()
+            _registry = SubscriptionRegistry(
+                client=redis.Redis.from_url(url) if url else None,
+                refresh_interval=settings.SUBSCRIPTIONS_REFRESH_INTERVAL,
+            )
+            metrics.register(_registry.name, _registry.stats)
+        return _registry
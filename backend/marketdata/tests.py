@@ -1,3 +1,1051 @@
-from django.test import TestCase
+# backend/marketdata/tests.py
+import asyncio
+import json
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+import msgpack
+import pyarrow as pa
+from bson import ObjectId
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from channels_redis.pubsub import RedisPubSubChannelLayer
+
+from django.core.cache import caches
+from django.test import AsyncRequestFactory, SimpleTestCase, override_settings
+from pymongo.errors import BulkWriteError
+
+from .candle_builder import CandleBuilder
+from .conflation import Conflator
+from .consumers import MarketDataConsumer
+from .management.commands import fetch_candles
+from .management.commands.backfill_history import missing_ranges, split_range
+from .management.commands.migrate_ticks_timeseries import _collscan_stages
+from .management.commands.replay_broadcaster import PushBroadcaster
+from .rate_limit import RateLimiter
+from .subscriptions import SubscriptionRegistry, channel_layer_redis_url
+from . import async_views
+from . import candles, metrics, mongo_client, ohlc, ohlc_cache, quotes, renderers, rollups, snapshots, tick_store
+from .tick_messages import DeltaEncoder, encode_tick
+from .tick_feed import DelayQueue, LocalTickFeed
+from .tick_pipeline import TickPipeline
+from .tick_writer import BufferedTickWriter
+from .universe import load_universe, split_into_shards
+
+TEST_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "ohlc-tests": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "ohlc-tests"},
+}
+
+
+class BufferedTickWriterTests(SimpleTestCase):
+    def test_flushes_in_batches_and_on_stop(self):
+        """Ticks are written in batch_size chunks, and stop() flushes the remainder."""
+        batches = []
+        writer = BufferedTickWriter(write_batch=lambda b: batches.append(list(b)), batch_size=3, flush_interval=60)
+        writer.start()
+        for i in range(7):
+            writer.submit({"i": i})
+        writer.stop()
+
+        self.assertEqual([len(b) for b in batches], [3, 3, 1])
+        stats = writer.stats()
+        self.assertEqual(stats["written"], 7)
+        self.assertEqual(stats["flushes"], 3)
+        self.assertEqual(stats["max_flush_size"], 3)
+
+    def test_drops_are_counted_when_queue_is_full(self):
+        """With the flusher blocked, submits beyond max_queue are dropped instead of blocking."""
+        release = threading.Event()
+        writer = BufferedTickWriter(write_batch=lambda b: release.wait(5), max_queue=2, batch_size=1, flush_interval=60)
+        writer.start()
+        results = [writer.submit({"i": i}) for i in range(10)]
+        release.set()
+        writer.stop()
+
+        self.assertIn(False, results)
+        stats = writer.stats()
+        self.assertEqual(stats["submitted"] + stats["dropped"], 10)
+        self.assertGreater(stats["dropped"], 0)
+
+    def test_partial_bulk_write_failure_is_counted(self):
+        def write_batch(batch):
+            raise BulkWriteError({"writeErrors": [{"index": 0}], "nInserted": len(batch) - 1})
+
+        writer = BufferedTickWriter(write_batch=write_batch, batch_size=4, flush_interval=60)
+        writer.start()
+        for i in range(4):
+            writer.submit({"i": i})
+        writer.stop()
+
+        stats = writer.stats()
+        self.assertEqual(stats["written"], 3)
+        self.assertEqual(stats["failed"], 1)
+
+
+class ExplainCheckTests(SimpleTestCase):
+    def test_collscan_detected_in_winning_plan_only(self):
+        explain = {
+            "queryPlanner": {
+                "winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}},
+                "rejectedPlans": [{"stage": "COLLSCAN"}],
+            }
+        }
+        self.assertEqual(_collscan_stages(explain), [])
+
+        explain["queryPlanner"]["winningPlan"]["inputStage"] = {"stage": "COLLSCAN"}
+        self.assertEqual(len(_collscan_stages(explain)), 1)
+
+    def test_collscan_detected_inside_aggregation_stages(self):
+        explain = {"stages": [{"$cursor": {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}}, {"$group": {}}]}
+        self.assertEqual(len(_collscan_stages(explain)), 1)
+
+
+def _tick(minute, second, price, cum_volume, qty=1, instrument="NSE:RELIANCE-EQ"):
+    return {
+        "instrument": instrument,
+        "timestamp": datetime(2025, 1, 6, 4, minute, second, tzinfo=timezone.utc),
+        "price": price,
+        "volume_traded_today": cum_volume,
+        "last_traded_qty": qty,
+    }
+
+
+@mock.patch("marketdata.candle_builder.upsert_candles")
+class CandleBuilderTests(SimpleTestCase):
+    def test_builds_ohlcv_from_ticks_and_closes_on_next_minute(self, upsert):
+        builder = CandleBuilder(checkpoint_interval=3600)
+        for tick in [_tick(0, 1, 100, 1000, qty=10), _tick(0, 20, 105, 1050), _tick(0, 40, 98, 1070), _tick(0, 59, 101, 1100)]:
+            builder.add_tick(tick)
+        builder.add_tick(_tick(1, 2, 102, 1130))
+        builder.flush(now=datetime(2025, 1, 6, 4, 1, 5, tzinfo=timezone.utc))
+
+        (written,), _ = upsert.call_args
+        self.assertEqual(len(written), 1)
+        bar = written[0]
+        self.assertEqual(bar["timestamp"], datetime(2025, 1, 6, 4, 0, tzinfo=timezone.utc))
+        self.assertEqual((bar["open"], bar["high"], bar["low"], bar["close"]), (100, 105, 98, 101))
+        # first tick contributes its own qty, the rest are deltas of vol_traded_today
+        self.assertEqual(bar["volume"], 10 + 50 + 20 + 30)
+
+    def test_closes_idle_bar_on_timer_and_ignores_late_tick_prices(self, upsert):
+        builder = CandleBuilder(close_delay=2, checkpoint_interval=3600)
+        builder.add_tick(_tick(0, 10, 100, 500, qty=5))
+        builder.flush(now=datetime(2025, 1, 6, 4, 1, 3, tzinfo=timezone.utc))
+        self.assertEqual(len(upsert.call_args.args[0]), 1)
+
+        # A late tick for the closed minute must not reopen it; its volume moves to the next bar.
+        builder.add_tick(_tick(0, 58, 50, 520))
+        builder.add_tick(_tick(1, 10, 101, 530))
+        builder.flush(now=datetime(2025, 1, 6, 4, 2, 3, tzinfo=timezone.utc))
+
+        bar = upsert.call_args.args[0][0]
+        self.assertEqual(bar["timestamp"], datetime(2025, 1, 6, 4, 1, tzinfo=timezone.utc))
+        self.assertEqual((bar["open"], bar["low"], bar["volume"]), (101, 101, 20 + 10))
+        self.assertEqual(builder.stats()["late_ticks"], 1)
+
+
+class RateLimiterTests(SimpleTestCase):
+    def test_enforces_the_tightest_bucket(self):
+        # burst of 5, then 50/s from the first bucket; the second bucket allows more
+        limiter = RateLimiter([(5, 0.1), (100, 1)])
+        started = time.monotonic()
+        for _ in range(10):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.08)
+        self.assertEqual(limiter.acquired, 10)
+
+
+class FetchCandlesCycleTests(SimpleTestCase):
+    def test_cycle_is_skipped_while_previous_one_runs(self):
+        with mock.patch.object(fetch_candles, "get_active_fyers_access_token") as get_token:
+            with fetch_candles._cycle_lock:
+                fetch_candles.fetch_and_store_candles()
+        get_token.assert_not_called()
+
+    @mock.patch.object(fetch_candles, "upsert_candles")
+    @mock.patch.object(fetch_candles, "fetch_symbol_candles", side_effect=lambda symbol, *a: [{"instrument": symbol}])
+    @mock.patch.object(fetch_candles, "get_active_fyers_access_token", return_value="token")
+    def test_cycle_writes_all_symbols_in_one_bulk_write(self, get_token, fetch_symbol, upsert):
+        with mock.patch.object(fetch_candles, "symbol_list", ["NSE:A-EQ", "NSE:B-EQ", "NSE:C-EQ"]):
+            fetch_candles.fetch_and_store_candles()
+        upsert.assert_called_once()
+        self.assertEqual(len(upsert.call_args.args[0]), 3)
+        self.assertFalse(fetch_candles._cycle_lock.locked())
+
+
+class BackfillPlanningTests(SimpleTestCase):
+    def test_split_range_into_bounded_chunks(self):
+        chunks = split_range(date(2024, 1, 1), date(2024, 7, 1), chunk_days=90)
+        self.assertEqual(chunks[0], (date(2024, 1, 1), date(2024, 3, 30)))
+        self.assertEqual(chunks[-1][1], date(2024, 7, 1))
+        self.assertTrue(all((b - a).days < 90 for a, b in chunks))
+
+    def test_only_uncovered_ranges_are_fetched(self):
+        coverage = (datetime(2024, 3, 1, 3, 45, tzinfo=timezone.utc), datetime(2024, 6, 28, 9, 59, tzinfo=timezone.utc))
+        self.assertEqual(
+            missing_ranges(date(2024, 1, 1), date(2024, 6, 30), coverage),
+            [(date(2024, 1, 1), date(2024, 3, 1)), (date(2024, 6, 28), date(2024, 6, 30))],
+        )
+        self.assertEqual(missing_ranges(date(2024, 4, 1), date(2024, 5, 1), coverage), [])
+        self.assertEqual(missing_ranges(date(2024, 4, 1), date(2024, 5, 1), None), [(date(2024, 4, 1), date(2024, 5, 1))])
+
+    def test_partially_stored_trading_days_inside_the_covered_span_are_fetched(self):
+        coverage = (datetime(2024, 3, 1, 3, 45, tzinfo=timezone.utc), datetime(2024, 3, 15, 9, 59, tzinfo=timezone.utc))
+        trading_days = {date(2024, 3, 1) + timedelta(days=i) for i in range(15)} - {date(2024, 3, 8)}  # 8th: holiday
+        day_counts = {day: 375 for day in trading_days}
+        day_counts[date(2024, 3, 5)] = 120
+        del day_counts[date(2024, 3, 6)]
+        day_counts[date(2024, 3, 12)] = 300
+
+        self.assertEqual(
+            missing_ranges(date(2024, 3, 1), date(2024, 3, 15), coverage, day_counts, trading_days),
+            [(date(2024, 3, 1), date(2024, 3, 1)), (date(2024, 3, 5), date(2024, 3, 6)),
+             (date(2024, 3, 12), date(2024, 3, 12)), (date(2024, 3, 15), date(2024, 3, 15))],
+        )
+
+
+class ShardingTests(SimpleTestCase):
+    def test_nifty500_universe_fits_the_socket_limit_in_shards(self):
+        symbols = load_universe("nifty500")
+        self.assertGreater(len(symbols), 400)
+        self.assertTrue(all(s.startswith("NSE:") and s.endswith("-EQ") for s in symbols))
+
+        shards = split_into_shards(symbols, 100)
+        self.assertTrue(all(len(shard) <= 100 for shard in shards))
+        self.assertEqual(sum(shards, []), symbols)
+        self.assertEqual(load_universe("reliance, nse:tcs-eq"), ["NSE:RELIANCE-EQ", "NSE:TCS-EQ"])
+
+    def test_pipeline_counts_ticks_per_shard(self):
+        pipeline = TickPipeline()
+        pipeline.writer = mock.Mock()
+        pipeline.candle_builder = mock.Mock()
+        pipeline.snapshots = mock.Mock()
+        for shard in (0, 0, 1):
+            pipeline.process({"instrument": "NSE:A-EQ"}, shard)
+        pipeline.record_dropped(1, 5)
+        pipeline.flush()
+
+        self.assertEqual(pipeline.writer.submit.call_count, 3)
+        self.assertEqual(pipeline.candle_builder.add_tick.call_count, 3)
+        self.assertEqual(pipeline.snapshots.update.call_count, 3)
+        shards = pipeline.stats()["shards"]
+        self.assertEqual(shards["0"]["ticks"], 2)
+        self.assertEqual(shards["1"]["dropped"], 5)
+
+
+class TickBucketTests(SimpleTestCase):
+    def _ticks(self):
+        timestamps = [datetime(2024, 1, 1, 9, 15, 58, tzinfo=timezone.utc),
+                      datetime(2024, 1, 1, 9, 15, 59, tzinfo=timezone.utc),
+                      datetime(2024, 1, 1, 9, 16, 2, tzinfo=timezone.utc)]
+        return [
+            {"instrument": instrument, "timestamp": ts, "price": 100.0 + i,
+             "last_traded_qty": i, "volume_traded_today": 10 * i}
+            for i, ts in enumerate(timestamps) for instrument in ("NSE:A-EQ", "NSE:B-EQ")
+        ]
+
+    def test_batch_is_pushed_into_one_capped_bucket_per_instrument_minute(self):
+        operations = tick_store.bucket_updates(self._ticks(), max_count=500)
+        self.assertEqual(len(operations), 4)
+
+        first = operations[0]
+        self.assertEqual(first._filter["instrument"], "NSE:A-EQ")
+        self.assertEqual(first._filter["minute"], datetime(2024, 1, 1, 9, 15, tzinfo=timezone.utc))
+        self.assertEqual(first._filter["count"], {"$lt": 500})
+        self.assertEqual(first._doc["$push"]["price"], {"$each": [100.0, 101.0]})
+        self.assertEqual(first._doc["$inc"], {"count": 2})
+        self.assertTrue(first._upsert)
+
+    def test_unpacked_bucket_matches_the_per_tick_documents(self):
+        ticks = [t for t in self._ticks() if t["instrument"] == "NSE:A-EQ"]
+        bucket = {"instrument": "NSE:A-EQ"}
+        for field, array in tick_store.BUCKET_FIELDS.items():
+            bucket[array] = [t.get(field) for t in ticks]
+
+        unpacked = tick_store.unpack_bucket(bucket)
+        self.assertEqual(len(unpacked), 3)
+        for original, restored in zip(ticks, unpacked):
+            self.assertEqual({k: v for k, v in restored.items() if v is not None}, original)
+
+
+class RollupTests(SimpleTestCase):
+    def test_levels_refresh_whole_aligned_buckets_lowest_first(self):
+        collection = mock.Mock()
+        collection.name = "candles"
+        first = datetime(2024, 1, 3, 9, 17, tzinfo=timezone.utc)
+        rollups.update_rollups(["NSE:A-EQ"], first, first + timedelta(minutes=1), collection)
+
+        pipelines = [c.args[0] for c in collection.aggregate.call_args_list]
+        self.assertEqual([p[-2]["$project"]["resolution"]["$literal"] for p in pipelines], ["5m", "15m", "1h", "1D", "1W"])
+        self.assertEqual(pipelines[0][0]["$match"]["resolution"], "1m")
+        self.assertEqual(pipelines[0][0]["$match"]["timestamp"], {
+            "$gte": datetime(2024, 1, 3, 9, 15, tzinfo=timezone.utc),
+            "$lt": datetime(2024, 1, 3, 9, 20, tzinfo=timezone.utc),
+        })
+        # Weeks stay aligned to the epoch (a Thursday), as the on-the-fly $group was
+        self.assertEqual(pipelines[-1][0]["$match"]["timestamp"]["$gte"], datetime(2023, 12, 28, tzinfo=timezone.utc))
+        self.assertEqual(pipelines[-1][-1]["$merge"]["into"], "candles")
+
+    @mock.patch("marketdata.ohlc_cache._cache", ohlc_cache.OhlcCache(alias="ohlc-tests"))
+    @mock.patch("marketdata.views.get_candles_collection")
+    def test_ohlc_reads_closed_rollups_and_folds_only_the_forming_bar(self, get_collection):
+        collection = get_collection.return_value
+        collection.find.return_value.sort.return_value = [
+            {"timestamp": datetime(2024, 1, 3, 0, 0), "open": 1, "high": 2, "low": 1, "close": 2, "volume": 10},
+        ]
+        collection.aggregate.return_value = [{"_id": None, "open": 2, "high": 3, "low": 2, "close": 3, "volume": 5}]
+
+        response = self.client.get("/api/v1/market/ohlc/", {"instrument": "a", "resolution": "1D"})
+
+        self.assertEqual(response.status_code, 200)
+        bars = response.json()
+        self.assertEqual([b["close"] for b in bars], [2, 3])
+        self.assertEqual(bars[0]["time"], int(datetime(2024, 1, 3, tzinfo=timezone.utc).timestamp() * 1000))
+        query = collection.find.call_args.args[0]
+        self.assertEqual(query["resolution"], "1D")
+        self.assertEqual(bars[1]["time"], int(query["timestamp"]["$lt"].timestamp() * 1000))
+        self.assertEqual(self.client.get("/api/v1/market/ohlc/", {"instrument": "a", "resolution": "2h"}).status_code, 400)
+
+
+class OhlcPagingTests(SimpleTestCase):
+    now = datetime(2024, 1, 10, 6, 0, tzinfo=timezone.utc)
+
+    def test_cursor_page_reads_newest_bars_before_the_cursor(self):
+        before = datetime(2024, 1, 5, tzinfo=timezone.utc)
+        query = ohlc.parse_ohlc_params(
+            {"instrument": "abc", "resolution": "1D", "limit": "2", "before": str(ohlc.to_ms(before))}, now=self.now
+        )
+        forming = ohlc.forming_bar_start(query)
+        self.assertIsNone(forming)  # today's bar is newer than the cursor
+
+        filter_, sort, limit = ohlc.stored_bars_query(query)
+        self.assertEqual(filter_, {"instrument": "NSE:ABC-EQ", "resolution": "1D", "timestamp": {"$lt": before}})
+        self.assertEqual((sort, limit), ([("timestamp", -1)], 2))
+
+        stored = [{"timestamp": datetime(2024, 1, 4), "close": 4}, {"timestamp": datetime(2024, 1, 3), "close": 3}]
+        columns, next_before = ohlc.page(query, ohlc.shape_bars(stored, descending=True), ohlc.empty_columns())
+        self.assertEqual(columns["close"], [3, 4])
+        self.assertEqual(next_before, columns["time"][0])
+
+    def test_forming_bar_counts_against_the_limit(self):
+        query = ohlc.parse_ohlc_params({"instrument": "abc", "resolution": "1h", "limit": "3"}, now=self.now)
+        forming = ohlc.forming_bar_start(query)
+        self.assertEqual(forming, datetime(2024, 1, 10, 5, 0, tzinfo=timezone.utc))
+        stored = {**ohlc.empty_columns(), "time": [0, 1, 2], "close": [10, 11, 12]}
+        forming = {**ohlc.empty_columns(), "time": [3], "close": [13]}
+        columns, next_before = ohlc.page(query, stored, forming)
+        self.assertEqual(columns["time"], [1, 2, 3])
+        self.assertEqual(columns["close"], [11, 12, 13])
+        self.assertEqual(next_before, 1)
+
+    def test_empty_forming_bar_leaves_the_page_full(self):
+        # Off hours the forming bar's window has no 1m candles and folds to nothing
+        query = ohlc.parse_ohlc_params({"instrument": "abc", "resolution": "1h", "limit": "3"}, now=self.now)
+        self.assertIsNotNone(ohlc.forming_bar_start(query))
+        self.assertEqual(ohlc.stored_bars_query(query)[2], 3)
+        stored = {**ohlc.empty_columns(), "time": [0, 1, 2], "close": [10, 11, 12]}
+        columns, next_before = ohlc.page(query, stored, ohlc.empty_columns())
+        self.assertEqual(columns["time"], [0, 1, 2])
+        self.assertEqual(next_before, 0)
+
+    def test_invalid_times_are_rejected(self):
+        with self.assertRaises(ValueError):
+            ohlc.parse_ohlc_params({"instrument": "abc", "from": "yesterday"})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class OhlcCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches["ohlc-tests"].clear()
+        self.cache = ohlc_cache.OhlcCache(lru_size=2, alias="ohlc-tests")
+        self.collection = mock.Mock()
+        self.now = datetime(2024, 1, 10, 6, 0, tzinfo=timezone.utc)
+
+    def _serve(self, now):
+        query = ohlc.parse_ohlc_params({"instrument": "abc", "resolution": "1m"}, now=now)
+        return ohlc_cache.stored_bars(query, self.collection, cache=self.cache)
+
+    def _stored(self, *minutes):
+        return [{"timestamp": datetime(2024, 1, 10, 5, m), "close": m} for m in minutes]
+
+    def test_repeat_requests_hit_and_a_moved_cutoff_reads_only_the_new_bars(self):
+        self.collection.find.return_value.sort.return_value = self._stored(43, 44, 45)
+        self.assertEqual(ohlc.bar_count(self._serve(self.now)), 3)
+        self.assertEqual(ohlc.bar_count(self._serve(self.now + timedelta(seconds=20))), 3)
+        self.assertEqual(self.collection.find.call_count, 1)
+
+        self.collection.find.return_value.sort.return_value = self._stored(46)
+        columns = self._serve(self.now + timedelta(minutes=1))
+        self.assertEqual(columns["close"], [43, 44, 45, 46])
+        self.assertEqual(self.collection.find.call_args.args[0]["timestamp"]["$gte"],
+                         datetime(2024, 1, 10, 5, 46, tzinfo=timezone.utc))
+
+        stats = self.cache.stats()
+        self.assertEqual((stats["misses"], stats["lru_hits"], stats["extensions"]), (1, 2, 1))
+
+    def test_writing_a_visible_candle_invalidates_the_instrument(self):
+        self.collection.find.return_value.sort.return_value = self._stored(43)
+        self._serve(self.now)
+        with mock.patch.object(ohlc_cache, "get_ohlc_cache", return_value=self.cache):
+            ohlc_cache.invalidate_for_candles([
+                {"instrument": "NSE:ABC-EQ", "resolution": "1m", "timestamp": datetime.now(timezone.utc)},
+            ])
+            self.assertEqual(self.cache.stats()["invalidations"], 0)  # still inside the delay
+            ohlc_cache.invalidate_for_candles([
+                {"instrument": "NSE:ABC-EQ", "resolution": "1m", "timestamp": datetime(2024, 1, 10, 5, 43)},
+            ])
+        self.collection.find.return_value.sort.return_value = self._stored(43)
+        self._serve(self.now)
+        self.assertEqual(self.collection.find.call_count, 2)
+        self.assertEqual(self.cache.stats()["invalidations"], 1)
+
+    def test_rollups_are_merged_before_the_generation_is_bumped(self):
+        calls = mock.Mock()
+        written = [{"instrument": "NSE:ABC-EQ", "resolution": "1m", "timestamp": datetime(2024, 1, 10, 5, 43)}]
+        with mock.patch("marketdata.candles.update_rollups_for_candles", calls.update_rollups), \
+                mock.patch("marketdata.candles.invalidate_for_candles", calls.invalidate):
+            candles.upsert_candles(written, collection=mock.Mock())
+            self.assertEqual([name for name, _, _ in calls.mock_calls], ["update_rollups", "invalidate"])
+
+            calls.reset_mock()
+            calls.update_rollups.side_effect = RuntimeError("merge failed")
+            candles.upsert_candles(written, collection=mock.Mock())
+            calls.invalidate.assert_called_once_with(written)
+
+    def test_lru_evicts_least_recently_used_entries(self):
+        self.collection.find.return_value.sort.return_value = []
+        for symbol in ("a", "b", "a", "c"):
+            query = ohlc.parse_ohlc_params({"instrument": symbol, "resolution": "1m"}, now=self.now)
+            ohlc_cache.stored_bars(query, self.collection, cache=self.cache)
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+        self.assertEqual(list(self.cache._lru), ["ohlc:NSE:A-EQ:1m://:", "ohlc:NSE:C-EQ:1m://:"])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class OhlcConditionalGetTests(SimpleTestCase):
+    def setUp(self):
+        caches["ohlc-tests"].clear()
+        patcher = mock.patch("marketdata.ohlc_cache._cache", ohlc_cache.OhlcCache(alias="ohlc-tests"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch("marketdata.views.get_candles_collection")
+    def test_unchanged_series_is_answered_with_304_without_touching_mongo(self, get_collection):
+        get_collection.return_value.find.return_value.sort.return_value = []
+        first = self.client.get("/api/v1/market/ohlc/", {"instrument": "abc", "resolution": "1m"})
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("no-cache", first["Cache-Control"])
+
+        get_collection.reset_mock()
+        again = self.client.get("/api/v1/market/ohlc/", {"instrument": "abc", "resolution": "1m"},
+                                HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        get_collection.assert_not_called()
+
+        ohlc_cache.get_ohlc_cache().invalidate(["NSE:ABC-EQ"])
+        changed = self.client.get("/api/v1/market/ohlc/", {"instrument": "abc", "resolution": "1m"},
+                                  HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(changed.status_code, 200)
+
+    @mock.patch("marketdata.views.get_candles_collection")
+    def test_rewrite_within_the_minute_moves_last_modified(self, get_collection):
+        get_collection.return_value.find.return_value.sort.return_value = []
+        params = {"instrument": "abc", "resolution": "1m"}
+        first = self.client.get("/api/v1/market/ohlc/", params)
+        again = self.client.get("/api/v1/market/ohlc/", params, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(again.status_code, 304)
+
+        ohlc_cache.get_ohlc_cache().invalidate(["NSE:ABC-EQ"])
+        changed = self.client.get("/api/v1/market/ohlc/", params, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["Last-Modified"], first["Last-Modified"])
+
+    def test_since_keeps_the_forming_bar_and_bounds_the_stored_read(self):
+        now = datetime(2024, 1, 10, 6, 0, tzinfo=timezone.utc)
+        since = datetime(2024, 1, 10, 5, 0, tzinfo=timezone.utc)
+        query = ohlc.parse_ohlc_params({"instrument": "abc", "resolution": "1h", "since": str(ohlc.to_ms(since))}, now=now)
+        self.assertEqual(ohlc.forming_bar_start(query), since)
+        filter_, _, _ = ohlc.stored_bars_query(query)
+        self.assertEqual(filter_["timestamp"], {"$gte": since, "$lt": since})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class OhlcEncodingTests(SimpleTestCase):
+    columns = {"time": [60000, 120000], "open": [1.0, 2.0], "high": [2.0, 3.0],
+               "low": [0.5, 1.5], "close": [1.5, 2.5], "volume": [10, 20]}
+
+    def test_binary_encodings_round_trip_the_columns(self):
+        packed = renderers.OhlcMsgPackRenderer().render(self.columns)
+        self.assertEqual(msgpack.unpackb(packed), self.columns)
+
+        table = pa.ipc.open_stream(renderers.OhlcArrowRenderer().render(self.columns)).read_all()
+        self.assertEqual(table.column("time").to_pylist(), [60000, 120000])
+        self.assertEqual(table.column("volume").to_pylist(), [10.0, 20.0])
+
+    @mock.patch("marketdata.ohlc_cache._cache", ohlc_cache.OhlcCache(alias="ohlc-tests"))
+    @mock.patch("marketdata.views.stored_bars")
+    @mock.patch("marketdata.views.get_candles_collection")
+    def test_encoding_is_negotiated_and_varies_the_etag(self, get_collection, stored_bars):
+        stored_bars.return_value = self.columns
+        params = {"instrument": "abc", "resolution": "1m"}
+
+        rows = self.client.get("/api/v1/market/ohlc/", params)
+        self.assertEqual(rows.json()[1], {"time": 120000, "open": 2.0, "high": 3.0, "low": 1.5, "close": 2.5, "volume": 20})
+
+        columns = self.client.get("/api/v1/market/ohlc/", params, HTTP_ACCEPT="application/vnd.quantnest.columns+json")
+        self.assertEqual(columns.json(), self.columns)
+        self.assertNotEqual(columns["ETag"], rows["ETag"])
+        self.assertIn("Accept", columns["Vary"])
+
+        arrow = self.client.get("/api/v1/market/ohlc/", {**params, "format": "arrow"})
+        self.assertEqual(arrow["Content-Type"], "application/vnd.apache.arrow.stream")
+
+    def test_error_bodies_are_rendered_as_json_in_every_encoding(self):
+        error = {"detail": "Request was throttled."}
+        for renderer_class in renderers.OHLC_RENDERERS:
+            with self.subTest(renderer=renderer_class.format):
+                self.assertEqual(json.loads(renderer_class().render(error)), error)
+
+        # A stale bearer token fails authentication before the view runs
+        for encoding in ("json", "columns", "msgpack", "arrow"):
+            with self.subTest(format=encoding):
+                response = self.client.get("/api/v1/market/ohlc/", {"instrument": "abc", "format": encoding},
+                                           HTTP_AUTHORIZATION="Bearer stale")
+                self.assertIn(response.status_code, (401, 403))
+                self.assertIn("detail", json.loads(response.content))
+                self.assertTrue(response["Content-Type"].endswith("json"))
+
+
+class SnapshotStoreTests(SimpleTestCase):
+    start = datetime(2024, 1, 10, 4, 0, tzinfo=timezone.utc)
+
+    def tick(self, seconds, price):
+        return {"instrument": "NSE:A-EQ", "timestamp": self.start + timedelta(seconds=seconds), "price": price}
+
+    def test_delayed_view_trails_the_live_one(self):
+        store = snapshots.SnapshotStore()
+        store.update(self.tick(0, 100.0))
+        store.update(self.tick(0.5, 101.0))  # same second: replaces the queued tick
+        store.update(self.tick(2, 102.0))
+
+        store.release(now=self.start + timedelta(minutes=15, seconds=1))
+        self.assertEqual(store.latest("NSE:A-EQ")["price"], 102.0)
+        self.assertEqual(store.latest("NSE:A-EQ", delayed=True)["price"], 101.0)
+        self.assertEqual(store.stats()["coalesced"], 1)
+        self.assertEqual(store.stats()["queued"], 1)
+
+        store.release(now=self.start + timedelta(minutes=15, seconds=2))
+        self.assertEqual(store.all_latest(delayed=True)["NSE:A-EQ"]["price"], 102.0)
+
+    def test_shared_hashes_are_written_by_the_feed_and_read_elsewhere(self):
+        client = mock.MagicMock()
+        writer = snapshots.SnapshotStore(client=client)
+        writer.attach()
+        writer.update(self.tick(0, 100.0))
+        writer.publish(now=self.start)
+
+        pipe = client.pipeline.return_value
+        pipe.hset.assert_called_once_with(snapshots.SnapshotStore.LIVE_KEY, mapping=mock.ANY)
+        published = pipe.hset.call_args.kwargs["mapping"]["NSE:A-EQ"]
+
+        reader = snapshots.SnapshotStore(client=client)
+        client.get.return_value = str(time.time()).encode()
+        client.hgetall.return_value = {b"NSE:A-EQ": published}
+        self.assertTrue(reader.available())
+        self.assertEqual(reader.all_latest()["NSE:A-EQ"]["price"], 100.0)
+
+        client.get.return_value = str(time.time() - 60).encode()
+        self.assertFalse(reader.available())
+        self.assertFalse(snapshots.SnapshotStore().available())
+
+
+class QuoteTests(SimpleTestCase):
+    def test_symbols_are_normalised_and_bounded(self):
+        self.assertEqual(quotes.parse_symbols(" tcs,RELIANCE,,tcs ", 5), ["TCS", "RELIANCE"])
+        with self.assertRaises(ValueError):
+            quotes.parse_symbols("", 5)
+        with self.assertRaises(ValueError):
+            quotes.parse_symbols("A,B,C", 2)
+
+    @mock.patch("marketdata.quotes.tick_store.latest_ticks")
+    def test_snapshot_misses_are_read_in_one_query(self, latest_ticks):
+        store = snapshots.SnapshotStore()
+        store.attach()
+        store.seed(live={}, delayed={"NSE:TCS-EQ": {"instrument": "NSE:TCS-EQ", "price": 3500.0}})
+        latest_ticks.return_value = {"NSE:INFY-EQ": {"instrument": "NSE:INFY-EQ", "price": 1500.0}}
+
+        found = quotes.delayed_quotes(["TCS", "INFY", "WIPRO"], snapshots=store)
+
+        self.assertEqual({symbol: tick["price"] for symbol, tick in found.items()}, {"TCS": 3500.0, "INFY": 1500.0})
+        latest_ticks.assert_called_once()
+        self.assertEqual(latest_ticks.call_args.kwargs["instruments"], ["NSE:INFY-EQ", "NSE:WIPRO-EQ"])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AsyncViewTests(SimpleTestCase):
+    columns = {"time": [60000], "open": [1.0], "high": [2.0], "low": [0.5], "close": [1.5], "volume": [10]}
+
+    @mock.patch("marketdata.ohlc_cache._cache", ohlc_cache.OhlcCache(alias="ohlc-tests"))
+    @mock.patch("marketdata.async_views.stored_bars_async", new_callable=mock.AsyncMock)
+    @mock.patch("marketdata.async_views.get_async_db")
+    async def test_ohlc_matches_the_sync_contract(self, get_async_db, stored_bars_async):
+        stored_bars_async.return_value = self.columns
+        request = AsyncRequestFactory().get("/api/v1/market/ohlc/", {"instrument": "abc", "resolution": "1m"})
+
+        response = await async_views.ohlc_data(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [{"time": 60000, "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "volume": 10}])
+        self.assertIn("ETag", response)
+        self.assertIn("Accept", response["Vary"])
+
+        request = AsyncRequestFactory().get("/api/v1/market/ohlc/", {"instrument": "abc", "resolution": "1m"},
+                                            headers={"If-None-Match": response["ETag"]})
+        self.assertEqual((await async_views.ohlc_data(request)).status_code, 304)
+
+    @mock.patch("marketdata.async_views.get_async_db")
+    async def test_shared_cache_calls_run_off_the_event_loop(self, get_async_db):
+        get_async_db.return_value.candles.find.return_value.sort.return_value.to_list = mock.AsyncMock(return_value=[])
+        cache = ohlc_cache.OhlcCache(alias="ohlc-tests")
+        threads = []
+
+        def on_thread(method):
+            def call(*args, **kwargs):
+                threads.append(threading.get_ident())
+                return method(*args, **kwargs)
+            return call
+
+        request = AsyncRequestFactory().get("/api/v1/market/ohlc/", {"instrument": "abc", "resolution": "1m"})
+        with mock.patch("marketdata.ohlc_cache._cache", cache), \
+                mock.patch.object(cache, "version", on_thread(cache.version)), \
+                mock.patch.object(cache, "set", on_thread(cache.set)):
+            response = await async_views.ohlc_data(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(threads), 3)  # series_version, lookup, store
+        self.assertNotIn(threading.get_ident(), threads)
+
+    async def test_authenticated_endpoints_reject_anonymous_requests(self):
+        response = await async_views.quotes(AsyncRequestFactory().get("/api/v1/market/quotes/", {"instruments": "TCS"}))
+        # Session authentication comes first, so DRF answers 403 as the sync views do
+        self.assertEqual(response.status_code, 403)
+
+
+class MetricsSharingTests(SimpleTestCase):
+    def setUp(self):
+        metrics.register("test_component", lambda: {"count": 3})
+        self.addCleanup(metrics.unregister, "test_component")
+        self.client_ = fakeredis.FakeRedis()
+
+    def test_published_snapshots_are_read_back_per_process(self):
+        metrics.publish(self.client_, ttl=15)
+        self.client_.set(metrics.PROCESS_KEY_PREFIX + "ingest-host:42", json.dumps({"metrics": {"tick_writer": {"written": 7}}}))
+
+        with override_settings(REDIS_URL="redis://metrics"), \
+                mock.patch("marketdata.metrics.redis.Redis.from_url", return_value=self.client_):
+            processes = metrics.process_snapshots()
+
+        self.assertEqual(processes["ingest-host:42"]["metrics"], {"tick_writer": {"written": 7}})
+        own = processes[metrics.process_label()]
+        self.assertEqual(own["metrics"]["test_component"], {"count": 3})
+        self.assertLessEqual(self.client_.ttl(metrics.PROCESS_KEY_PREFIX + metrics.process_label()), 15)
+
+    def test_without_redis_only_this_process_is_reported(self):
+        self.assertIsNone(metrics.process_snapshots())
+
+
+class MongoClientTests(SimpleTestCase):
+    @override_settings(MONGO_COMPRESSORS=["zstd", "zlib"], MONGO_SOCKET_TIMEOUT_MS=0, MONGO_READ_PREFERENCE="secondaryPreferred")
+    def test_client_options_come_from_settings(self):
+        options = mongo_client.client_options()
+        self.assertEqual(options["compressors"], "zstd,zlib")
+        self.assertIsNone(options["socketTimeoutMS"])
+        self.assertEqual(options["readPreference"], "secondaryPreferred")
+
+    @mock.patch("marketdata.mongo_client.get_db")
+    def test_getters_do_not_touch_indexes_but_bootstrap_does(self, get_db):
+        mongo_client.get_candles_collection()
+        get_db.return_value.candles.create_index.assert_not_called()
+
+        indexes = mongo_client.ensure_market_indexes("buckets")
+        self.assertEqual(set(indexes), {"candles", "tick_buckets"})
+        self.assertEqual(get_db.return_value.candles.create_index.call_count, len(mongo_client.CANDLES_INDEXES))
+        get_db.return_value.ticks.create_index.assert_not_called()
+
+
+class PushBroadcasterTests(SimpleTestCase):
+    start = datetime(2024, 1, 10, 4, 0, tzinfo=timezone.utc)
+
+    def tick(self, seconds, instrument="NSE:A-EQ", microsecond=0):
+        return {"instrument": instrument, "timestamp": self.start + timedelta(seconds=seconds, microseconds=microsecond)}
+
+    def test_fed_ticks_older_than_the_subscribe_are_kept_unless_backfilled(self):
+        # Received just before startup, not yet written when Mongo was read
+        broadcaster = PushBroadcaster(DelayQueue(timedelta(minutes=15)), mock.AsyncMock())
+        broadcaster.backfill([self.tick(-3), self.tick(-3)])
+        broadcaster.add([self.tick(-3), self.tick(-2), self.tick(-3), self.tick(-3)])
+        self.assertEqual((len(broadcaster.queue), broadcaster.stats()["skipped"]), (4, 2))
+
+        broadcaster.end_backfill()
+        broadcaster.add([self.tick(-3)])
+        self.assertEqual(len(broadcaster.queue), 5)
+
+    def test_delay_queue_releases_in_time_order_exactly_when_due(self):
+        queue = DelayQueue(timedelta(minutes=15))
+        for seconds in (2.0, 0.5, 1.0):
+            queue.push(self.tick(seconds))
+        due_first = (self.start + timedelta(minutes=15, seconds=1)).timestamp()
+
+        self.assertEqual([t["timestamp"].second + t["timestamp"].microsecond / 1e6 for _, t in queue.pop_due(due_first)], [0.5, 1.0])
+        self.assertAlmostEqual(queue.seconds_until_next(due_first), 1.0)
+        self.assertEqual(queue.pop_due(due_first), [])
+
+    async def test_pushed_ticks_are_sent_after_the_delay(self):
+        sent = []
+
+        async def send(tick):
+            sent.append(tick)
+
+        feed = LocalTickFeed()
+        broadcaster = PushBroadcaster(DelayQueue(timedelta(minutes=15)), send)
+        batches = feed.batches()
+        broadcaster.backfill([{**self.tick(-5), "_id": ObjectId()}])
+        await broadcaster.release_due(now=self.start.timestamp() + 895)
+        self.assertEqual(len(sent), 1)
+
+        # The pipeline publishes and flushes from the ingest thread
+        def ingest():
+            feed.publish(self.tick(0))
+            feed.publish(self.tick(-5, microsecond=400))  # already backfilled from Mongo
+            feed.flush()
+        await asyncio.to_thread(ingest)
+        broadcaster.add(await batches.__anext__())
+
+        self.assertIsNotNone(await broadcaster.release_due(now=self.start.timestamp() + 899))
+        self.assertEqual(len(sent), 1)
+        self.assertIsNone(await broadcaster.release_due(now=self.start.timestamp() + 900.2))
+        self.assertEqual(sent[1:], [self.tick(0)])
+        self.assertEqual(broadcaster.stats()["skipped"], 1)
+        self.assertEqual(broadcaster.stats()["max_release_lag_ms"], 200.0)
+        await batches.aclose()
+
+
+class ConflationTests(SimpleTestCase):
+    start = datetime(2024, 1, 10, 4, 0, tzinfo=timezone.utc)
+
+    def tick(self, seconds, price, qty):
+        return {"instrument": "NSE:A-EQ", "timestamp": self.start + timedelta(seconds=seconds),
+                "price": price, "last_traded_qty": qty}
+
+    def test_newest_wins_while_volume_and_range_accumulate(self):
+        conflator = Conflator(max_per_second=2)
+        self.assertEqual(len(conflator.offer(self.tick(0.0, 100.0, 5), now=0.0)), 1)
+        for i, price in enumerate((103.0, 98.0, 101.0), start=1):
+            self.assertEqual(conflator.offer(self.tick(i * 0.1, price, 1), now=i * 0.1), [])
+
+        self.assertEqual(conflator.due(now=0.4), [])
+        self.assertAlmostEqual(conflator.seconds_until_due(now=0.4), 0.1)
+        [merged] = conflator.due(now=0.5)
+        self.assertEqual(merged["price"], 101.0)
+        self.assertEqual(merged["last_traded_qty"], 3)
+        self.assertEqual((merged["conflated_open"], merged["conflated_high"], merged["conflated_low"]), (103.0, 103.0, 98.0))
+        self.assertEqual(merged["conflated"], 3)
+        self.assertEqual(conflator.stats()["instruments"]["NSE:A-EQ"], {"ticks_in": 4, "messages_out": 2})
+
+    def test_pending_ticks_do_not_cross_a_minute(self):
+        conflator = Conflator(max_per_second=1)
+        conflator.offer(self.tick(59.0, 100.0, 1), now=0.0)
+        conflator.offer(self.tick(59.5, 101.0, 1), now=0.5)
+        out = conflator.offer(self.tick(60.2, 102.0, 1), now=0.7)
+        self.assertEqual([m["price"] for m in out], [101.0])
+        self.assertEqual(conflator.due(now=1.7)[0]["price"], 102.0)
+
+
+class SubscriptionRegistryTests(SimpleTestCase):
+    def test_refcounts_per_group(self):
+        registry = SubscriptionRegistry()
+        registry.add("NSE_A-EQ")
+        registry.add("NSE_A-EQ")
+        registry.add("NSE_B-EQ")
+        registry.remove("NSE_A-EQ")
+        registry.remove("NSE_B-EQ")
+        registry.remove("NSE_B-EQ")
+
+        self.assertTrue(registry.is_watched("NSE_A-EQ"))
+        self.assertFalse(registry.is_watched("NSE_B-EQ"))
+        stats = registry.stats()
+        self.assertEqual((stats["active_groups"], stats["subscribers"]), (1, 1))
+
+    def test_shared_counts_are_read_once_per_interval(self):
+        client = mock.Mock()
+        client.hgetall.return_value = {b"NSE_A-EQ": b"2", b"NSE_B-EQ": b"0"}
+        registry = SubscriptionRegistry(client=client, refresh_interval=1.0)
+
+        self.assertEqual(registry.counts(now=10.0), {"NSE_A-EQ": 2})
+        registry.counts(now=10.5)
+        self.assertEqual(client.hgetall.call_count, 1)
+        registry.counts(now=11.0)
+        self.assertEqual(client.hgetall.call_count, 2)
+
+        registry.remove_many(["NSE_C-EQ", "NSE_D-EQ"])
+        pipe = client.pipeline.return_value
+        self.assertEqual(pipe.hincrby.call_args_list, [
+            mock.call(SubscriptionRegistry.KEY, "NSE_C-EQ", -1), mock.call(SubscriptionRegistry.KEY, "NSE_D-EQ", -1),
+        ])
+        pipe.execute.assert_called_once()
+        client.hdel.assert_not_called()
+
+    def test_broadcaster_skips_unwatched_instruments(self):
+        registry = SubscriptionRegistry()
+        registry.add("NSE_A-EQ")
+        sent = []
+
+        async def send(tick):
+            sent.append(tick["instrument"])
+
+        start = datetime(2024, 1, 10, 4, 0, tzinfo=timezone.utc)
+        queue = DelayQueue(timedelta(0))
+        broadcaster = PushBroadcaster(queue, send, registry=registry)
+        broadcaster.add([{"instrument": i, "timestamp": start, "price": 1.0} for i in ("NSE:A-EQ", "B", "A")])
+        asyncio.run(broadcaster.release_due(now=start.timestamp()))
+
+        self.assertEqual(sent, ["NSE:A-EQ", "A"])
+        self.assertEqual(registry.stats()["skipped_ticks"], 1)
+
+
+class ChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        self.server = fakeredis.TcpFakeServer(("127.0.0.1", 0))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"redis://127.0.0.1:{self.server.server_address[1]}/0"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_broadcaster_reaches_consumers_in_every_worker(self):
+        async def scenario():
+            workers = [RedisPubSubChannelLayer(hosts=[self.url]) for _ in range(2)]
+            broadcaster = RedisPubSubChannelLayer(hosts=[self.url])
+            channels = []
+            for layer in workers:
+                channel = await layer.new_channel()
+                await layer.group_add("NSE_A-EQ", channel)
+                channels.append(channel)
+
+            await broadcaster.group_send("NSE_A-EQ", {"type": "marketdata.message", "message": {"price": 1.0}})
+            received = [
+                await asyncio.wait_for(layer.receive(channel), timeout=5)
+                for layer, channel in zip(workers, channels)
+            ]
+            for layer in workers + [broadcaster]:
+                await layer.flush()
+            return received
+
+        received = asyncio.run(scenario())
+        self.assertEqual([m["message"]["price"] for m in received], [1.0, 1.0])
+
+    def test_subscription_registry_shares_the_layer_server(self):
+        layers = {"default": {
+            "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+            "CONFIG": {"hosts": [self.url]},
+        }}
+        with override_settings(CHANNEL_LAYERS=layers):
+            self.assertEqual(channel_layer_redis_url(), self.url)
+        with override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}):
+            self.assertIsNone(channel_layer_redis_url())
+
+
+@mock.patch("marketdata.consumers.get_subscription_registry", side_effect=SubscriptionRegistry)
+class ConsumerBatchingTests(SimpleTestCase):
+    async def exchange(self, subscribe, ticks):
+        communicator = WebsocketCommunicator(MarketDataConsumer.as_asgi(), "/ws/marketdata/")
+        communicator.scope["user"] = mock.Mock(is_anonymous=False, id=1, username="trader")
+        await communicator.connect()
+        await communicator.receive_json_from()  # connected
+        await communicator.send_json_to({"type": "subscribe", "instrument": "NSE:A-EQ", **subscribe})
+        reply = await communicator.receive_json_from()
+
+        for price in ticks:
+            await get_channel_layer().group_send(
+                "NSE_A-EQ", {"type": "marketdata.message", "text": encode_tick({"price": price})}
+            )
+        frames = []
+        while len([t for f in frames for t in (f if isinstance(f, list) else [f])]) < len(ticks):
+            frames.append(await communicator.receive_json_from(timeout=2))
+        await communicator.disconnect()
+        return reply, frames
+
+    def test_ticks_are_sent_one_frame_each_by_default(self, _):
+        reply, frames = asyncio.run(self.exchange({}, [1.0, 2.0]))
+        self.assertNotIn("batch_ms", reply)
+        self.assertEqual(frames, [{"_id": "", "price": 1.0, "type": "tick"}, {"_id": "", "price": 2.0, "type": "tick"}])
+
+    def test_batching_sends_ticks_of_a_window_as_one_array(self, _):
+        reply, frames = asyncio.run(self.exchange({"batch": 50}, [1.0, 2.0, 3.0]))
+        self.assertEqual(reply["batch_ms"], 50)
+        self.assertEqual(frames, [[{"_id": "", "price": p, "type": "tick"} for p in (1.0, 2.0, 3.0)]])
+
+
+class TickMessageTests(SimpleTestCase):
+    def test_encoding_matches_the_hand_built_message(self):
+        oid = ObjectId()
+        timestamp = datetime(2024, 1, 10, 4, 0, 1, 250000, tzinfo=timezone.utc)
+        tick = {"_id": oid, "instrument": "NSE:A-EQ", "timestamp": timestamp, "price": 101.5}
+
+        self.assertEqual(json.loads(encode_tick(tick)), {
+            "_id": str(oid), "instrument": "NSE:A-EQ", "timestamp": timestamp.isoformat(),
+            "price": 101.5, "type": "tick",
+        })
+        self.assertNotIn("type", tick)
+
+
+class DeltaEncodingTests(SimpleTestCase):
+    start = datetime(2024, 1, 10, 4, 0, tzinfo=timezone.utc)
+
+    def tick(self, seconds, price, **extra):
+        return {"instrument": "NSE:A-EQ", "timestamp": self.start + timedelta(seconds=seconds),
+                "price": price, "open": 100.0, "high": 105.0, **extra}
+
+    def test_deltas_carry_changed_fields_and_keyframes_recur(self):
+        encoder = DeltaEncoder(keyframe_interval=5.0)
+        keyframe, shared = encoder.encode(self.tick(0, 101.0, conflated=2), now=0.0)
+        self.assertEqual(shared, keyframe)
+        self.assertEqual(json.loads(keyframe), {
+            "k": 1, "s": "NSE:A-EQ", "t": int(self.start.timestamp() * 1000), "p": 101.0, "o": 100.0, "h": 105.0, "xn": 2,
+        })
+
+        _, shared = encoder.encode(self.tick(1, 101.0), now=1.0)
+        self.assertEqual(json.loads(shared), {"s": "NSE:A-EQ", "t": int(self.start.timestamp() * 1000) + 1000, "xn": None})
+
+        _, shared = encoder.encode(self.tick(5, 102.0), now=5.0)
+        self.assertEqual(json.loads(shared)["k"], 1)
+        self.assertEqual((encoder.stats()["keyframes"], encoder.stats()["deltas"]), (2, 1))
+
+    @override_settings(WS_COMPACT_STREAM=True)
+    @mock.patch("marketdata.consumers.delayed_snapshots")
+    @mock.patch("marketdata.consumers.get_subscription_registry", side_effect=SubscriptionRegistry)
+    def test_compact_consumer_sends_keyframe_first_then_deltas(self, _, delayed_snapshots):
+        delayed_snapshots.return_value = {"NSE:A-EQ": self.tick(0, 100.5)}
+        encoder = DeltaEncoder(keyframe_interval=60.0)
+        encoder.encode(self.tick(0, 100.5), now=0.0)
+
+        async def scenario():
+            communicator = WebsocketCommunicator(MarketDataConsumer.as_asgi(), "/ws/marketdata/")
+            communicator.scope["user"] = mock.Mock(is_anonymous=False, id=1, username="trader")
+            await communicator.connect()
+            await communicator.receive_json_from()  # connected
+            await communicator.send_json_to({"type": "subscribe", "instrument": "NSE:A-EQ", "compact": True})
+            frames = [await communicator.receive_json_from() for _ in range(2)]  # reply, snapshot
+
+            for seconds, price in ((1, 101.0), (2, 101.5)):
+                tick = self.tick(seconds, price)
+                keyframe, delta = encoder.encode(tick, now=seconds)
+                await get_channel_layer().group_send("NSE_A-EQ", {
+                    "type": "marketdata.message", "group": "NSE_A-EQ",
+                    "text": encode_tick(tick), "keyframe": keyframe, "delta": delta,
+                })
+                frames.append(await communicator.receive_json_from(timeout=2))
+            await communicator.disconnect()
+            return frames
+
+        reply, snapshot, first, second = asyncio.run(scenario())
+        self.assertTrue(reply["compact"])
+        self.assertEqual(snapshot["type"], "snapshot")
+        self.assertEqual([(t["k"], t["p"]) for t in snapshot["ticks"]], [(1, 100.5)])
+        self.assertEqual((first["k"], first["p"], first["o"]), (1, 101.0, 100.0))
+        self.assertEqual(set(second), {"s", "t", "p"})
+
+    @mock.patch("marketdata.consumers.delayed_snapshots", return_value={})
+    @mock.patch("marketdata.consumers.get_subscription_registry", side_effect=SubscriptionRegistry)
+    def test_compact_is_ignored_unless_the_stream_is_enabled(self, *_):
+        tick = self.tick(1, 101.0)
+
+        async def scenario():
+            communicator = WebsocketCommunicator(MarketDataConsumer.as_asgi(), "/ws/marketdata/")
+            communicator.scope["user"] = mock.Mock(is_anonymous=False, id=1, username="trader")
+            await communicator.connect()
+            await communicator.receive_json_from()  # connected
+            await communicator.send_json_to({"type": "subscribe", "instrument": "NSE:A-EQ", "compact": True})
+            reply = await communicator.receive_json_from()
+            await get_channel_layer().group_send("NSE_A-EQ", {
+                "type": "marketdata.message", "group": "NSE_A-EQ", "text": encode_tick(tick),
+            })
+            frame = await communicator.receive_json_from(timeout=2)
+            await communicator.disconnect()
+            return reply, frame
+
+        reply, frame = asyncio.run(scenario())
+        self.assertNotIn("compact", reply)
+        self.assertEqual((frame["instrument"], frame["price"]), ("NSE:A-EQ", 101.0))
+
+
+class BulkSubscribeTests(SimpleTestCase):
+    @mock.patch("marketdata.consumers.get_snapshot_store")
+    def test_subscribe_many_joins_every_group_and_sends_one_snapshot(self, get_snapshot_store):
+        store = snapshots.SnapshotStore()
+        store.attach()
+        store.seed(live={}, delayed={
+            "NSE:A-EQ": {"instrument": "NSE:A-EQ", "price": 10.0},
+            "NSE:B-EQ": {"instrument": "NSE:B-EQ", "price": 20.0},
+        })
+        get_snapshot_store.return_value = store
+        registry = SubscriptionRegistry()
+        instruments = ["NSE:A-EQ", "NSE:B-EQ", "NSE:C-EQ"]
+
+        async def scenario():
+            communicator = WebsocketCommunicator(MarketDataConsumer.as_asgi(), "/ws/marketdata/")
+            communicator.scope["user"] = mock.Mock(is_anonymous=False, id=1, username="trader")
+            await communicator.connect()
+            await communicator.receive_json_from()  # connected
+            await communicator.send_json_to({"type": "subscribe_many", "instruments": instruments})
+            reply, snapshot = await communicator.receive_json_from(), await communicator.receive_json_from()
+            watched = registry.counts()
+
+            await get_channel_layer().group_send(
+                "NSE_C-EQ", {"type": "marketdata.message", "text": encode_tick({"instrument": "NSE:C-EQ"})}
+            )
+            tick = await communicator.receive_json_from(timeout=2)
+            await communicator.send_json_to({"type": "unsubscribe_many", "instruments": instruments[:2]})
+            unsubscribed = await communicator.receive_json_from()
+            remaining = registry.counts()
+            await communicator.disconnect()
+            return reply, snapshot, watched, tick, unsubscribed, remaining
+
+        with mock.patch("marketdata.consumers.get_subscription_registry", return_value=registry):
+            reply, snapshot, watched, tick, unsubscribed, remaining = asyncio.run(scenario())
+
+        self.assertEqual(reply, {"status": "subscribed", "instruments": instruments})
+        self.assertEqual(snapshot["type"], "snapshot")
+        self.assertEqual({t["instrument"]: t["price"] for t in snapshot["ticks"]}, {"NSE:A-EQ": 10.0, "NSE:B-EQ": 20.0})
+        self.assertEqual(watched, {"NSE_A-EQ": 1, "NSE_B-EQ": 1, "NSE_C-EQ": 1})
+        self.assertEqual(tick["instrument"], "NSE:C-EQ")
+        self.assertEqual(unsubscribed["status"], "unsubscribed")
+        self.assertEqual(remaining, {"NSE_C-EQ": 1})
+
+    @mock.patch("marketdata.consumers.delayed_snapshots", return_value={})
+    def test_disconnect_releases_every_subscription_in_one_registry_call(self, _):
+        registry = SubscriptionRegistry()
+
+        async def scenario():
+            communicator = WebsocketCommunicator(MarketDataConsumer.as_asgi(), "/ws/marketdata/")
+            communicator.scope["user"] = mock.Mock(is_anonymous=False, id=1, username="trader")
+            await communicator.connect()
+            await communicator.receive_json_from()  # connected
+            await communicator.send_json_to({"type": "subscribe_many", "instruments": ["NSE:A-EQ", "NSE:B-EQ"]})
+            await communicator.receive_json_from()
+            await communicator.disconnect()
+
+        with mock.patch("marketdata.consumers.get_subscription_registry", return_value=registry), \
+                mock.patch.object(registry, "remove", wraps=registry.remove) as remove, \
+                mock.patch.object(registry, "remove_many", wraps=registry.remove_many) as remove_many:
+            asyncio.run(scenario())
+
+        remove.assert_not_called()
+        remove_many.assert_called_once()
+        self.assertEqual(sorted(remove_many.call_args.args[0]), ["NSE_A-EQ", "NSE_B-EQ"])
+        self.assertEqual(registry.counts(), {})
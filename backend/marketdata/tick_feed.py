@@ -0,0 +1,220 @@
+# backend/marketdata/tick_feed.py
+"""
+Push delivery of live ticks from the ingest pipeline to the delayed broadcaster.
+
+The pipeline publishes every tick to the feed and hands the accumulated batch over
+once per flush (about a second). The broadcaster keeps them in a DelayQueue and sends
+each one when it turns 15 minutes old, so it never polls the ticks collection.
+
+- LocalTickFeed: in-process; batches are handed to asyncio consumers with
+  call_soon_threadsafe. Used when ingest and broadcaster share a process (the
+  default, both are started from the marketdata app's ready()).
+- RedisTickFeed: one Redis stream entry per batch (`ticks:feed`, capped with MAXLEN),
+  for a broadcaster running in another process. Chosen when REDIS_URL is set.
+
+Batching only delays a tick's arrival in the queue by up to a flush interval; its
+release time is fixed by its own timestamp.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+from datetime import timezone
+
+import redis
+import redis.asyncio as aioredis
+from bson import json_util
+from django.conf import settings
+
+from . import metrics
+from .ohlc import DELAY
+
+logger = logging.getLogger(__name__)
+
+
+def tick_epoch(tick):
+    timestamp = tick["timestamp"]
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+class DelayQueue:
+    """
+    Ticks ordered by release time (timestamp + delay). push and pop are O(log n);
+    nothing is ever scanned. When full, new ticks are dropped and counted.
+    """
+
+    def __init__(self, delay=DELAY, max_size=None):
+        self.delay = delay.total_seconds()
+        self.max_size = max_size
+        self._heap = []
+        self._seq = itertools.count()  # tie-breaker: equal timestamps keep arrival order
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, tick):
+        if self.max_size is not None and len(self._heap) >= self.max_size:
+            self.dropped += 1
+            return False
+        heapq.heappush(self._heap, (tick_epoch(tick) + self.delay, next(self._seq), tick))
+        return True
+
+    def pop_due(self, now):
+        """[(release_at, tick), ...] of every tick due at `now` (epoch seconds), oldest first."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            release_at, _, tick = heapq.heappop(self._heap)
+            due.append((release_at, tick))
+        return due
+
+    def seconds_until_next(self, now):
+        """Seconds until the next tick is due, or None when empty."""
+        return max(0.0, self._heap[0][0] - now) if self._heap else None
+
+
+class LocalTickFeed:
+    def __init__(self, max_pending=100000):
+        self.max_pending = max_pending
+        self._pending = []
+        self._subscribers = {}  # asyncio.Queue -> its event loop
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, tick):
+        with self._lock:
+            if not self._subscribers:
+                return
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending.append(tick)
+
+    def flush(self):
+        """Hand the pending batch to every subscriber's loop."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+            subscribers = list(self._subscribers.items())
+            self.published += len(batch)
+        if not batch:
+            return
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, batch)
+            except RuntimeError:
+                # The consumer's loop has closed without unsubscribing
+                self.unsubscribe(queue)
+
+    def subscribe(self):
+        """An asyncio.Queue of tick batches; call from the consuming event loop."""
+        queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def batches(self, since=None):
+        """
+        Async iterator of tick batches published from now on. Subscribes immediately,
+        so nothing published after this call is missed; `since` is not needed here.
+        """
+        return self._drain(self.subscribe())
+
+    async def _drain(self, queue):
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.unsubscribe(queue)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "source": "local",
+                "subscribers": len(self._subscribers),
+                "pending": len(self._pending),
+                "published": self.published,
+                "dropped": self.dropped,
+            }
+
+
+class RedisTickFeed:
+    STREAM_KEY = "ticks:feed"
+
+    def __init__(self, url, maxlen=10000):
+        self.url = url
+        self.maxlen = maxlen
+        self._client = redis.Redis.from_url(url)
+        self._pending = []
+        self._lock = threading.Lock()
+        self.published = 0
+        self.errors = 0
+
+    def publish(self, tick):
+        with self._lock:
+            self._pending.append(tick)
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            self._client.xadd(self.STREAM_KEY, {"batch": json_util.dumps(batch)}, maxlen=self.maxlen, approximate=True)
+            with self._lock:
+                self.published += len(batch)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            logger.warning(f"tick_feed: could not publish {len(batch)} ticks to Redis: {e}")
+
+    def batches(self, since=None):
+        """
+        Async iterator of tick batches added to the stream after `since` (epoch
+        seconds; stream ids start with their insertion time in ms), or from now on.
+        """
+        return self._read(f"{int(since * 1000)}-0" if since else "$")
+
+    async def _read(self, last_id):
+        client = aioredis.Redis.from_url(self.url)
+        try:
+            while True:
+                response = await client.xread({self.STREAM_KEY: last_id}, block=1000, count=100)
+                for _, entries in response:
+                    for entry_id, fields in entries:
+                        last_id = entry_id
+                        yield json_util.loads(fields[b"batch"])
+        finally:
+            await client.aclose()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "source": "redis",
+                "pending": len(self._pending),
+                "published": self.published,
+                "errors": self.errors,
+            }
+
+
+_feed = None
+_feed_lock = threading.Lock()
+
+
+def get_tick_feed():
+    global _feed
+    with _feed_lock:
+        if _feed is None:
+            if settings.REDIS_URL:
+                _feed = RedisTickFeed(settings.REDIS_URL, maxlen=settings.TICK_FEED_STREAM_MAXLEN)
+            else:
+                _feed = LocalTickFeed()
+            metrics.register("tick_feed", _feed.stats)
+        return _feed
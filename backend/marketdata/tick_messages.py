@@ -0,0 +1,140 @@
+# backend/marketdata/tick_messages.py
+"""
+Websocket payloads of broadcast ticks.
+
+The broadcaster encodes each tick once, with orjson, and the channel layer carries
+the JSON text (`{"type": "marketdata.message", "text": ...}`). Every subscribed
+MarketDataConsumer forwards that text as-is, so the cost of a tick no longer grows
+with one json.dumps per subscriber, and the layer copies one string instead of a
+dict per recipient. Datetimes come out as ISO 8601 (as `datetime.isoformat()`) and
+ObjectIds as their hex string.
+
+The compact stream (below) is encoded the same way, once per tick.
+"""
+import orjson
+from bson import ObjectId
+
+from .tick_feed import tick_epoch
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Cannot encode {type(value).__name__} in a tick message")
+
+
+def encode_tick(tick):
+    """The JSON text of one tick frame (the tick's fields plus `"type": "tick"`)."""
+    message = {"_id": ""}
+    message.update(tick)
+    message["type"] = "tick"
+    return orjson.dumps(message, default=_default).decode()
+
+
+def join_frames(texts):
+    """One JSON array frame from already encoded messages."""
+    return "[" + ",".join(texts) + "]"
+
+
+def snapshot_frame(texts):
+    """The frame of the latest ticks sent on subscribe: {"type": "snapshot", "ticks": [...]}."""
+    return '{"type":"snapshot","ticks":' + join_frames(texts) + "}"
+
+
+# --- Compact stream (opted into with `"compact": true` on subscribe, when WS_COMPACT_STREAM is on) ---
+#
+# Frames use the short keys below, `t` is epoch milliseconds and `_id` is left out.
+# A keyframe (`"k": 1`) carries every field; a delta carries `s` plus the fields that
+# changed since the instrument's previous message (null for fields that went away).
+# Deltas are relative to the previous broadcast message of the instrument, so they
+# are computed once in the broadcaster and shared by every compact subscriber: a
+# consumer sends the keyframe for an instrument's first message and deltas after
+# that. Every WS_KEYFRAME_INTERVAL seconds the shared delta is a keyframe again, so
+# clients that missed a message resynchronize.
+
+COMPACT_KEYS = {
+    "instrument": "s",
+    "timestamp": "t",
+    "price": "p",
+    "volume_traded_today": "v",
+    "last_traded_qty": "q",
+    "avg_trade_price": "a",
+    "open": "o",
+    "high": "h",
+    "low": "l",
+    "close": "c",
+    "change": "ch",
+    "change_percent": "cp",
+    "conflated_open": "xo",
+    "conflated_high": "xh",
+    "conflated_low": "xl",
+    "conflated": "xn",
+}
+
+
+def compact_fields(tick):
+    """The tick under its short keys."""
+    fields = {}
+    for name, value in tick.items():
+        if name in ("_id", "type"):
+            continue
+        if name == "timestamp":
+            value = round(tick_epoch(tick) * 1000)
+        fields[COMPACT_KEYS.get(name, name)] = value
+    return fields
+
+
+def encode_keyframe(tick):
+    return orjson.dumps({"k": 1, **compact_fields(tick)}, default=_default).decode()
+
+
+class DeltaEncoder:
+    def __init__(self, keyframe_interval=5.0, name="delta_encoding"):
+        self.keyframe_interval = keyframe_interval
+        self.name = name
+        self._last = {}       # instrument -> compact fields of its previous message
+        self._keyed_at = {}   # instrument -> time of its last shared keyframe
+        self.keyframes = 0
+        self.deltas = 0
+        self.keyframe_bytes = 0
+        self.delta_bytes = 0
+
+    def encode(self, tick, now):
+        """
+        (keyframe, shared) texts of one tick: `shared` is what clients already in sync
+        receive, a delta or, when one is due, the keyframe.
+        """
+        fields = compact_fields(tick)
+        instrument = fields.get("s")
+        previous = self._last.get(instrument)
+        self._last[instrument] = fields
+        keyframe = orjson.dumps({"k": 1, **fields}, default=_default).decode()
+        self.keyframe_bytes += len(keyframe)
+
+        if previous is None or now - self._keyed_at.get(instrument, float("-inf")) >= self.keyframe_interval:
+            self._keyed_at[instrument] = now
+            self.keyframes += 1
+            return keyframe, keyframe
+
+        delta = {"s": instrument}
+        for key, value in fields.items():
+            if key not in previous or previous[key] != value:
+                delta[key] = value
+        for key in previous:
+            if key not in fields:
+                delta[key] = None
+        shared = orjson.dumps(delta, default=_default).decode()
+        self.deltas += 1
+        self.delta_bytes += len(shared)
+        return keyframe, shared
+
+    def stats(self):
+        messages = self.keyframes + self.deltas
+        return {
+            "keyframe_interval": self.keyframe_interval,
+            "instruments": len(self._last),
+            "keyframes": self.keyframes,
+            "deltas": self.deltas,
+            "avg_keyframe_bytes": round(self.keyframe_bytes / messages, 1) if messages else 0.0,
+            "avg_delta_bytes": round(self.delta_bytes / self.deltas, 1) if self.deltas else 0.0,
+        }
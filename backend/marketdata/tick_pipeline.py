@@ -0,0 +1,119 @@
+# backend/marketdata/tick_pipeline.py
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from . import metrics, tick_store
+from .candle_builder import CandleBuilder
+from .mongo_client import ensure_market_indexes
+from .ohlc import DELAY
+from .snapshots import get_snapshot_store
+from .tick_feed import get_tick_feed
+from .tick_writer import BufferedTickWriter
+
+logger = logging.getLogger(__name__)
+
+
+class TickPipeline:
+    """
+    The single write path every ingest connection feeds: each tick document is queued
+    for the buffered Mongo writer, folded into the live 1m candle builder, recorded
+    as the instrument's latest snapshot (see marketdata/snapshots.py) and published
+    to the delayed broadcaster (see marketdata/tick_feed.py).
+    Also keeps per-shard tick counters so load across socket shards can be compared.
+    """
+
+    def __init__(self, name="tick_pipeline"):
+        self.name = name
+        self.writer = BufferedTickWriter(
+            write_batch=tick_store.tick_sink(),
+            max_queue=settings.TICK_WRITER_MAX_QUEUE,
+            batch_size=settings.TICK_WRITER_BATCH_SIZE,
+            flush_interval=settings.TICK_WRITER_FLUSH_INTERVAL,
+            put_timeout=settings.TICK_WRITER_PUT_TIMEOUT,
+        )
+        self.candle_builder = CandleBuilder(
+            close_delay=settings.CANDLE_BUILDER_CLOSE_DELAY,
+            checkpoint_interval=settings.CANDLE_BUILDER_CHECKPOINT_INTERVAL,
+        )
+        self.snapshots = get_snapshot_store()
+        self.feed = get_tick_feed()
+
+        self._shard_lock = threading.Lock()
+        self._shard_ticks = {}    # shard id -> ticks received
+        self._shard_dropped = {}  # shard id -> ticks lost between a shard process and this pipeline
+        self._shard_rates = {}    # shard id -> ticks/s over the last flush interval
+        self._last_sample = (time.monotonic(), {})
+
+    def start(self, symbols):
+        # Idempotent; covers deployments that never ran the ensure_market_indexes command
+        ensure_market_indexes(tick_store.storage_mode())
+        self.writer.start()
+        resumed = self.candle_builder.seed(symbols)
+        self._seed_snapshots()
+        self.snapshots.attach()
+        metrics.register(self.name, self.stats)
+        return resumed
+
+    def stop(self):
+        self.snapshots.detach()
+        self.writer.stop()
+        self.candle_builder.flush()
+        self.snapshots.publish()
+        self.feed.flush()
+
+    def process(self, document, shard=0):
+        self.writer.submit(document)
+        self.candle_builder.add_tick(document)
+        self.snapshots.update(document)
+        self.feed.publish(document)
+        with self._shard_lock:
+            self._shard_ticks[shard] = self._shard_ticks.get(shard, 0) + 1
+
+    def record_dropped(self, shard, count):
+        with self._shard_lock:
+            self._shard_dropped[shard] = self._shard_dropped.get(shard, 0) + count
+
+    def flush(self):
+        """Periodic housekeeping, called about once a second by the ingest loop."""
+        self.candle_builder.flush()
+        self.snapshots.publish()
+        self.feed.flush()
+
+        now = time.monotonic()
+        with self._shard_lock:
+            totals = dict(self._shard_ticks)
+        then, previous = self._last_sample
+        if now > then:
+            self._shard_rates = {
+                shard: round((count - previous.get(shard, 0)) / (now - then), 1)
+                for shard, count in totals.items()
+            }
+        self._last_sample = (now, totals)
+
+    def _seed_snapshots(self):
+        # Stored ticks cover the time before this run, in particular the delayed view,
+        # which the feed alone would only fill 15 minutes after startup.
+        now = datetime.now(timezone.utc)
+        try:
+            self.snapshots.seed(live=tick_store.latest_ticks(now), delayed=tick_store.latest_ticks(now - DELAY))
+        except Exception as e:
+            logger.warning(f"{self.name}: could not seed snapshots from stored ticks: {e}")
+
+    def stats(self):
+        with self._shard_lock:
+            shard_ticks = dict(self._shard_ticks)
+            shard_dropped = dict(self._shard_dropped)
+        return {
+            "shards": {
+                str(shard): {
+                    "ticks": count,
+                    "ticks_per_second": self._shard_rates.get(shard, 0.0),
+                    "dropped": shard_dropped.get(shard, 0),
+                }
+                for shard, count in sorted(shard_ticks.items())
+            },
+        }
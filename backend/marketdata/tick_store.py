@@ -0,0 +1,235 @@
+# backend/marketdata/tick_store.py
+"""
+Tick storage layouts and the readers shared by every tick consumer.
+
+TICK_STORAGE_MODE selects how ticks are persisted:
+
+- "documents": one document per tick in the `ticks` collection (the original layout).
+- "buckets":   one document per instrument per minute in `tick_buckets`, holding the
+               ticks as parallel arrays (`ts[]`, `price[]`, `qty[]`, ...). Ticks are
+               appended with $push; once a bucket reaches TICK_BUCKET_MAX_COUNT ticks
+               the next write opens an overflow bucket for the same minute.
+
+latest_tick_data, replay_broadcaster and order_executor read through the helpers
+below, so they work unchanged with either layout. Bucket readers assume ticks of an
+instrument arrive in time order, which is how the feed delivers them.
+"""
+from datetime import timezone
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from pymongo import UpdateOne
+
+from .mongo_client import get_tick_buckets_collection, get_ticks_collection
+
+TICK_STORAGE_MODES = ("documents", "buckets")
+
+# Tick document field -> parallel array holding it in a bucket
+BUCKET_FIELDS = {
+    "timestamp": "ts",
+    "price": "price",
+    "last_traded_qty": "qty",
+    "volume_traded_today": "vol",
+    "avg_trade_price": "atp",
+    "open": "open",
+    "high": "high",
+    "low": "low",
+    "close": "close",
+    "change": "ch",
+    "change_percent": "chp",
+}
+
+
+def storage_mode(mode=None):
+    mode = mode or settings.TICK_STORAGE_MODE
+    if mode not in TICK_STORAGE_MODES:
+        raise ImproperlyConfigured(f"TICK_STORAGE_MODE must be one of {TICK_STORAGE_MODES}, got '{mode}'.")
+    return mode
+
+
+def bucket_minute(timestamp):
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def _utc(timestamp):
+    # Documents read back without tz_aware come out as naive UTC datetimes
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+
+# --- Writers ---
+
+def tick_sink(mode=None):
+    """The BufferedTickWriter sink for the configured storage mode."""
+    if storage_mode(mode) == "buckets":
+        return insert_tick_buckets
+    from .tick_writer import insert_ticks
+    return insert_ticks
+
+
+def bucket_updates(batch, max_count):
+    """One $push upsert per (instrument, minute) group of the batch."""
+    groups = {}
+    for tick in batch:
+        groups.setdefault((tick["instrument"], bucket_minute(tick["timestamp"])), []).append(tick)
+
+    operations = []
+    for (instrument, minute), ticks in groups.items():
+        timestamps = [t["timestamp"] for t in ticks]
+        operations.append(UpdateOne(
+            {"instrument": instrument, "minute": minute, "count": {"$lt": max_count}},
+            {
+                "$push": {
+                    array: {"$each": [t.get(field) for t in ticks]}
+                    for field, array in BUCKET_FIELDS.items()
+                },
+                "$inc": {"count": len(ticks)},
+                "$min": {"first_ts": min(timestamps)},
+                "$max": {"last_ts": max(timestamps)},
+            },
+            upsert=True,
+        ))
+    return operations
+
+
+def insert_tick_buckets(batch, collection=None):
+    """Bucket-mode sink: append the batch to its minute buckets in one unordered bulk_write."""
+    collection = collection if collection is not None else get_tick_buckets_collection()
+    operations = bucket_updates(batch, settings.TICK_BUCKET_MAX_COUNT)
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+
+
+# --- Readers ---
+
+def unpack_bucket(bucket):
+    """Expand a bucket into tick documents shaped like those in `ticks` (without _id)."""
+    arrays = [(field, bucket.get(array, [])) for field, array in BUCKET_FIELDS.items()]
+    return [
+        {"instrument": bucket["instrument"], **{field: values[i] for field, values in arrays}}
+        for i in range(len(bucket.get("ts", [])))
+    ]
+
+
+def _latest_tick_query(instrument, mode):
+    """(collection name, filter, sort) whose first document holds the latest tick."""
+    if mode == "documents":
+        return "ticks", {"instrument": instrument}, [("timestamp", -1)]
+    return "tick_buckets", {"instrument": instrument}, [("minute", -1), ("last_ts", -1)]
+
+
+def _latest_tick_result(doc, mode):
+    if mode == "documents" or not doc:
+        return doc
+    return max(unpack_bucket(doc), key=lambda t: t["timestamp"], default=None)
+
+
+def latest_tick(instrument, mode=None, collection=None):
+    """The most recent tick document of an instrument, or None."""
+    mode = storage_mode(mode)
+    name, query, sort = _latest_tick_query(instrument, mode)
+    collection = collection if collection is not None else get_ticks_collection().database[name]
+    return _latest_tick_result(collection.find_one(query, sort=sort), mode)
+
+
+async def latest_tick_async(db, instrument, mode=None):
+    """Motor version of `latest_tick`; `db` is a motor database."""
+    mode = storage_mode(mode)
+    name, query, sort = _latest_tick_query(instrument, mode)
+    return _latest_tick_result(await db[name].find_one(query, sort=sort), mode)
+
+
+def _latest_ticks_query(cutoff, mode, instruments):
+    """(collection name, aggregation pipeline) grouping the latest tick or bucket per instrument."""
+    scope = {'instrument': {'$in': list(instruments)}} if instruments is not None else {}
+    if mode == "documents":
+        return "ticks", [
+            {'$match': {**scope, 'timestamp': {'$lte': cutoff}}},
+            {'$sort': {'timestamp': -1}},
+            {'$group': {'_id': '$instrument', 'tick': {'$first': '$$ROOT'}}},
+        ]
+    return "tick_buckets", [
+        # first_ts <= cutoff guarantees the chosen bucket holds at least one eligible tick
+        {'$match': {**scope, 'minute': {'$lte': cutoff}, 'first_ts': {'$lte': cutoff}}},
+        {'$sort': {'minute': -1, 'first_ts': -1}},
+        {'$group': {'_id': '$instrument', 'bucket': {'$first': '$$ROOT'}}},
+    ]
+
+
+def _latest_ticks_result(docs, cutoff, mode):
+    if mode == "documents":
+        return {doc['_id']: doc['tick'] for doc in docs}
+    cutoff = _utc(cutoff)
+    ticks = {}
+    for doc in docs:
+        eligible = [t for t in unpack_bucket(doc['bucket']) if _utc(t['timestamp']) <= cutoff]
+        if eligible:
+            ticks[doc['_id']] = max(eligible, key=lambda t: _utc(t['timestamp']))
+    return ticks
+
+
+def latest_ticks(cutoff, mode=None, collection=None, instruments=None):
+    """
+    {instrument: tick document} of the last tick at or before `cutoff` for every
+    instrument, or only for `instruments` (one $in query however many are asked for).
+    """
+    mode = storage_mode(mode)
+    name, pipeline = _latest_ticks_query(cutoff, mode, instruments)
+    collection = collection if collection is not None else get_ticks_collection().database[name]
+    return _latest_ticks_result(collection.aggregate(pipeline), cutoff, mode)
+
+
+async def latest_ticks_async(db, cutoff, mode=None, instruments=None):
+    """Motor version of `latest_ticks`; `db` is a motor database."""
+    mode = storage_mode(mode)
+    name, pipeline = _latest_ticks_query(cutoff, mode, instruments)
+    docs = await db[name].aggregate(pipeline).to_list(None)
+    return _latest_ticks_result(docs, cutoff, mode)
+
+
+def latest_prices(cutoff, mode=None, collection=None):
+    """{instrument: price} of the last tick at or before `cutoff` for every instrument."""
+    return {instrument: tick['price'] for instrument, tick in latest_ticks(cutoff, mode, collection).items()}
+
+
+def _replay_query(start, end, mode):
+    """(collection name, filter, sort) returning the ticks in (start, end]."""
+    if mode == "documents":
+        return "ticks", {"timestamp": {"$gt": start, "$lte": end}}, [("timestamp", 1)]
+    return "tick_buckets", {"minute": {"$gte": bucket_minute(start), "$lte": end}}, [("minute", 1)]
+
+
+def _ticks_in_window(buckets, start, end):
+    start, end = _utc(start), _utc(end)
+    ticks = [
+        tick
+        for bucket in buckets
+        for tick in unpack_bucket(bucket)
+        if start < _utc(tick["timestamp"]) <= end
+    ]
+    ticks.sort(key=lambda t: _utc(t["timestamp"]))
+    return ticks
+
+
+def replay_ticks(start, end, mode=None, collection=None):
+    """Tick documents with start < timestamp <= end, oldest first."""
+    mode = storage_mode(mode)
+    name, query, sort = _replay_query(start, end, mode)
+    collection = collection if collection is not None else get_ticks_collection().database[name]
+    cursor = collection.find(query).sort(sort)
+    if mode == "documents":
+        yield from cursor
+    else:
+        yield from _ticks_in_window(cursor, start, end)
+
+
+async def replay_ticks_async(db, start, end, mode=None):
+    """Motor version of `replay_ticks` for the async broadcaster; `db` is a motor database."""
+    mode = storage_mode(mode)
+    name, query, sort = _replay_query(start, end, mode)
+    cursor = db[name].find(query).sort(sort)
+    if mode == "documents":
+        async for tick in cursor:
+            yield tick
+    else:
+        for tick in _ticks_in_window([bucket async for bucket in cursor], start, end):
+            yield tick
@@ -0,0 +1,172 @@
+# backend/marketdata/tick_writer.py
+import logging
+import queue
+import threading
+import time
+
+from pymongo.errors import BulkWriteError
+
+from . import metrics
+from .mongo_client import get_ticks_collection
+
+logger = logging.getLogger(__name__)
+
+# Sentinel pushed onto the queue to make the flusher drain and exit.
+_STOP = object()
+
+
+def insert_ticks(batch):
+    """Default sink: one unordered insert_many into the ticks collection."""
+    get_ticks_collection().insert_many(batch, ordered=False)
+
+
+class BufferedTickWriter:
+    """
+    Moves tick persistence off the websocket receive thread.
+
+    `submit()` only puts the document on a bounded queue. A background thread drains
+    the queue and hands batches to `write_batch` (an unordered insert_many by default)
+    once `batch_size` ticks are waiting or `flush_interval` seconds have passed.
+
+    If Mongo falls behind and the queue fills up, `submit()` waits up to `put_timeout`
+    seconds for room (backpressure on the producer) and then drops the tick, counting it.
+    """
+
+    def __init__(self, write_batch=None, max_queue=50000, batch_size=1000,
+                 flush_interval=0.5, put_timeout=0.0, name="tick_writer"):
+        self.write_batch = write_batch or insert_ticks
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.name = name
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stats_lock = threading.Lock()
+
+        self.submitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_size = 0
+        self.max_flush_size = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        self._total_flush_size = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        metrics.register(self.name, self.stats)
+
+    def stop(self, timeout=10):
+        """Flush whatever is still queued and stop the background thread."""
+        if not self._thread:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, document):
+        """Queue one tick document for writing. Returns False if it had to be dropped."""
+        try:
+            if self.put_timeout > 0:
+                self._queue.put(document, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(document)
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            return False
+        with self._stats_lock:
+            self.submitted += 1
+        return True
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "written": self.written,
+                "failed": self.failed,
+                "flushes": self.flushes,
+                "last_flush_size": self.last_flush_size,
+                "max_flush_size": self.max_flush_size,
+                "avg_flush_size": round(self._total_flush_size / self.flushes, 1) if self.flushes else 0,
+                "last_flush_ms": round(self.last_flush_ms, 2),
+                "max_flush_ms": round(self.max_flush_ms, 2),
+                "avg_flush_ms": round(self._total_flush_ms / self.flushes, 2) if self.flushes else 0,
+            }
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        stopping = False
+
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            # Drain what is already waiting, without blocking, up to one batch.
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            if stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                if batch:
+                    self._flush(batch)
+                    batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+        # Anything submitted after the stop sentinel still gets written.
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        if batch:
+            self._flush(batch)
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        failed = 0
+        try:
+            self.write_batch(batch)
+        except BulkWriteError as e:
+            # ordered=False: everything except the reported documents was inserted.
+            failed = len(e.details.get("writeErrors", []))
+            logger.error(f"{self.name}: {failed} of {len(batch)} ticks failed to insert: {e}")
+        except Exception as e:
+            failed = len(batch)
+            logger.error(f"{self.name}: failed to write batch of {len(batch)} ticks: {e}")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        with self._stats_lock:
+            self.flushes += 1
+            self.written += len(batch) - failed
+            self.failed += failed
+            self.last_flush_size = len(batch)
+            self._total_flush_size += len(batch)
+            self.max_flush_size = max(self.max_flush_size, len(batch))
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._total_flush_ms += elapsed_ms
@@ -0,0 +1,37 @@
+# backend/marketdata/universe.py
+import json
+from pathlib import Path
+
+from django.conf import settings
+
+# Named universes shipped in backend/data
+UNIVERSE_FILES = {
+    "nifty100": "nifty100_symbols.json",
+    "nifty500": "nifty500_symbols.json",
+}
+
+
+def load_universe(name):
+    """
+    Return the Fyers symbols (NSE:<SYMBOL>-EQ) of a universe.
+    `name` is a named universe ("nifty100", "nifty500"), a path to a JSON file in the
+    same [{"symbol": ...}, ...] format, or a comma-separated list of symbols.
+    """
+    if name in UNIVERSE_FILES:
+        path = Path(settings.BASE_DIR) / 'data' / UNIVERSE_FILES[name]
+    elif name.endswith(".json"):
+        path = Path(name)
+    else:
+        return [to_fyers_symbol(s) for s in name.split(",") if s.strip()]
+
+    return [to_fyers_symbol(entry["symbol"]) for entry in json.loads(path.read_text())]
+
+
+def to_fyers_symbol(symbol):
+    symbol = symbol.strip().upper()
+    return symbol if ":" in symbol else f"NSE:{symbol}-EQ"
+
+
+def split_into_shards(symbols, per_shard):
+    """Split symbols into contiguous shards of at most `per_shard` each."""
+    return [symbols[i:i + per_shard] for i in range(0, len(symbols), per_shard)]
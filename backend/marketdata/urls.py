@@ -1,12 +1,18 @@
 # backend/marketdata/urls.py
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Read endpoints served by the Motor-backed async views when enabled (see marketdata/async_views.py)
+reads = async_views if settings.MARKETDATA_ASYNC_VIEWS else views
 
 urlpatterns = [
     path("fyers/login/", views.fyers_login, name="fyers_login"),
     path("fyers/callback/", views.fyers_callback, name="fyers_callback"),
     path("fyers/token/status/", views.fyers_token_status, name="fyers_token_status"),
     path("fyers/token/refresh/", views.fyers_token_refresh, name="fyers_token_refresh"),
-    path("ohlc/", views.ohlc_data, name="ohlc_data"),
-    path("latest-tick/", views.latest_tick_data, name="latest_tick_data"),
+    path("ohlc/", reads.ohlc_data, name="ohlc_data"),
+    path("latest-tick/", reads.latest_tick_data, name="latest_tick_data"),
+    path("quotes/", reads.quotes, name="quotes"),
+    path("metrics/", views.pipeline_metrics, name="pipeline_metrics"),
 ]
\ No newline at end of file
@@ -1,10 +1,13 @@
 # utils.py
 import hashlib
+import os
+import threading
 import requests
 import logging
 from datetime import datetime, timedelta, timezone
 from django.conf import settings
 from django.utils.timezone import now
+from fyers_apiv3 import fyersModel
 from .models import MarketDataToken
 import pytz
 
@@ -87,3 +90,24 @@ def get_active_fyers_access_token(force_refresh=False):
         return None
 
     return token_row.access_token
+
+
+_thread_state = threading.local()
+
+
+def get_thread_fyers_model(access_token):
+    """
+    Return a FyersModel owned by the calling thread, for REST calls made from worker pools.
+    The SDK client is not documented as thread-safe, so threads never share one.
+    """
+    client = getattr(_thread_state, "fyers", None)
+    if client is None or getattr(_thread_state, "token", None) != access_token:
+        client = fyersModel.FyersModel(
+            client_id=settings.FYERS_CLIENT_ID,
+            is_async=False,
+            token=access_token,
+            log_path=os.path.join(settings.BASE_DIR, 'logs/')
+        )
+        _thread_state.fyers = client
+        _thread_state.token = access_token
+    return client
@@ -5,13 +5,18 @@ from decouple import config
 from django.conf import settings
 from django.shortcuts import redirect
 from django.http import JsonResponse, HttpResponseBadRequest
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
 from django.views.decorators.csrf import csrf_exempt
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import IsAdminUser, IsAuthenticatedOrReadOnly, AllowAny,IsAuthenticated
+from rest_framework.response import Response
 
 from .utils import refresh_fyers_token
+from . import metrics
 
 from .models import MarketDataToken
+from trading.models import Instrument
 from bson import ObjectId, json_util
 import json
 
@@ -19,19 +24,14 @@ logger = logging.getLogger(__name__)
 
 # backend/marketdata/views.py
 # from django.utils import timezone
-from .mongo_client import get_candles_collection, get_ticks_collection
-
-# A dictionary to map resolution strings to MongoDB's date truncation units.
-# This makes the code cleaner and easier to extend.
-RESOLUTION_MAP = {
-    '1m': {'unit': 'minute', 'binSize': 1},
-    '5m': {'unit': 'minute', 'binSize': 5},
-    '15m': {'unit': 'minute', 'binSize': 15},
-    '1h': {'unit': 'hour', 'binSize': 1},
-    '1D': {'unit': 'day', 'binSize': 1},
-    '1W': {'unit': 'week', 'binSize': 1},
-}
-from bson import SON
+from .mongo_client import get_candles_collection
+from . import tick_store
+from . import ohlc
+from .ohlc_cache import series_version, stored_bars
+from .renderers import OHLC_RENDERERS
+from .snapshots import get_snapshot_store
+from .quotes import delayed_quotes, parse_symbols
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -41,12 +41,10 @@ def latest_tick_data(request):
         return JsonResponse({"error": "Instrument symbol is required"}, status=400)
 
     instrument_symbol = f"NSE:{symbol.upper()}-EQ"
-    ticks_collection = get_ticks_collection()
-    
-    latest_tick = ticks_collection.find_one(
-        {"instrument": instrument_symbol},
-        sort=[("timestamp", -1)]
-    )
+    snapshots = get_snapshot_store()
+    latest_tick = snapshots.latest(instrument_symbol) if snapshots.available() else None
+    if latest_tick is None:
+        latest_tick = tick_store.latest_tick(instrument_symbol)
     if latest_tick:
         # Use json_util to handle BSON types like ObjectId and datetime
         return JsonResponse(json.loads(json_util.dumps(latest_tick)))
@@ -54,85 +52,82 @@ def latest_tick_data(request):
         return JsonResponse({"error": "No data found for this instrument"}, status=404)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def quotes(request):
+    """
+    Latest delayed quotes of many instruments in one response, keyed by symbol.
+    Pass `instruments=RELIANCE,TCS,...` or `watchlist=me` for the caller's watchlist.
+    """
+    if request.query_params.get('watchlist') == 'me':
+        symbols = list(
+            Instrument.objects.filter(watchlists__user=request.user)
+            .order_by('symbol')
+            .values_list('symbol', flat=True)[:settings.QUOTES_MAX_INSTRUMENTS]
+        )
+        if not symbols:
+            return JsonResponse({"quotes": {}, "missing": []})
+    else:
+        try:
+            symbols = parse_symbols(request.query_params.get('instruments'), settings.QUOTES_MAX_INSTRUMENTS)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+    found = delayed_quotes(symbols)
+    return JsonResponse({
+        "quotes": json.loads(json_util.dumps(found)),
+        "missing": [symbol for symbol in symbols if symbol not in found],
+    })
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@renderer_classes(OHLC_RENDERERS)
 def ohlc_data(request):
-    symbol = request.query_params.get('instrument')
-    resolution = request.query_params.get('resolution', '1D')
-
-    if not symbol:
-        return JsonResponse({"error": "Instrument symbol is required"}, status=400)
-    # This should reference your actual RESOLUTION_MAP dictionary
-    # if resolution not in RESOLUTION_MAP:
-    #     return JsonResponse({"error": "Invalid resolution"}, status=400)
+    """
+    OHLC bars of an instrument, delayed by 15 minutes. Optional `from`, `to`, `before`
+    and `limit` narrow the window (see marketdata/ohlc.py); when more older bars exist
+    the X-Next-Before header carries the `before` value of the next page. Pollers pass
+    `since` to get only the newest bars and revalidate with ETag/Last-Modified.
+    The encoding is negotiated from Accept or ?format= (see marketdata/renderers.py).
+    """
+    try:
+        query = ohlc.parse_ohlc_params(request.query_params)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    version = series_version(query, variant=request.accepted_renderer.format)
+    if version:
+        etag, last_modified = version
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            not_modified["ETag"] = etag
+            patch_vary_headers(not_modified, ["Accept"])
+            return not_modified
 
-    instrument_symbol = f"NSE:{symbol.upper()}-EQ"
     candles_collection = get_candles_collection()
-    fifteen_minutes_ago = datetime.now(timezone.utc) - timedelta(minutes=15)
-
-    if resolution == '1m':
-        # This block handles the 1-minute resolution specifically
-        def fetch_candles():
-            return list(candles_collection.find(
-                {
-                    "instrument": instrument_symbol,
-                    "resolution": "1m",
-                    "timestamp": {"$lte": fifteen_minutes_ago}
-                },
-                {"_id": 0, "instrument": 0, "resolution": 0}
-            ).sort("timestamp", 1))
-
-        candles = fetch_candles()
-        for candle in candles:
-            # FIX: Make the naive datetime object from the DB timezone-aware (as UTC)
-            # before converting it to a correct UTC timestamp.
-            utc_datetime = candle.pop("timestamp").replace(tzinfo=timezone.utc)
-            candle["time"] = int(utc_datetime.timestamp() * 1000)
-
-    else:
-        # This block handles all other resolutions via aggregation
-        agg_params = RESOLUTION_MAP[resolution]
-        unit_seconds = {
-            "minute": 60,
-            "hour": 3600,
-            "day": 86400,
-            "week": 604800,
-        }[agg_params["unit"]] * agg_params["binSize"]
-
-        pipeline = [
-            {"$match": {
-                "instrument": instrument_symbol,
-                "resolution": "1m",
-                "timestamp": {"$lte": fifteen_minutes_ago}
-            }},
-            {"$sort": {"timestamp": 1}},
-            {"$project": {
-                "timestamp": 1,
-                "open": 1, "high": 1, "low": 1, "close": 1, "volume": 1,
-                "epoch": {"$toLong": {"$divide": [{"$subtract": ["$timestamp", datetime(1970, 1, 1, tzinfo=timezone.utc)]}, 1000]}}
-            }},
-            {"$group": {
-                "_id": {"$multiply": [{"$floor": {"$divide": ["$epoch", unit_seconds]}}, unit_seconds]},
-                "open": {"$first": "$open"},
-                "high": {"$max": "$high"},
-                "low": {"$min": "$low"},
-                "close": {"$last": "$close"},
-                "volume": {"$sum": "$volume"}
-            }},
-            {"$project": {
-                "_id": 0,
-                "time": {"$multiply": ["$_id", 1000]},
-                "open": 1, "high": 1, "low": 1, "close": 1, "volume": 1
-            }},
-            {"$sort": SON([("time", 1)])}
-        ]
-
-        def aggregate_candles():
-            return list(candles_collection.aggregate(pipeline))
-
-        candles = aggregate_candles()
-
-    return JsonResponse(candles, safe=False)
+    forming_start = ohlc.forming_bar_start(query)
+
+    # Closed bars never change once visible, so they come from the cache; only the
+    # forming bar is folded from 1m candles on every request.
+    stored = stored_bars(query, candles_collection)
+    forming = ohlc.empty_columns()
+    if forming_start:
+        forming = ohlc.shape_forming_bar(
+            candles_collection.aggregate(ohlc.forming_bar_pipeline(query, forming_start)), forming_start
+        )
+
+    columns, next_before = ohlc.page(query, stored, forming)
+    response = Response(columns)
+    patch_vary_headers(response, ["Accept"])
+    if next_before is not None:
+        response["X-Next-Before"] = str(next_before)
+    if version:
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        # Revalidate every poll instead of trusting a heuristic freshness lifetime
+        patch_cache_control(response, no_cache=True)
+    return response
 
 
 
@@ -270,4 +265,18 @@ def fyers_token_refresh(request):
     if not refreshed:
         return JsonResponse({"error": "refresh_failed"}, status=500)
 
-    return JsonResponse({"status": "ok", "expires_at": token_row.expires_at})
\ No newline at end of file
+    return JsonResponse({"status": "ok", "expires_at": token_row.expires_at})
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def pipeline_metrics(request):
+    """
+    Admin endpoint: runtime counters of the market-data components running in this process,
+    plus, with REDIS_URL set, the last published counters of every process under "processes"
+    """
+    data = metrics.snapshot()
+    processes = metrics.process_snapshots()
+    if processes is not None:
+        data["processes"] = processes
+    return JsonResponse(data)
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.conf import settings
 from django.core.management import call_command
 import threading
 import logging
@@ -13,6 +14,7 @@ class TradingConfig(AppConfig):
         """
         Run commands only once when the server starts.
         Using a thread so it doesn't block Daphne startup.
+        Skipped unless "order_executor" is in settings.BACKGROUND_SERVICES.
         """
         import trading.receivers
         def run_startup_commands():
@@ -23,6 +25,6 @@ class TradingConfig(AppConfig):
                 logger.error(f"❌ Error running startup commands: {e}")
 
         # Prevent duplicate runs (e.g., autoreload in dev mode)
-        if not hasattr(self, "already_ran"):
+        if not hasattr(self, "already_ran") and "order_executor" in settings.BACKGROUND_SERVICES:
             self.already_ran = True
             threading.Thread(target=run_startup_commands).start()
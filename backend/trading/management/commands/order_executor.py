@@ -11,7 +11,9 @@ from django.conf import settings
 from django.db.models import Q
 import logging
 
-from marketdata.mongo_client import get_ticks_collection, get_db
+from marketdata.mongo_client import get_db
+from marketdata.snapshots import get_snapshot_store
+from marketdata.tick_store import latest_prices
 from trading.models import Account, Order, Position, TradeHistory
 from trading.signals import order_status_changed, position_changed
 
@@ -25,7 +27,6 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS("🚀 Starting order execution engine..."))
         
         try:
-            ticks_collection = get_ticks_collection()
             get_db().command('ping')
             self.stdout.write(self.style.SUCCESS("✅ MongoDB connection successful."))
         except Exception as e:
@@ -34,7 +35,7 @@ class Command(BaseCommand):
 
         while True:
             try:
-                market_prices = self.get_latest_market_prices(ticks_collection)
+                market_prices = self.get_latest_market_prices()
 
                 if not market_prices:
                     self.stdout.write("No recent ticks found. Waiting...")
@@ -57,20 +58,18 @@ class Command(BaseCommand):
             
             time.sleep(1)
 
-    def get_latest_market_prices(self, ticks_collection):
-        fifteen_minutes_ago = timezone.now() - timedelta(minutes=15)
-        pipeline = [
-            {'$match': {'timestamp': {'$lte': fifteen_minutes_ago}}},
-            {'$sort': {'timestamp': -1}},
-            {'$group': {
-                '_id': '$instrument',
-                'price': {'$first': '$price'},
-            }}
-        ]
-        latest_ticks = list(ticks_collection.aggregate(pipeline))
+    def get_latest_market_prices(self):
+        snapshots = get_snapshot_store()
+        latest = {}
+        if snapshots.available():
+            latest = {instrument: tick['price'] for instrument, tick in snapshots.all_latest(delayed=True).items()}
+        if not latest:
+            # No ingest feeding the snapshots (or nothing old enough yet): read the ticks
+            fifteen_minutes_ago = timezone.now() - timedelta(minutes=15)
+            latest = latest_prices(fifteen_minutes_ago)
         return {
-            doc['_id'].split(':')[1].split('-')[0]: Decimal(str(doc['price']))
-            for doc in latest_ticks
+            instrument.split(':')[1].split('-')[0]: Decimal(str(price))
+            for instrument, price in latest.items()
         }
 
     def check_position_triggers(self, market_prices):
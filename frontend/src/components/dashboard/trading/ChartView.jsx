@@ -276,17 +276,22 @@ const ChartView = ({
         ? { ...lastCandleRef.current }
         : { time: 0 };
 
+      // Conflated messages carry the range of the ticks merged into them
+      const tickOpen = tick.conflated_open ?? tick.price;
+      const tickHigh = tick.conflated_high ?? tick.price;
+      const tickLow = tick.conflated_low ?? tick.price;
+
       if (alignedTime === candle.time) {
-        candle.high = Math.max(candle.high, tick.price);
-        candle.low = Math.min(candle.low, tick.price);
+        candle.high = Math.max(candle.high, tickHigh);
+        candle.low = Math.min(candle.low, tickLow);
         candle.close = tick.price;
         candle.volume = (candle.volume || 0) + (tick.last_traded_qty || 0);
       } else if (alignedTime > candle.time) {
         candle = {
           time: alignedTime,
-          open: tick.price,
-          high: tick.price,
-          low: tick.price,
+          open: tickOpen,
+          high: tickHigh,
+          low: tickLow,
           close: tick.price,
           volume: tick.last_traded_qty || 0,
         };
@@ -18,7 +18,7 @@ export default function Watchlist({ onSymbolSelect, activeSymbol }) {
   const [loading, setLoading] = useState(true);
   const { toast } = useToast();
 
-  const { subscribe, tickData, isConnected, getLatestPrice } = useWebSocket();
+  const { subscribeMany, tickData, isConnected, loadQuotes } = useWebSocket();
 
   const fetchWatchlist = useCallback(async () => {
     setLoading(true);
@@ -41,18 +41,12 @@ export default function Watchlist({ onSymbolSelect, activeSymbol }) {
     fetchWatchlist();
   }, [fetchWatchlist]);
 
-  // Effect to manage WebSocket subscriptions for watchlist items
+  // Effect to manage WebSocket subscriptions for watchlist items: one
+  // subscribe_many message, answered with a snapshot of their prices
   useEffect(() => {
     if (!isConnected || watchlist.length === 0) return;
-
-    const unsubscribers = watchlist.map((item) => {
-      return subscribe(item.symbol, () => {});
-    });
-
-    return () => {
-      unsubscribers.forEach((unsub) => unsub());
-    };
-  }, [watchlist, isConnected, subscribe]);
+    return subscribeMany(watchlist.map((item) => item.symbol));
+  }, [watchlist, isConnected, subscribeMany]);
 
   const handleAddToWatchlist = async (instrument) => {
     try {
@@ -96,14 +90,11 @@ export default function Watchlist({ onSymbolSelect, activeSymbol }) {
     () => watchlist.map((item) => item.symbol),
     [watchlist]
   );
+  // Last known prices for the whole watchlist in one request
   useEffect(() => {
     if (watchlist.length === 0) return;
-    watchlist.forEach((watchlist) => {
-      if (watchlist.symbol && !tickData.has(watchlist.symbol)) {
-        getLatestPrice(watchlist.symbol);
-      }
-    });
-  }, [watchlist, tickData, getLatestPrice]);
+    loadQuotes({ watchlist: "me" });
+  }, [watchlist, loadQuotes]);
   return (
     <div className="p-4 bg-gray-950/70 border border-gray-800/50 rounded-lg h-full flex flex-col">
       <h2 className="text-lg font-semibold text-white flex items-center gap-2 p-3">
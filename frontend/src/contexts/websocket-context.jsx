@@ -13,6 +13,28 @@ import api from "@/services/api";
 
 const WebSocketContext = createContext();
 
+const toInstrument = (symbol) => `NSE:${symbol}-EQ`;
+
+// Short keys of the compact tick stream (backend/marketdata/tick_messages.py)
+const COMPACT_FIELDS = {
+  s: "instrument",
+  t: "timestamp",
+  p: "price",
+  v: "volume_traded_today",
+  q: "last_traded_qty",
+  a: "avg_trade_price",
+  o: "open",
+  h: "high",
+  l: "low",
+  c: "close",
+  ch: "change",
+  cp: "change_percent",
+  xo: "conflated_open",
+  xh: "conflated_high",
+  xl: "conflated_low",
+  xn: "conflated",
+};
+
 export const useWebSocket = () => {
   const context = useContext(WebSocketContext);
   if (!context)
@@ -35,6 +57,8 @@ export const WebSocketProvider = ({ children }) => {
   const reconnectInterval = useRef(null);
 
   const subscriptionCallbacks = useRef(new Map());
+  // Full tick per instrument, rebuilt from compact keyframes and deltas
+  const compactTicks = useRef(new Map());
   const fetchingPrices = useRef(new Set());
 
   const getWebSocketUrl = () => {
@@ -61,25 +85,75 @@ export const WebSocketProvider = ({ children }) => {
     return false;
   }, []);
 
-  const handleTickData = useCallback((data) => {
-    if (!data.instrument) return;
-    const symbol = data.instrument.split(":")[1].split("-")[0];
+  // Full tick from a compact frame: a keyframe ("k": 1) replaces the
+  // instrument's state, a delta updates the fields it carries (null removes one).
+  // Deltas arriving before the instrument's first keyframe are ignored.
+  const expandCompact = useCallback((frame) => {
+    const previous = frame.k ? {} : compactTicks.current.get(frame.s);
+    if (!previous) return null;
+    const tick = { ...previous, type: "tick" };
+    Object.entries(frame).forEach(([key, value]) => {
+      if (key === "k") return;
+      const name = COMPACT_FIELDS[key] ?? key;
+      if (value === null) delete tick[name];
+      else tick[name] = name === "timestamp" ? new Date(value).toISOString() : value;
+    });
+    compactTicks.current.set(frame.s, tick);
+    return tick;
+  }, []);
 
-    setTickData((prev) =>
-      new Map(prev).set(symbol, { ...data, timestamp: Date.now() })
+  // Handles one tick, or the array of ticks of a batched frame with a single
+  // state update
+  const handleTickData = useCallback((data) => {
+    const ticks = (Array.isArray(data) ? data : [data]).filter(
+      (tick) => tick.instrument
     );
-
-    if (subscriptionCallbacks.current.has(symbol)) {
-      subscriptionCallbacks.current.get(symbol).forEach((cb) => {
-        try {
-          cb(data);
-        } catch (e) {
-          console.error(`Error in subscription callback for ${symbol}:`, e);
-        }
+    if (ticks.length === 0) return;
+    const receivedAt = Date.now();
+
+    setTickData((prev) => {
+      const next = new Map(prev);
+      ticks.forEach((tick) => {
+        const symbol = tick.instrument.split(":")[1].split("-")[0];
+        next.set(symbol, { ...tick, timestamp: receivedAt });
       });
-    }
+      return next;
+    });
+
+    ticks.forEach((tick) => {
+      const symbol = tick.instrument.split(":")[1].split("-")[0];
+      if (subscriptionCallbacks.current.has(symbol)) {
+        subscriptionCallbacks.current.get(symbol).forEach((cb) => {
+          try {
+            cb(tick);
+          } catch (e) {
+            console.error(`Error in subscription callback for ${symbol}:`, e);
+          }
+        });
+      }
+    });
   }, []);
 
+  // Latest delayed ticks sent on subscribe: seed tickData (and the compact
+  // state) without invoking tick callbacks, as they are not new trades
+  const handleSnapshot = useCallback(
+    (frames = []) => {
+      const ticks = frames
+        .map((frame) => (frame.s ? expandCompact(frame) : frame))
+        .filter((tick) => tick?.instrument);
+      if (ticks.length === 0) return;
+      setTickData((prev) => {
+        const next = new Map(prev);
+        ticks.forEach((tick) => {
+          const symbol = tick.instrument.split(":")[1].split("-")[0];
+          if (!next.has(symbol)) next.set(symbol, { ...tick });
+        });
+        return next;
+      });
+    },
+    [expandCompact]
+  );
+
   const handleOrderUpdate = useCallback((data) => {
     setOrderUpdates((prev) => [data, ...prev.slice(0, 99)]); // Keep last 100 updates
     const instrumentSymbol = data.instrument?.symbol || "N/A";
@@ -110,9 +184,14 @@ export const WebSocketProvider = ({ children }) => {
           reconnectInterval.current = null;
         }
 
-        subscriptions.current.forEach((symbol) => {
-          sendMessage({ type: "subscribe", instrument: `NSE:${symbol}-EQ` });
-        });
+        if (subscriptions.current.size > 0) {
+          sendMessage({
+            type: "subscribe_many",
+            instruments: Array.from(subscriptions.current, toInstrument),
+            batch: true,
+            compact: true,
+          });
+        }
 
         toast.success("Live market data connected", { duration: 2000 });
       };
@@ -122,7 +201,17 @@ export const WebSocketProvider = ({ children }) => {
           const data = JSON.parse(event.data);
           setLastMessage(data);
           // console.log("WS message:", data);
-          if (data.type === "tick") handleTickData(data);
+          // Batched ticks arrive as one array frame (subscribe with batch: true),
+          // compact ones as keyframes/deltas keyed by "s" (compact: true)
+          if (data.type === "snapshot") handleSnapshot(data.ticks);
+          else if (Array.isArray(data) || data.type === "tick" || data.s) {
+            const frames = Array.isArray(data) ? data : [data];
+            handleTickData(
+              frames
+                .map((frame) => (frame.s ? expandCompact(frame) : frame))
+                .filter(Boolean)
+            );
+          }
           else if (data.type === "order_update") handleOrderUpdate(data);
           else if (data.type === "position_update") handlePositionUpdate(data);
         } catch (e) {
@@ -152,7 +241,14 @@ export const WebSocketProvider = ({ children }) => {
       console.error("WS setup error:", e);
       setConnectionStatus("error");
     }
-  }, [handleTickData, handleOrderUpdate, handlePositionUpdate, sendMessage]);
+  }, [
+    handleTickData,
+    handleOrderUpdate,
+    handlePositionUpdate,
+    sendMessage,
+    expandCompact,
+    handleSnapshot,
+  ]);
 
   const disconnect = useCallback(() => {
     if (reconnectInterval.current) clearTimeout(reconnectInterval.current);
@@ -173,7 +269,12 @@ export const WebSocketProvider = ({ children }) => {
 
       if (!subscriptions.current.has(symbol)) {
         subscriptions.current.add(symbol);
-        sendMessage({ type: "subscribe", instrument: `NSE:${symbol}-EQ` });
+        sendMessage({
+          type: "subscribe",
+          instrument: `NSE:${symbol}-EQ`,
+          batch: true,
+          compact: true,
+        });
       }
 
       return () => {
@@ -195,6 +296,55 @@ export const WebSocketProvider = ({ children }) => {
     [sendMessage]
   );
 
+  // Subscribes to many symbols with one subscribe_many message; the server
+  // answers with one snapshot of their latest prices. Returns the unsubscribe.
+  const subscribeMany = useCallback(
+    (symbols) => {
+      const held = symbols.filter(Boolean);
+      const noop = () => {};
+      const fresh = [];
+      held.forEach((symbol) => {
+        if (!subscriptionCallbacks.current.has(symbol)) {
+          subscriptionCallbacks.current.set(symbol, new Set());
+        }
+        subscriptionCallbacks.current.get(symbol).add(noop);
+        if (!subscriptions.current.has(symbol)) {
+          subscriptions.current.add(symbol);
+          fresh.push(symbol);
+        }
+      });
+      if (fresh.length > 0) {
+        sendMessage({
+          type: "subscribe_many",
+          instruments: fresh.map(toInstrument),
+          batch: true,
+          compact: true,
+        });
+      }
+
+      return () => {
+        const released = [];
+        held.forEach((symbol) => {
+          const cbs = subscriptionCallbacks.current.get(symbol);
+          if (!cbs) return;
+          cbs.delete(noop);
+          if (cbs.size === 0) {
+            subscriptionCallbacks.current.delete(symbol);
+            subscriptions.current.delete(symbol);
+            released.push(symbol);
+          }
+        });
+        if (released.length > 0) {
+          sendMessage({
+            type: "unsubscribe_many",
+            instruments: released.map(toInstrument),
+          });
+        }
+      };
+    },
+    [sendMessage]
+  );
+
   const getLatestPrice = useCallback(
     async (symbol) => {
       if (!symbol) return null;
@@ -234,6 +384,29 @@ export const WebSocketProvider = ({ children }) => {
     [tickData]
   );
 
+  // One request for many symbols, e.g. loadQuotes({ watchlist: "me" }) or
+  // loadQuotes({ instruments: "RELIANCE,TCS" }); seeds tickData for symbols
+  // that have not received a live tick yet.
+  const loadQuotes = useCallback(async (params) => {
+    try {
+      const response = await api.get("/market/quotes/", { params });
+      const quotes = response.data.quotes || {};
+      setTickData((prev) => {
+        const next = new Map(prev);
+        Object.entries(quotes).forEach(([symbol, quote]) => {
+          if (!next.has(symbol)) {
+            next.set(symbol, { ...quote });
+          }
+        });
+        return next;
+      });
+      return quotes;
+    } catch (err) {
+      console.error("Failed to fetch quotes:", err);
+      return {};
+    }
+  }, []);
+
   const getTickData = useCallback(
     (symbol) => tickData.get(symbol) ?? null,
     [tickData]
@@ -258,7 +431,9 @@ export const WebSocketProvider = ({ children }) => {
         disconnect,
         sendMessage,
         subscribe,
+        subscribeMany,
         getLatestPrice,
+        loadQuotes,
         getTickData,
       }}
     >